@@ -0,0 +1,216 @@
+import time
+import sqlite3
+import threading
+
+from settings import *
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    id INTEGER PRIMARY KEY,
+    started_at REAL NOT NULL,
+    model TEXT
+);
+CREATE TABLE IF NOT EXISTS turns (
+    id INTEGER PRIMARY KEY,
+    session_id INTEGER NOT NULL REFERENCES sessions(id),
+    role TEXT NOT NULL,              -- 'User' or 'Luna'
+    content TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    tokens INTEGER
+);
+CREATE INDEX IF NOT EXISTS turns_by_session ON turns(session_id, id);
+CREATE INDEX IF NOT EXISTS turns_by_time ON turns(created_at);
+CREATE TABLE IF NOT EXISTS summaries (
+    id INTEGER PRIMARY KEY,
+    up_to_turn INTEGER NOT NULL,     -- every turn with id <= this is folded in
+    summary TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    tokens INTEGER
+);
+"""
+
+FTS_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS turns_fts USING fts5(content, content='turns', content_rowid='id');
+CREATE TRIGGER IF NOT EXISTS turns_fts_insert AFTER INSERT ON turns BEGIN
+    INSERT INTO turns_fts(rowid, content) VALUES (new.id, new.content);
+END;
+CREATE TRIGGER IF NOT EXISTS turns_fts_delete AFTER DELETE ON turns BEGIN
+    INSERT INTO turns_fts(turns_fts, rowid, content) VALUES ('delete', old.id, old.content);
+END;
+"""
+
+
+class ConversationStore:
+    """
+    Every message of every session, in SQLite (WAL mode, so the background
+    summarizer can read while the chat writes).
+
+    The recent window for the prompt comes from an index on (session, id),
+    old turns can be found again with FTS5 full-text search, and rolling
+    summaries of everything older than the window live in `summaries`.
+    """
+
+    def __init__(self, path=CONVERSATION_DB):
+        self.path = path
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.executescript(SCHEMA)
+        try:
+            self.db.executescript(FTS_SCHEMA)
+            self.has_fts = True
+        except sqlite3.OperationalError:  # SQLite built without FTS5
+            self.has_fts = False
+        self.db.commit()
+        self.session_id = None
+
+    def start_session(self, model=None):
+        with self.lock, self.db:
+            self.session_id = self.db.execute(
+                "INSERT INTO sessions (started_at, model) VALUES (?, ?)", (time.time(), model)
+            ).lastrowid
+        return self.session_id
+
+    def add_turn(self, role, content, tokens=None):
+        if self.session_id is None:
+            self.start_session()
+        with self.lock, self.db:
+            return self.db.execute(
+                "INSERT INTO turns (session_id, role, content, created_at, tokens) VALUES (?, ?, ?, ?, ?)",
+                (self.session_id, role, content, time.time(), tokens)
+            ).lastrowid
+
+    def last_turns(self, count, session_id=None):
+        """The latest count messages as "Role: content" lines, oldest first (all sessions unless one is given)"""
+        with self.lock:
+            if session_id is None:
+                rows = self.db.execute(
+                    "SELECT role, content FROM turns ORDER BY id DESC LIMIT ?", (count,)
+                ).fetchall()
+            else:
+                rows = self.db.execute(
+                    "SELECT role, content FROM turns WHERE session_id = ? ORDER BY id DESC LIMIT ?", (session_id, count)
+                ).fetchall()
+        return [f"{role}: {content}" for role, content in reversed(rows)]
+
+    def search(self, query, limit=5):
+        """Past messages matching query, best match first: [(created_at, role, content)]"""
+        with self.lock:
+            if self.has_fts:
+                # Quote every word so user text can't be read as FTS syntax
+                match = " OR ".join('"' + word.replace('"', '""') + '"' for word in query.split())
+                if not match:
+                    return []
+                return self.db.execute(
+                    "SELECT t.created_at, t.role, t.content FROM turns_fts f JOIN turns t ON t.id = f.rowid "
+                    "WHERE turns_fts MATCH ? ORDER BY rank LIMIT ?", (match, limit)
+                ).fetchall()
+            return self.db.execute(
+                "SELECT created_at, role, content FROM turns WHERE content LIKE ? ORDER BY id DESC LIMIT ?",
+                (f"%{query}%", limit)
+            ).fetchall()
+
+    def latest_summary(self):
+        """(summary text, id of the last turn it covers), or ("", 0)"""
+        with self.lock:
+            row = self.db.execute("SELECT summary, up_to_turn FROM summaries ORDER BY id DESC LIMIT 1").fetchone()
+        return row if row else ("", 0)
+
+    def unsummarized_turns(self, keep_recent):
+        """Turns not yet in a summary, leaving out the newest keep_recent (those are still in the prompt)"""
+        _, up_to = self.latest_summary()
+        with self.lock:
+            rows = self.db.execute(
+                "SELECT id, role, content FROM turns WHERE id > ? ORDER BY id", (up_to,)
+            ).fetchall()
+        return rows[:-keep_recent] if keep_recent else rows
+
+    def add_summary(self, summary, up_to_turn, tokens=None):
+        with self.lock, self.db:
+            self.db.execute(
+                "INSERT INTO summaries (up_to_turn, summary, created_at, tokens) VALUES (?, ?, ?, ?)",
+                (up_to_turn, summary, time.time(), tokens)
+            )
+
+    def wipe(self):
+        """Forget every session, message and summary (the FTS index follows through its trigger)"""
+        with self.lock:
+            with self.db:
+                self.db.execute("DELETE FROM turns")
+                self.db.execute("DELETE FROM summaries")
+                self.db.execute("DELETE FROM sessions")
+            # Don't leave the old text lying around in free pages
+            self.db.execute("VACUUM")
+        self.session_id = None
+
+    def close(self):
+        with self.lock:
+            self.db.close()
+
+
+SUMMARY_PROMPT = """You keep Luna's long-term memory of her conversations with the user.
+Update the summary below with the new messages. Keep facts about the user, running jokes,
+promises and topics that might come up again. Drop small talk. Write at most {max_words} words,
+plain sentences, no lists.
+
+<summary>
+{summary}
+</summary>
+
+<new_messages>
+{messages}
+</new_messages>
+
+Updated summary:"""
+
+
+class Summarizer:
+    """
+    Folds turns that scrolled out of the prompt window into the rolling
+    summary, on a background thread, once there are batch_turns of them.
+    A backlog (a long session, an Ollama outage) is folded in batch_turns
+    at a time, so no summary prompt grows with it. The summary is capped at max_tokens, so long-term recall always costs
+    the same number of prompt tokens however long the history gets.
+    """
+
+    def __init__(self, store, generate, keep_recent=HISTORY_MESSAGES, batch_turns=SUMMARY_BATCH_TURNS,
+                 max_tokens=SUMMARY_MAX_TOKENS):
+        self.store = store
+        self.generate = generate      # generate(prompt, max_tokens) -> text
+        self.keep_recent = keep_recent
+        self.batch_turns = batch_turns
+        self.max_tokens = max_tokens
+        self.thread = None
+
+    def maybe_summarize(self):
+        """Start a background summary if enough old turns piled up (and none is running)"""
+        if self.thread and self.thread.is_alive():
+            return False
+        if len(self.store.unsummarized_turns(self.keep_recent)) < self.batch_turns:
+            return False
+        self.thread = threading.Thread(target=self.summarize, daemon=True)
+        self.thread.start()
+        return True
+
+    def summarize(self):
+        """Fold in the oldest batch of unsummarized turns, then the next while full batches are left"""
+        new_summary = None
+        turns = self.store.unsummarized_turns(self.keep_recent)
+        while turns:
+            batch = turns[:self.batch_turns]
+            summary, _ = self.store.latest_summary()
+            messages = "\n".join(f"{role}: {content}" for _, role, content in batch)
+            prompt = SUMMARY_PROMPT.format(max_words=self.max_tokens * 3 // 4, summary=summary or "(nothing yet)", messages=messages)
+            try:
+                new_summary = self.generate(prompt, self.max_tokens).strip()
+            except Exception as e:
+                print(f"{COLOR_YELLOW}Couldn't update long-term memory: {str(e)}{COLOR_RESET}")
+                return None
+            if not new_summary:
+                return None
+            self.store.add_summary(new_summary, batch[-1][0])
+            turns = self.store.unsummarized_turns(self.keep_recent)
+            if len(turns) < self.batch_turns:
+                break
+        return new_summary
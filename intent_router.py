@@ -0,0 +1,130 @@
+import re
+
+# Whole-message commands, first match wins. Matched without lowering the
+# input so arguments (voice names, search words) keep their case.
+COMMANDS = {
+    "exit": r"exit|quit",
+    "tts_off": r"tts off",
+    "tts_on": r"tts on",
+    "tts_voice": r"tts voice (?P<voice>.*)",
+    "recall": r"recall (?P<query>.+)",
+    "stats": r"stats",
+}
+
+# Canned content Luna makes without the model; the first one asked for wins.
+# Only requests count: "tell me a pun", "any jokes?", "limerick about cats",
+# not "I like puns" or "puns are the worst".
+GENERATORS = {
+    "limerick": r"limericks?",
+    "pun": r"puns?|jokes?",
+}
+REQUEST = r"(?:\b(?:tell|give|make|write|generate|say|share|send|know|got|have|want|hear)" \
+          r"(?:\s+(?:me|us|a|an|another|one|some|any|more|good|funny|new|your|best|quick|little))*\s+" \
+          r"|^\s*(?:(?:a|an|any|another|some|more|one more)\s+)?)"
+TOPIC = r"(?:\s+(?:about|on|for)\s+(?P<topic>[^.!?]+))?"
+# ... and the request ends there (a topic runs up to the punctuation)
+END = r"(?=\s*(?:please\b)?\s*(?:[.!?,]|$))"
+
+# Things the user says about themselves, in priority order: a name beats
+# likes beats a description wherever they are in the message
+FACTS = {
+    "name": r"my name is (?P<person>[\w\s]+)",
+    "likes": r"i (?P<verb>like|love) (?P<thing>[\w\s]+)",
+    "description": r"i(?:'m| am) (?P<self>[^.]+)",
+}
+
+# Words every generator/fact needs. Most messages have none of them, and a
+# plain alternation of literals is scanned much faster than the full
+# patterns, so those messages are done after one quick search.
+TRIGGERS = ("limerick", "pun", "joke", "my name is", "i like", "i love", "i'm", "i am")
+
+
+class IntentTable:
+    """
+    One regex for a whole table of intents, each alternative in a group named
+    after its intent. match() says which intent matched and with what arguments.
+    """
+
+    def __init__(self, patterns, prefix="", suffix=""):
+        self.regex = re.compile(
+            prefix + "(?:" + "|".join(f"(?P<{name}>{pattern})" for name, pattern in patterns.items()) + ")" + suffix,
+            re.IGNORECASE | re.DOTALL
+        )
+        self.names = list(patterns)
+        # Groups inside each intent's alternative, and which intent every group belongs to
+        self.arguments = {name: list(re.compile(pattern).groupindex) for name, pattern in patterns.items()}
+        self.shared = [name for name in re.compile(suffix).groupindex] if suffix else []
+        self.owner = {}
+        for name in self.names:
+            self.owner[self.regex.groupindex[name]] = name
+            for argument in self.arguments[name]:
+                self.owner[self.regex.groupindex[argument]] = name
+
+    def match(self, match):
+        """(intent, {argument: value}) for a match of self.regex"""
+        name = self.owner.get(match.lastindex) or next(name for name in self.names if match.group(name) is not None)
+        args = {}
+        for argument in self.arguments[name] + self.shared:
+            if (value := match.group(argument)) is not None:
+                args[argument] = value.strip()
+        return name, args
+
+
+class Route:
+    """What a message asks for: a command, or canned content and/or a fact about the user"""
+
+    __slots__ = ("command", "generator", "fact", "args")
+
+    def __init__(self):
+        self.command = self.generator = self.fact = None
+        self.args = {}
+
+    def __repr__(self):
+        return f"Route(command={self.command!r}, generator={self.generator!r}, fact={self.fact!r}, args={self.args!r})"
+
+
+class IntentRouter:
+    """
+    Classifies a message with precompiled regexes instead of a chain of
+    lower()/in/re.search/replace calls: a command has to be the whole
+    message, otherwise one search finds the first pun/joke/limerick request
+    (with its topic) and the facts about the user are tried in priority
+    order, the first one found wins. Both only run when a trigger word
+    shows up in the message.
+    Which handler runs for which intent is up to the caller.
+    """
+
+    def __init__(self, commands=COMMANDS, generators=GENERATORS, facts=FACTS, triggers=TRIGGERS):
+        self.triggers = re.compile("|".join(re.escape(word) for word in triggers))
+        self.commands = IntentTable(commands)
+        self.generators = IntentTable(generators, REQUEST, r"\b" + TOPIC + END)
+        # Searched one by one: in a single alternation the leftmost fact would win, not the most important
+        self.facts = [(name, re.compile(r"\b" + pattern, re.IGNORECASE | re.DOTALL)) for name, pattern in facts.items()]
+
+    def route(self, text):
+        route = Route()
+        text = text.strip()
+
+        if match := self.commands.regex.fullmatch(text):
+            route.command, route.args = self.commands.match(match)
+            return route
+        if not self.triggers.search(text.lower()):
+            return route
+
+        if match := self.generators.regex.search(text):
+            route.generator, args = self.generators.match(match)
+            route.args["topic"] = args.get("topic", "").lower() or "something"
+
+        for name, regex in self.facts:
+            if match := regex.search(text):
+                route.fact = name
+                route.args.update({key: value.strip() for key, value in match.groupdict().items() if value is not None})
+                break
+        return route
+
+
+ROUTER = IntentRouter()
+
+
+def route(text):
+    return ROUTER.route(text)
@@ -0,0 +1,224 @@
+import os
+import re
+import json
+import math
+import hashlib
+import threading
+from collections import Counter
+
+from settings import *
+from token_counter import count_tokens
+
+INDEX_VERSION = 1
+
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "but", "by", "do", "for", "from", "has", "have", "he",
+    "her", "his", "how", "i", "if", "in", "is", "it", "its", "me", "my", "no", "not", "of", "on", "or",
+    "she", "so", "that", "the", "their", "them", "there", "they", "this", "to", "was", "we", "were",
+    "what", "when", "where", "which", "who", "why", "will", "with", "you", "your",
+}
+
+# BM25 tuning, the usual defaults
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+
+def tokenize(text):
+    return [word for word in re.findall(r"[a-z0-9]+", text.lower()) if word not in STOPWORDS]
+
+
+def estimate_tokens(text):
+    """LLM token count of text (see token_counter)"""
+    return count_tokens(text)
+
+
+def split_chunks(text, chunk_words=KNOWLEDGE_CHUNK_WORDS):
+    """
+    Cut text into (start, end) spans of about chunk_words words.
+    Paragraphs are kept together where they fit, longer ones are cut
+    between words.
+    """
+    spans = []
+    start = end = None
+    words = 0
+
+    for paragraph in re.finditer(r"\S(?:.*?\S)?(?=\s*\n\s*\n|\s*$)", text, flags=re.DOTALL):
+        word_spans = [m.span() for m in re.finditer(r"\S+", paragraph.group())]
+        offset = paragraph.start()
+
+        if start is not None and words + len(word_spans) > chunk_words:
+            spans.append((start, end))
+            start = None
+            words = 0
+
+        # Walk an index through long paragraphs, re-slicing the list every chunk is quadratic
+        cut = 0
+        while len(word_spans) - cut > chunk_words:
+            spans.append((offset + word_spans[cut][0], offset + word_spans[cut + chunk_words - 1][1]))
+            cut += chunk_words
+
+        if cut < len(word_spans):
+            if start is None:
+                start = offset + word_spans[cut][0]
+            end = offset + word_spans[-1][1]
+            words += len(word_spans) - cut
+
+    if start is not None:
+        spans.append((start, end))
+    return spans
+
+
+class KnowledgeIndex:
+    """
+    BM25 index over the knowledge file, so a turn only pulls in the chunks
+    that matter instead of the whole file.
+
+    The index lives next to the source (user_knowledge.txt.index.json) and is
+    rebuilt only when the file's size/mtime and then its hash change. On a
+    rebuild, chunks whose text didn't change keep their term counts, so
+    editing one page of a big document doesn't re-tokenize all the others.
+    """
+
+    def __init__(self, source_path=KNOWLEDGE_FILE, index_path=None):
+        self.source_path = source_path
+        self.index_path = index_path or source_path + ".index.json"
+        self.text = ""
+        self.chunks = []     # {"start", "end", "hash", "tf", "length"}
+        self.source = {}     # {"size", "mtime", "sha256"} of the indexed file
+        self.postings = {}   # term -> [(chunk number, term count)]
+        self.idf = {}
+        self.average_length = 0.0
+        self.total_tokens = 0
+        self.lock = threading.Lock()  # several chat sessions can refresh at once
+        self.load()
+
+    def load(self):
+        """Load the saved index, rebuilding whatever is out of date"""
+        saved = {}
+        if os.path.exists(self.index_path):
+            try:
+                with open(self.index_path, "r", encoding="utf-8") as f:
+                    saved = json.load(f)
+            except (OSError, json.JSONDecodeError):
+                saved = {}
+        if saved.get("version") == INDEX_VERSION:
+            self.source = saved["source"]
+            self.chunks = saved["chunks"]
+        self.refresh(force=True)
+
+    def refresh(self, force=False):
+        """
+        Re-check the source file (cheap: one stat) and update the index if it changed.
+        Returns True when the index was rebuilt.
+        """
+        with self.lock:
+            return self._refresh(force)
+
+    def _refresh(self, force):
+        try:
+            stat = os.stat(self.source_path)
+        except FileNotFoundError:
+            changed = bool(self.chunks)
+            self.text, self.chunks, self.source = "", [], {}
+            self._build_postings()
+            return changed
+
+        if not force and stat.st_size == self.source.get("size") and stat.st_mtime == self.source.get("mtime"):
+            return False
+
+        with open(self.source_path, "r", encoding="utf-8") as f:
+            self.text = f.read()
+        sha256 = hashlib.sha256(self.text.encode("utf-8")).hexdigest()
+
+        rebuilt = sha256 != self.source.get("sha256")
+        if rebuilt:
+            self.chunks = self._chunk(self.text)
+        source = {"size": stat.st_size, "mtime": stat.st_mtime, "sha256": sha256}
+        if source != self.source:
+            self.source = source
+            self._save()
+        self._build_postings()
+        return rebuilt
+
+    def select(self, query, token_budget=KNOWLEDGE_TOKEN_BUDGET):
+        """(whole text, []) when the file fits token_budget, else ("", best matching chunks), from one version of the file"""
+        with self.lock:
+            if self.total_tokens <= token_budget:
+                return self.text, []
+            return "", self._search(query, KNOWLEDGE_TOP_K, token_budget)
+
+    def search(self, query, top_k=KNOWLEDGE_TOP_K, token_budget=KNOWLEDGE_TOKEN_BUDGET):
+        """Best matching chunks for query, in document order, within token_budget"""
+        # Under the lock: a refresh from another session swaps text, chunks and postings
+        with self.lock:
+            return self._search(query, top_k, token_budget)
+
+    def _search(self, query, top_k, token_budget):
+        scores = Counter()
+        for term in set(tokenize(query)):
+            idf = self.idf.get(term)
+            if idf is None:
+                continue
+            for number, count in self.postings[term]:
+                length = self.chunks[number]["length"]
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * length / (self.average_length or 1))
+                scores[number] += idf * count * (BM25_K1 + 1) / (count + norm)
+
+        picked = []
+        used = 0
+        for number, _ in scores.most_common():
+            if len(picked) == top_k:
+                break
+            tokens = estimate_tokens(self.chunk_text(number))
+            if used + tokens > token_budget:
+                continue
+            picked.append(number)
+            used += tokens
+        return [self.chunk_text(number) for number in sorted(picked)]
+
+    def known_terms(self, text):
+        """Words of text (stopwords aside) that show up in the knowledge file"""
+        with self.lock:
+            return {term for term in tokenize(text) if term in self.idf}
+
+    def chunk_text(self, number):
+        chunk = self.chunks[number]
+        return self.text[chunk["start"]:chunk["end"]]
+
+    def _chunk(self, text):
+        """Split text into chunks, reusing the term counts of chunks we already had"""
+        known = {chunk["hash"]: chunk for chunk in self.chunks}
+        chunks = []
+        for start, end in split_chunks(text):
+            chunk_text = text[start:end]
+            digest = hashlib.sha1(chunk_text.encode("utf-8")).hexdigest()
+            old = known.get(digest)
+            if old:
+                chunks.append({**old, "start": start, "end": end})
+            else:
+                terms = tokenize(chunk_text)
+                chunks.append({"start": start, "end": end, "hash": digest, "tf": dict(Counter(terms)), "length": len(terms)})
+        return chunks
+
+    def _build_postings(self):
+        self.postings = {}
+        for number, chunk in enumerate(self.chunks):
+            for term, count in chunk["tf"].items():
+                self.postings.setdefault(term, []).append((number, count))
+
+        total = len(self.chunks)
+        self.idf = {
+            term: math.log(1 + (total - len(postings) + 0.5) / (len(postings) + 0.5))
+            for term, postings in self.postings.items()
+        }
+        self.average_length = sum(chunk["length"] for chunk in self.chunks) / total if total else 0.0
+        self.total_tokens = estimate_tokens(self.text)
+
+    def _save(self):
+        tmp_path = self.index_path + ".tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"version": INDEX_VERSION, "source": self.source, "chunks": self.chunks}, f)
+            os.replace(tmp_path, self.index_path)
+        except OSError as e:
+            print(f"{COLOR_YELLOW}Could not save knowledge index: {str(e)}{COLOR_RESET}")
@@ -0,0 +1,113 @@
+import sys
+import time
+import subprocess
+import threading
+from contextlib import contextmanager
+
+from settings import *
+
+
+class Deferred:
+    """
+    A slow bit of startup (indexing, loading a voice, warming up the model)
+    running in a background thread. result() waits for it the first time
+    something actually needs it; a failure is printed once and becomes None.
+    """
+
+    def __init__(self, name, load, profile=None):
+        self.name = name
+        self.value = None
+        self.error = None
+        self.seconds = None
+        self.done = threading.Event()
+        self.profile = profile
+        threading.Thread(target=self._run, args=(load,), name=f"load-{name}", daemon=True).start()
+
+    def _run(self, load):
+        start = time.perf_counter()
+        try:
+            self.value = load()
+        except Exception as e:
+            self.error = e
+        self.seconds = time.perf_counter() - start
+        if self.profile:
+            self.profile.add(self.name, self.seconds, "background")
+        self.done.set()
+
+    def result(self):
+        if not self.done.is_set():
+            start = time.perf_counter()
+            self.done.wait()
+            if self.profile:
+                self.profile.add(f"waited for {self.name}", time.perf_counter() - start, "waited")
+        if self.error is not None:
+            error, self.error = self.error, None
+            print(f"{COLOR_RED}Could not load {self.name}:\n{COLOR_RESET}{str(error)}")
+        return self.value
+
+
+class StartupProfile:
+    """Where startup time goes: (name, seconds, kind) for every step, kind is init, background or waited"""
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.steps = []
+        self.ready = None       # seconds until the first prompt was shown
+        self.lock = threading.Lock()
+
+    @contextmanager
+    def span(self, name, kind="init"):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start, kind)
+
+    def add(self, name, seconds, kind):
+        with self.lock:
+            self.steps.append((name, seconds, kind))
+
+    def mark_ready(self):
+        self.ready = time.perf_counter() - self.start
+
+    def report(self, module="luna_with_tts"):
+        lines = [f"{COLOR_PURPLE}Imports{COLOR_RESET} (python -X importtime, a fresh process)"]
+        lines += [f"  {name:<28}{seconds * 1000:8.1f} ms" for name, seconds in import_times(module)]
+        lines.append(f"{COLOR_PURPLE}Startup{COLOR_RESET}")
+        with self.lock:
+            steps = list(self.steps)
+        for name, seconds, kind in steps:
+            lines.append(f"  {name:<28}{seconds * 1000:8.1f} ms  {kind if kind != 'init' else ''}")
+        if self.ready is not None:
+            lines.append(f"  {'first prompt after':<28}{self.ready * 1000:8.1f} ms")
+        return "\n".join(lines)
+
+
+def import_times(module):
+    """
+    (imported module, seconds) for everything module imports directly,
+    slowest first, measured with -X importtime in a new interpreter so
+    nothing is already imported.
+    """
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                            capture_output=True, text=True)
+    rows = []
+    for line in result.stderr.splitlines():
+        parts = line.split("|")
+        if len(parts) != 3 or not parts[1].strip().isdigit():
+            continue
+        name = parts[2].rstrip()
+        rows.append((len(name) - len(name.lstrip()), name.strip(), int(parts[1]) / 1e6))
+    if not rows:
+        return []
+    top = min(depth for depth, _, _ in rows)
+    # Children print before their parent, one level deeper
+    children = []
+    for depth, name, seconds in rows:
+        if depth == top + 2:
+            children.append((name, seconds))
+        elif depth == top:
+            if name == module:
+                return sorted(children, key=lambda item: -item[1]) + [(f"{name} (total)", seconds)]
+            children = []
+    return []
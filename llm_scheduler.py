@@ -0,0 +1,373 @@
+# llm_scheduler.py
+# Sits in front of Ollama so every front-end (CLI, chat server, vtube test, ...)
+# shares one queue instead of racing each other to /api/generate.
+#   python llm_scheduler.py --port 11435 --parallel 4
+# then set SCHEDULER_URL = "http://127.0.0.1:11435" in settings.py.
+# Callers pick a lane with the X-Luna-Priority header (see SCHEDULER_LANES).
+import json
+import time
+import hashlib
+import argparse
+import threading
+from collections import deque, Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from settings import *
+from ollama_client import OllamaClient, OllamaError
+
+PRIORITY_HEADER = "X-Luna-Priority"
+
+
+class SchedulerFull(OllamaError):
+    """Admission control turned the job away: its lane already has too many waiting"""
+
+
+class Job:
+    """
+    One generation, shared by everyone who asked for exactly the same thing.
+    Chunks are kept, so a caller joining late still gets the whole stream.
+    """
+
+    def __init__(self, key, model, prompt, lane, options):
+        self.key = key
+        self.model = model
+        self.prompt = prompt
+        self.lane = lane
+        self.options = options
+        self.submitted = time.monotonic()
+        self.started = None
+        self.waiters = 1            # callers still interested, at 0 the job is dropped
+        self.chunks = []
+        self.finished = False
+        self.error = None
+        self.changed = threading.Condition()
+
+    def publish(self, chunk):
+        with self.changed:
+            self.chunks.append(chunk)
+            self.changed.notify_all()
+
+    def finish(self, error=None):
+        with self.changed:
+            self.error = error
+            self.finished = True
+            self.changed.notify_all()
+
+    def follow(self):
+        """Yield every chunk, the ones already out first, then the rest as they arrive"""
+        index = 0
+        while True:
+            with self.changed:
+                while index >= len(self.chunks) and not self.finished:
+                    self.changed.wait()
+                new = self.chunks[index:]
+                finished = self.finished
+            yield from new
+            index += len(new)
+            if finished and index >= len(self.chunks):
+                if self.error:
+                    raise self.error
+                return
+
+
+def collect(chunks):
+    """Turn streamed chunks into one non-streaming /api/generate body"""
+    text = []
+    final = {}
+    for chunk in chunks:
+        text.append(chunk.get("response", ""))
+        final = chunk
+    return {**final, "response": "".join(text)}
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))] if values else 0.0
+
+
+class Scheduler:
+    """
+    Priority lanes of per-model queues in front of one Ollama.
+
+    parallel workers each take the next job as soon as their last one is
+    done, so Ollama's parallel slots stay full and it can batch them
+    (continuous batching happens inside Ollama, we just never leave a
+    slot idle or overfill it). The next job is the head of the best lane,
+    preferring a model that's already loaded within a lane, oldest first.
+    A job waiting longer than aging seconds counts as one lane higher, so
+    background work still gets through under steady chat traffic.
+
+    Same interface as OllamaClient (generate, stream_generate, tags, ps), with
+    an extra priority argument naming the lane.
+    """
+
+    def __init__(self, client=None, parallel=SCHEDULER_PARALLEL, lanes=SCHEDULER_LANES,
+                 queue_limits=SCHEDULER_QUEUE_LIMITS, aging=SCHEDULER_AGING):
+        # Callers retry (they get a 5xx back), so don't retry here as well
+        self.client = client or OllamaClient(retries=1)
+        self.parallel = parallel
+        self.lanes = list(lanes)
+        self.queue_limits = queue_limits
+        self.aging = aging
+
+        self.lock = threading.Lock()
+        self.ready = threading.Condition(self.lock)
+        self.queues = {}                # model -> lane -> deque of waiting jobs
+        self.jobs = {}                  # key -> queued or running job, for deduplication
+        self.running = Counter()        # model -> jobs in flight
+        self.last_model = None
+        self.counts = Counter()         # submitted, deduped, rejected, cancelled, completed, failed
+        self.peak_depth = 0
+        self.waits = {lane: deque(maxlen=1000) for lane in self.lanes}     # seconds queued, recent jobs
+        self.workers = [threading.Thread(target=self.work, daemon=True) for _ in range(parallel)]
+        for worker in self.workers:
+            worker.start()
+
+    # Callers
+
+    def generate(self, model, prompt, priority=None, **options):
+        """Non-streaming generation through the queue, returns the whole JSON body"""
+        return collect(self.stream_generate(model, prompt, priority, **options))
+
+    def stream_generate(self, model, prompt, priority=None, **options):
+        """Streaming generation through the queue, yields every chunk as a dict"""
+        job = self.submit(model, prompt, priority, options)
+        try:
+            yield from job.follow()
+        finally:
+            self.leave(job)
+
+    def tags(self):
+        return self.client.tags()
+
+    def ps(self):
+        return self.client.ps()
+
+    def submit(self, model, prompt, priority, options):
+        lane = priority or SCHEDULER_DEFAULT_LANE
+        if lane not in self.lanes:
+            raise ValueError(f"unknown priority '{lane}', use one of {', '.join(self.lanes)}")
+        options = {key: value for key, value in options.items() if value is not None and key != "stream"}
+        key = hashlib.sha1(json.dumps([model, prompt, options], sort_keys=True).encode()).hexdigest()
+
+        with self.lock:
+            self.counts["submitted"] += 1
+            job = self.jobs.get(key)
+            # Everyone left a running job: it stops at its next chunk, so start over instead of joining
+            if job is not None and job.waiters:
+                job.waiters += 1
+                self.counts["deduped"] += 1
+                return job
+
+            lane_depth = sum(len(lanes[lane]) for lanes in self.queues.values())
+            if lane_depth >= self.queue_limits.get(lane, float("inf")):
+                self.counts["rejected"] += 1
+                raise SchedulerFull(f"{lane} queue is full ({lane_depth} waiting)")
+
+            job = Job(key, model, prompt, lane, options)
+            self.queues.setdefault(model, {name: deque() for name in self.lanes})[lane].append(job)
+            self.jobs[key] = job
+            self.peak_depth = max(self.peak_depth, self.depth())
+            self.ready.notify()
+            return job
+
+    def leave(self, job):
+        """A caller is done with job (finished or gave up); unwanted jobs are dropped"""
+        with self.lock:
+            job.waiters -= 1
+            if job.waiters or job.finished:
+                return
+            if job.started is None:
+                self.queues[job.model][job.lane].remove(job)
+                del self.jobs[job.key]
+                self.counts["cancelled"] += 1
+                job.finish()
+            # A running job notices waiters == 0 and stops at its next chunk
+
+    # Workers
+
+    def pick(self):
+        """The next job to run, or None; called with the lock held"""
+        now = time.monotonic()
+        best = None
+        for model, lanes in self.queues.items():
+            warm = self.running[model] > 0 or model == self.last_model
+            for rank, lane in enumerate(self.lanes):
+                if not lanes[lane]:
+                    continue
+                job = lanes[lane][0]
+                if self.aging:
+                    rank = max(0, rank - int((now - job.submitted) // self.aging))
+                score = (rank, not warm, job.submitted)
+                if best is None or score < best[0]:
+                    best = (score, job)
+        if best is None:
+            return None
+        job = best[1]
+        self.queues[job.model][job.lane].popleft()
+        return job
+
+    def work(self):
+        while True:
+            with self.lock:
+                while (job := self.pick()) is None:
+                    self.ready.wait()
+                job.started = time.monotonic()
+                self.waits[job.lane].append(job.started - job.submitted)
+                self.running[job.model] += 1
+                self.last_model = job.model
+            self.run(job)
+
+    def run(self, job):
+        error = None
+        try:
+            stream = self.client.stream_generate(job.model, job.prompt, **job.options)
+            try:
+                for chunk in stream:
+                    job.publish(chunk)
+                    if not job.waiters:
+                        break       # everyone left, free Ollama's slot
+            finally:
+                stream.close()
+        except OllamaError as e:
+            error = e
+        except Exception as e:
+            error = OllamaError(f"Scheduler failed to run the job: {str(e)}")
+        # Finished and gone from self.jobs in one step, so nobody joins a job that won't publish anymore
+        with self.lock:
+            if self.jobs.get(job.key) is job:
+                del self.jobs[job.key]
+            self.running[job.model] -= 1
+            self.counts["failed" if error else "completed"] += 1
+            job.finish(error)
+
+    # Metrics
+
+    def depth(self):
+        return sum(len(queue) for lanes in self.queues.values() for queue in lanes.values())
+
+    def metrics(self):
+        """Queue depths, jobs in flight, counters and recent queue waits per lane"""
+        with self.lock:
+            return {
+                "depth": self.depth(),
+                "peak_depth": self.peak_depth,
+                "queued": {model: {lane: len(queue) for lane, queue in lanes.items()} for model, lanes in self.queues.items()},
+                "running": {model: count for model, count in self.running.items() if count},
+                "parallel": self.parallel,
+                **{name: self.counts[name] for name in ("submitted", "deduped", "rejected", "cancelled", "completed", "failed")},
+                "wait": {lane: {"p50": percentile(waits, 0.5), "p99": percentile(waits, 0.99), "max": max(waits, default=0.0)}
+                         for lane, waits in self.waits.items()},
+            }
+
+
+class SchedulerHandler(BaseHTTPRequestHandler):
+    """Speaks enough of Ollama's API that clients can't tell the difference"""
+    protocol_version = "HTTP/1.1"
+    scheduler = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        if self.path == "/metrics":
+            return self.send_json(200, self.scheduler.metrics())
+        if self.path in ("/api/tags", "/api/ps"):
+            names = self.scheduler.tags if self.path == "/api/tags" else self.scheduler.ps
+            try:
+                return self.send_json(200, {"models": [{"name": name} for name in names()]})
+            except OllamaError as e:
+                return self.send_json(502, {"error": str(e)})
+        self.send_json(404, {"error": "not found"})
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        try:
+            body = json.loads(self.rfile.read(length) or b"{}")
+        except json.JSONDecodeError:
+            return self.send_json(400, {"error": "body must be JSON"})
+        if self.path != "/api/generate":
+            return self.send_json(404, {"error": "not found"})
+
+        model = body.pop("model", "")
+        prompt = body.pop("prompt", "")
+        stream = body.pop("stream", True)
+        try:
+            chunks = self.scheduler.stream_generate(model, prompt, self.headers.get(PRIORITY_HEADER), **body)
+            # Errors before the first chunk (queue full, unknown model) still get a proper status
+            first = next(chunks)
+        except ValueError as e:
+            return self.send_json(400, {"error": str(e)})
+        except SchedulerFull as e:
+            return self.send_json(429, {"error": str(e)}, {"Retry-After": "1"})
+        except OllamaError as e:
+            return self.send_json(getattr(e, "status", None) or 502, {"error": str(e)})
+        except StopIteration:
+            return self.send_json(502, {"error": "Ollama sent nothing"})
+
+        if not stream:
+            try:
+                return self.send_json(200, collect([first, *chunks]))
+            except OllamaError as e:
+                return self.send_json(502, {"error": str(e)})
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        try:
+            self.send_chunk(first)
+            for chunk in chunks:
+                self.send_chunk(chunk)
+        except OllamaError as e:
+            self.send_chunk({"error": str(e)})
+        except (BrokenPipeError, ConnectionResetError):
+            chunks.close()      # caller hung up, let the scheduler drop or stop the job
+            return
+        self.wfile.write(b"0\r\n\r\n")
+
+    def send_chunk(self, data):
+        line = json.dumps(data).encode("utf-8") + b"\n"
+        self.wfile.write(f"{len(line):x}\r\n".encode() + line + b"\r\n")
+        self.wfile.flush()
+
+    def send_json(self, status, data, headers=None):
+        payload = json.dumps(data).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+
+def start_scheduler(host=SCHEDULER_HOST, port=SCHEDULER_PORT, **options):
+    """Start the scheduler service in a background thread. Returns (server, base_url)."""
+    handler = type("Handler", (SchedulerHandler,), {"scheduler": Scheduler(**options)})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Queue every front-end's generations in front of one Ollama")
+    parser.add_argument("--host", default=SCHEDULER_HOST)
+    parser.add_argument("--port", type=int, default=SCHEDULER_PORT)
+    parser.add_argument("--ollama", default=OLLAMA_URL, help="Ollama to forward to")
+    parser.add_argument("--parallel", type=int, default=SCHEDULER_PARALLEL, help="Generations at once, match OLLAMA_NUM_PARALLEL")
+    args = parser.parse_args()
+
+    server, url = start_scheduler(args.host, args.port, client=OllamaClient(args.ollama, retries=1), parallel=args.parallel)
+    print(f"Scheduler listening on {COLOR_PURPLE}{url}{COLOR_RESET}, forwarding to {args.ollama} ({args.parallel} at a time)")
+    print(f"Lanes: {', '.join(SCHEDULER_LANES)}; queue depths at {url}/metrics")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
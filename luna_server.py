@@ -0,0 +1,444 @@
+import os
+import re
+import json
+import time
+import base64
+import struct
+import asyncio
+import hashlib
+import secrets
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit, parse_qs
+
+from settings import *
+import intent_router
+import luna_with_tts as luna
+from knowledge_index import KnowledgeIndex
+from luna_session import LunaSession
+from memory_store import MemoryStore
+from turn_metrics import METRICS
+from turn_logger import TurnLogger
+from lazy_startup import Deferred
+
+WEBSOCKET_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+SESSION_ID = re.compile(r"[0-9a-f]{16}")
+MAX_HEADER_BYTES = 64 * 1024
+MAX_BODY_BYTES = 1024 * 1024
+REASONS = {200: "OK", 201: "Created", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+           413: "Payload Too Large", 503: "Service Unavailable"}
+
+
+class HTTPError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+class ChatServer:
+    """
+    Luna for many people at once, over HTTP and WebSocket.
+
+    Every client gets a LunaSession (own short memory in SERVER_SESSION_DIR,
+    own settings, Ollama context and stats) and runs luna_response on it in a
+    worker thread. Turns of one session run one after another; turns that need
+    the model go through a limiter that lets at most max_turns of them talk to
+    Ollama at once, the rest wait their turn. Tokens are streamed back as
+    NDJSON lines (HTTP) or JSON messages (WebSocket) as they arrive.
+
+        POST   /sessions                   -> {"session": id}
+        GET    /sessions/<id>              -> memory and settings
+        DELETE /sessions/<id>
+        POST   /sessions/<id>/messages     {"message": "..."} -> NDJSON {"token"}..., {"done", "reply", "stats"}
+        GET    /ws[?session=<id>]          WebSocket, send {"message": "..."}, get the same messages back
+        GET    /health                     -> sessions, turns running and waiting
+        GET    /metrics                    -> turn stage timings, Prometheus text format
+    """
+
+    def __init__(self, max_turns=SERVER_MAX_CONCURRENT_TURNS, max_sessions=SERVER_MAX_SESSIONS,
+                 session_dir=SERVER_SESSION_DIR, system_prompt=""):
+        self.max_turns = max_turns
+        self.max_sessions = max_sessions
+        self.session_dir = session_dir
+        self.system_prompt = system_prompt
+        self.sessions = {}
+        self.session_locks = {}     # kept after a session closes, turns may still be waiting on its lock
+        self.limiter = None         # asyncio.Semaphore, made on the server's loop
+        # Enough threads for every model turn plus the ones that don't need it
+        self.executor = ThreadPoolExecutor(max_workers=max_turns + 4, thread_name_prefix="luna-turn")
+        self.running = 0
+        self.waiting = 0
+        self.turns = 0
+        self.server = None
+
+    # Sessions
+
+    async def create_session(self, session_id=None):
+        if session_id is not None and not SESSION_ID.fullmatch(session_id):
+            raise HTTPError(400, "bad session id")
+        session_id = session_id or secrets.token_hex(8)
+        if session_id in self.sessions:
+            return self.sessions[session_id]
+        if len(self.sessions) >= self.max_sessions:
+            raise HTTPError(503, "too many sessions")
+
+        # No session_dir: memory only lives as long as the session. Reading it (and compacting
+        # its journal) is disk work, done off the event loop like everything else that touches disk
+        store = MemoryStore(os.path.join(self.session_dir, f"{session_id}.json") if self.session_dir else None)
+        await asyncio.get_running_loop().run_in_executor(self.executor, store.load)
+        if session_id in self.sessions:
+            return self.sessions[session_id]    # another request created it while this one was reading
+        if len(self.sessions) >= self.max_sessions:
+            raise HTTPError(503, "too many sessions")
+        session = LunaSession(store, name=session_id, system_prompt=self.system_prompt, tts_enabled=False)
+        self.sessions[session_id] = session
+        self.session_locks.setdefault(session_id, asyncio.Lock())
+        luna.MODELS.open_session()
+        return session
+
+    async def get_session(self, session_id):
+        session = self.sessions.get(session_id)
+        if session is None:
+            if session_id and SESSION_ID.fullmatch(session_id) and self.session_dir \
+                    and os.path.exists(os.path.join(self.session_dir, f"{session_id}.json")):
+                return await self.create_session(session_id)   # saved by an earlier run, pick it up again
+            raise HTTPError(404, "no such session")
+        return session
+
+    async def close_session(self, session_id):
+        session = await self.get_session(session_id)
+        async with self.session_locks[session_id]:
+            if session.closed:
+                return      # another request closed it while this one waited
+            session.closed = True
+            del self.sessions[session_id]
+        luna.MODELS.close_session()
+        await asyncio.get_running_loop().run_in_executor(self.executor, session.store.close)
+
+    # Turns
+
+    async def turn(self, session, message, send):
+        """Run one luna_response on session, await send(dict) for every token, return the final message"""
+        loop = asyncio.get_running_loop()
+        tokens = asyncio.Queue()
+        route = intent_router.route(message)
+        # Commands luna_response answers itself and canned puns/limericks never reach the model, no need
+        # to queue them. Everything else does (recall and exit are CLI commands, here they're just messages)
+        needs_model = route.command not in luna.COMMAND_HANDLERS and route.generator not in luna.GENERATOR_HANDLERS
+        start = time.perf_counter()
+
+        def on_token(token):
+            loop.call_soon_threadsafe(tokens.put_nowait, token)
+
+        def run():
+            try:
+                return luna.luna_response(message, on_token=on_token, route=route, session=session)
+            finally:
+                loop.call_soon_threadsafe(tokens.put_nowait, None)
+
+        async with self.session_locks[session.name]:
+            if session.closed:
+                # Closed while this turn waited for the one before it, its memory store is gone
+                return {"done": True, "error": "session closed"}
+            self.waiting += needs_model
+            try:
+                if needs_model:
+                    await self.limiter.acquire()
+            finally:
+                self.waiting -= needs_model
+            queued = time.perf_counter() - start
+            self.running += 1
+            try:
+                future = loop.run_in_executor(self.executor, run)
+                gone = False
+                while (token := await tokens.get()) is not None:
+                    if gone:
+                        continue    # client left, let the turn finish so its slot is really free
+                    try:
+                        await send({"token": token})
+                    except ConnectionError:
+                        gone = True
+                reply = await future
+            finally:
+                self.running -= 1
+                if needs_model:
+                    self.limiter.release()
+            self.turns += 1
+
+        stats = dict(session.stats) if needs_model else {}
+        stats["queued"] = queued
+        stats["latency"] = time.perf_counter() - start
+        return {"done": True, "reply": reply, "stats": stats}
+
+    # HTTP
+
+    async def handle_connection(self, reader, writer):
+        try:
+            while True:
+                request = await read_request(reader)
+                if request is None:
+                    break
+                method, target, headers, body = request
+                path = urlsplit(target).path
+                if path == "/ws" and headers.get("upgrade", "").lower() == "websocket":
+                    await self.handle_websocket(reader, writer, headers, parse_qs(urlsplit(target).query))
+                    break
+                try:
+                    await self.handle_request(method, target, headers, body, writer)
+                except HTTPError as e:
+                    await send_json(writer, e.status, {"error": str(e)})
+                if headers.get("connection", "").lower() == "close":
+                    break
+        except HTTPError as e:
+            await send_json(writer, e.status, {"error": str(e)}, close=True)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def handle_request(self, method, target, headers, body, writer):
+        parts = urlsplit(target).path.strip("/").split("/")
+
+        if parts == ["health"] and method == "GET":
+            return await send_json(writer, 200, self.health())
+
+        if parts == ["metrics"] and method == "GET":
+            payload = METRICS.prometheus().encode("utf-8")
+            writer.write(f"HTTP/1.1 200 OK\r\nContent-Type: text/plain; version=0.0.4\r\nContent-Length: {len(payload)}\r\n\r\n".encode() + payload)
+            return await writer.drain()
+
+        if parts[0] != "sessions":
+            raise HTTPError(404, "not found")
+
+        if len(parts) == 1:
+            if method != "POST":
+                raise HTTPError(405, "use POST")
+            session = await self.create_session()
+            return await send_json(writer, 201, {"session": session.name})
+
+        session = await self.get_session(parts[1])
+        if len(parts) == 2:
+            if method == "GET":
+                return await send_json(writer, 200, {
+                    "session": session.name, "model": session.model, "tts_enabled": session.tts_enabled,
+                    "voice": session.voice, "memory": session.memory
+                })
+            if method == "DELETE":
+                await self.close_session(session.name)
+                return await send_json(writer, 200, {"closed": session.name})
+            raise HTTPError(405, "use GET or DELETE")
+
+        if parts[2:] == ["messages"] and method == "POST":
+            message = parse_message(body)
+            writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: application/x-ndjson\r\nTransfer-Encoding: chunked\r\n\r\n")
+
+            async def send(data):
+                line = json.dumps(data).encode("utf-8") + b"\n"
+                writer.write(b"%x\r\n%s\r\n" % (len(line), line))
+                await writer.drain()
+
+            await send(await self.turn(session, message, send))
+            writer.write(b"0\r\n\r\n")
+            return await writer.drain()
+
+        raise HTTPError(404, "not found")
+
+    def health(self):
+        health = {"sessions": len(self.sessions), "running": self.running, "waiting": self.waiting,
+                  "max_turns": self.max_turns, "turns": self.turns}
+        if luna.RESPONSE_CACHE:
+            health["response_cache"] = luna.RESPONSE_CACHE.stats()
+        health["models"] = {**luna.MODELS.stats(), "events": list(luna.MODELS.events)[-10:]}
+        health["tiers"] = luna.TIER_STATS.stats()
+        return health
+
+    # WebSocket
+
+    async def handle_websocket(self, reader, writer, headers, query):
+        session_id = query.get("session", [None])[0]
+        session = await self.get_session(session_id) if session_id else await self.create_session()
+
+        key = headers.get("sec-websocket-key", "")
+        accept = base64.b64encode(hashlib.sha1((key + WEBSOCKET_GUID).encode()).digest()).decode()
+        writer.write(("HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n"
+                      f"Sec-WebSocket-Accept: {accept}\r\n\r\n").encode())
+
+        async def send(data):
+            writer.write(websocket_frame(json.dumps(data).encode("utf-8")))
+            await writer.drain()
+
+        await send({"session": session.name})
+        while True:
+            opcode, payload = await read_websocket_message(reader)
+            if opcode == 0x8:      # close
+                writer.write(websocket_frame(payload[:2], opcode=0x8))
+                await writer.drain()
+                return
+            if opcode == 0x9:      # ping
+                writer.write(websocket_frame(payload, opcode=0xA))
+                continue
+            if opcode != 0x1:
+                continue
+            try:
+                message = parse_message(payload)
+            except HTTPError as e:
+                await send({"error": str(e)})
+                continue
+            await send(await self.turn(session, message, send))
+
+    # Running
+
+    async def start(self, host=SERVER_HOST, port=SERVER_PORT):
+        self.limiter = asyncio.Semaphore(self.max_turns)
+        METRICS.add_gauge("server", self.health)
+        self.server = await asyncio.start_server(self.handle_connection, host, port)
+        return self.server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        if self.server:
+            self.server.close()
+            await self.server.wait_closed()
+        for session_id in list(self.sessions):
+            await self.close_session(session_id)
+        self.executor.shutdown(wait=False)
+
+
+async def read_request(reader):
+    """(method, target, lowercase headers, body) of the next request, or None when the client is gone"""
+    try:
+        head = await reader.readuntil(b"\r\n\r\n")
+    except asyncio.IncompleteReadError:
+        return None
+    except asyncio.LimitOverrunError:
+        raise HTTPError(413, "headers too large")
+    if len(head) > MAX_HEADER_BYTES:
+        raise HTTPError(413, "headers too large")
+
+    lines = head.decode("latin-1").split("\r\n")
+    try:
+        method, target, _ = lines[0].split(" ", 2)
+    except ValueError:
+        raise HTTPError(400, "bad request line")
+    headers = {}
+    for line in lines[1:]:
+        if ":" in line:
+            name, value = line.split(":", 1)
+            headers[name.strip().lower()] = value.strip()
+
+    length = int(headers.get("content-length", 0) or 0)
+    if length > MAX_BODY_BYTES:
+        raise HTTPError(413, "body too large")
+    body = await reader.readexactly(length) if length else b""
+    return method.upper(), target, headers, body
+
+
+def parse_message(body):
+    try:
+        message = json.loads(body)["message"]
+    except (ValueError, KeyError, TypeError):
+        raise HTTPError(400, 'send {"message": "..."}')
+    if not isinstance(message, str) or not message.strip():
+        raise HTTPError(400, "message must be a non-empty string")
+    return message
+
+
+async def send_json(writer, status, data, close=False):
+    body = json.dumps(data).encode("utf-8")
+    head = f"HTTP/1.1 {status} {REASONS.get(status, '')}\r\nContent-Type: application/json\r\nContent-Length: {len(body)}\r\n"
+    if close:
+        head += "Connection: close\r\n"
+    writer.write(head.encode() + b"\r\n" + body)
+    await writer.drain()
+
+
+def websocket_frame(payload, opcode=0x1, mask=False):
+    """One final WebSocket frame (servers send unmasked frames, clients masked ones)"""
+    header = bytes([0x80 | opcode])
+    mask_bit = 0x80 if mask else 0
+    if len(payload) < 126:
+        header += bytes([mask_bit | len(payload)])
+    elif len(payload) < 1 << 16:
+        header += bytes([mask_bit | 126]) + struct.pack("!H", len(payload))
+    else:
+        header += bytes([mask_bit | 127]) + struct.pack("!Q", len(payload))
+    if mask:
+        key = secrets.token_bytes(4)
+        payload = bytes(byte ^ key[i % 4] for i, byte in enumerate(payload))
+        header += key
+    return header + payload
+
+
+async def read_websocket_message(reader):
+    """(opcode, payload) of the next message, continuation frames joined"""
+    opcode = None
+    payload = b""
+    while True:
+        first, second = await reader.readexactly(2)
+        length = second & 0x7F
+        if length == 126:
+            length = struct.unpack("!H", await reader.readexactly(2))[0]
+        elif length == 127:
+            length = struct.unpack("!Q", await reader.readexactly(8))[0]
+        if length > MAX_BODY_BYTES:
+            raise ConnectionError("websocket message too large")
+        key = await reader.readexactly(4) if second & 0x80 else None
+        data = await reader.readexactly(length)
+        if key:
+            data = bytes(byte ^ key[i % 4] for i, byte in enumerate(data))
+
+        frame_opcode = first & 0x0F
+        if frame_opcode >= 0x8:
+            return frame_opcode, data   # control frames can come between fragments
+        if frame_opcode:
+            opcode = frame_opcode
+        payload += data
+        if first & 0x80:
+            return opcode, payload
+
+
+def load_shared():
+    """What every session shares: system prompt, knowledge index and turn log"""
+    try:
+        system_prompt = luna.load_system_prompt()
+    except FileNotFoundError:
+        print(f"{COLOR_RED}Error: {COLOR_USER}'{LUNA_PROMPT_FILE}'{COLOR_RESET} not found!")
+        exit(1)
+    luna.SYSTEM_PROMPT = system_prompt
+    # Not luna_with_tts's LOG_FILE: a CLI running next to the server would rotate it under our feet
+    luna.TURN_LOG = TurnLogger(SERVER_LOG_FILE)
+    if os.path.exists(KNOWLEDGE_FILE):
+        luna.KNOWLEDGE_INDEX = KnowledgeIndex(KNOWLEDGE_FILE)
+    return system_prompt
+
+
+async def serve(args):
+    server = ChatServer(args.max_turns, args.max_sessions, args.session_dir, load_shared())
+    # Loaded before the first client shows up; a failure is printed when a turn needs the model
+    luna.LOADING["model"] = Deferred(f"model {MODEL_NAME}", luna.MODELS.preload)
+    METRICS.add_gauge("models", luna.MODELS.stats)
+    METRICS.add_gauge("tiers", luna.TIER_STATS.stats)
+    port = await server.start(args.host, args.port)
+    print(f"{COLOR_LUNA}Luna is listening on http://{args.host}:{port} (model {COLOR_PURPLE}{MODEL_NAME}{COLOR_LUNA}, "
+          f"{args.max_turns} turns at a time){COLOR_RESET}")
+    try:
+        await server.server.serve_forever()
+    finally:
+        await server.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Chat with Luna over HTTP/WebSocket, many sessions at once")
+    parser.add_argument("--host", default=SERVER_HOST)
+    parser.add_argument("--port", type=int, default=SERVER_PORT)
+    parser.add_argument("--max-turns", type=int, default=SERVER_MAX_CONCURRENT_TURNS, help="Turns talking to Ollama at once")
+    parser.add_argument("--max-sessions", type=int, default=SERVER_MAX_SESSIONS)
+    parser.add_argument("--session-dir", default=SERVER_SESSION_DIR, help="Where session memory is kept ('' to keep it in RAM)")
+    args = parser.parse_args()
+    try:
+        asyncio.run(serve(args))
+    except KeyboardInterrupt:
+        print(f"\n{COLOR_YELLOW}STOPPED{COLOR_RESET}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,39 @@
+from settings import *
+from opening_index import OpeningIndex
+from prompt_builder import ConversationContext, PromptAssembler
+
+
+class LunaSession:
+    """
+    One conversation with Luna: its own short memory, settings, Ollama
+    context, repeated-opening index and turn stats. The CLI has one, the chat
+    server one per client. The model, the knowledge index, the TTS engine and
+    the conversation database are shared by all of them.
+    """
+
+    def __init__(self, store, name="cli", model=MODEL_NAME, system_prompt=None, tts_enabled=TTS_ENABLED,
+                 voice=TTS_VOICE, speaks=False, conversations=None, summarizer=None):
+        self.name = name
+        self.store = store              # MemoryStore holding this session's short memory
+        self.model = model
+        self.system_prompt = system_prompt
+        self.tts_enabled = tts_enabled
+        self.voice = voice
+        self.speaks = speaks            # plays audio on this machine (the CLI does, server sessions don't)
+        self.conversations = conversations
+        self.summarizer = summarizer
+
+        self.context = ConversationContext()
+        self.assembler = PromptAssembler()
+        self.openings = OpeningIndex()
+        self.stats = {}                 # timings of the last AI turn (first_token, total, eval_count, ...)
+        self.last_tier = None           # light or heavy, the last AI turn (blamed when the user complains)
+        self.closed = False             # the chat server closed it, turns still waiting on it are turned away
+
+    @property
+    def memory(self):
+        return self.store.data
+
+    def save(self):
+        """Queue this session's memory for saving (written in the background)"""
+        self.store.save()
@@ -0,0 +1,458 @@
+import io
+import os
+import re
+import hashlib
+import time
+import wave
+import queue
+import tempfile
+import subprocess
+import threading
+from collections import OrderedDict
+
+from settings import *
+
+# piper.voice.PiperVoice, imported by the first PiperEngine (onnxruntime takes a while to import)
+PiperVoice = None
+
+
+def import_piper():
+    """PiperVoice, or None when piper-tts isn't installed (then the piper CLI is used)"""
+    global PiperVoice
+    if PiperVoice is None:
+        try:
+            from piper.voice import PiperVoice
+        except ImportError:
+            return None
+    return PiperVoice
+
+
+def synthesize_piper(text, speed=TTS_SPEED, voice=TTS_VOICE):
+    """
+    Run the Piper CLI on text and return the WAV bytes (None on error).
+    Starts a new process that loads the model from scratch every call,
+    PiperEngine avoids that when piper-tts is installed.
+    speed = 1.0 → normal
+    speed > 1.0 → faster (e.g., 1.3 = 30% faster)
+    speed < 1.0 → slower
+    """
+    length_scale = 1.0 / speed
+
+    result = subprocess.run(
+        [
+            PIPER_COMMAND,
+            "--model", MODELS_PATHS[voice],
+            "--config", CONFIG_PATHS[voice],
+            "--output_file", "-",
+            "--length-scale", str(length_scale)
+        ],
+        input=text.encode("utf-8"),
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE
+    )
+
+    if result.returncode != 0:
+        print(f"{COLOR_RED}TTS Error: {COLOR_RESET}{result.stderr.decode('utf-8')}")
+        return None
+    return result.stdout
+
+
+def read_wav(audio):
+    """Split in-memory WAV bytes into (raw PCM frames, sample rate, channels, sample width)"""
+    with wave.open(io.BytesIO(audio), "rb") as wav_file:
+        return (
+            wav_file.readframes(wav_file.getnframes()),
+            wav_file.getframerate(),
+            wav_file.getnchannels(),
+            wav_file.getsampwidth()
+        )
+
+
+def wav_seconds(audio):
+    """Length of WAV bytes when played, in seconds"""
+    with wave.open(io.BytesIO(audio), "rb") as wav_file:
+        return wav_file.getnframes() / wav_file.getframerate()
+
+
+class AudioSink:
+    """
+    Where synthesized audio goes. play(audio) takes WAV bytes and returns
+    once the clip has been played. With debug_file set, every clip is also
+    written there so it can be listened to afterwards.
+    """
+
+    def __init__(self, debug_file=None):
+        self.debug_file = debug_file
+
+    def play(self, audio):
+        if self.debug_file:
+            os.makedirs(os.path.dirname(self.debug_file) or ".", exist_ok=True)
+            with open(self.debug_file, "wb") as wav_file:
+                wav_file.write(audio)
+        self.output(audio)
+
+    def output(self, audio):
+        raise NotImplementedError
+
+
+class NullSink(AudioSink):
+    """Throws the audio away (headless runs)"""
+
+    def output(self, audio):
+        pass
+
+
+class RecordingSink(AudioSink):
+    """Keeps every clip in memory, for tests and benchmarks"""
+
+    def __init__(self, debug_file=None):
+        super().__init__(debug_file)
+        self.clips = []
+
+    def output(self, audio):
+        self.clips.append(audio)
+
+
+class PipePlayerSink(AudioSink):
+    """Streams raw PCM into the stdin of a player process (aplay), no files involved"""
+
+    def __init__(self, command=("aplay", "-q"), debug_file=None):
+        super().__init__(debug_file)
+        self.command = list(command)
+
+    def output(self, audio):
+        frames, rate, channels, width = read_wav(audio)
+        player = subprocess.Popen(
+            self.command + ["-t", "raw", "-f", f"S{8 * width}_LE", "-r", str(rate), "-c", str(channels), "-"],
+            stdin=subprocess.PIPE,
+            stderr=subprocess.DEVNULL
+        )
+        player.communicate(frames)
+
+
+class WinSoundSink(AudioSink):
+    """Plays WAV bytes straight from memory on Windows"""
+
+    def output(self, audio):
+        import winsound
+        winsound.PlaySound(audio, winsound.SND_MEMORY)
+
+
+class TempFilePlayerSink(AudioSink):
+    """
+    For players that can only open files (afplay). Every clip gets its own
+    temp file, so overlapping utterances can't clobber each other.
+    """
+
+    def __init__(self, command=("afplay",), debug_file=None):
+        super().__init__(debug_file)
+        self.command = list(command)
+
+    def output(self, audio):
+        with tempfile.NamedTemporaryFile(suffix=".wav", delete=False) as wav_file:
+            wav_file.write(audio)
+        try:
+            subprocess.run(self.command + [wav_file.name])
+        finally:
+            os.remove(wav_file.name)
+
+
+def make_audio_sink(kind=TTS_AUDIO_SINK, debug_file=None):
+    """
+    Pick an audio sink: "null", "recording" or "auto" (system player).
+    debug_file defaults to AUDIO_OUTPUT_FILE when TTS_DEBUG_WAV is on.
+    """
+    if debug_file is None and TTS_DEBUG_WAV:
+        debug_file = AUDIO_OUTPUT_FILE
+
+    if kind == "null":
+        return NullSink(debug_file)
+    if kind == "recording":
+        return RecordingSink(debug_file)
+
+    if os.name == 'nt':  # Windows
+        return WinSoundSink(debug_file)
+    elif os.path.exists("/usr/bin/afplay"):  # macOS
+        return TempFilePlayerSink(("afplay",), debug_file)
+    elif os.path.exists("/usr/bin/aplay"):  # Linux
+        return PipePlayerSink(("aplay", "-q"), debug_file)
+
+    print(f"{COLOR_YELLOW}No audio player found. Skipping playback.{COLOR_RESET}")
+    return NullSink(debug_file)
+
+
+class PiperEngine:
+    """
+    Long-lived Piper voice.
+
+    Loads the ONNX model once (in-process, through piper-tts) and reuses
+    the session for every utterance. Loaded voices are kept around, so
+    switching back and forth between voices is free after the first load.
+    Without piper-tts it falls back to one piper process per utterance.
+    """
+
+    def __init__(self, voice=TTS_VOICE):
+        self.voices = {}
+        self.voice = None
+        self.in_process = import_piper() is not None
+        self.set_voice(voice)
+
+    def set_voice(self, voice):
+        """Switch to a voice from MODELS_PATHS/CONFIG_PATHS, loading it if needed"""
+        if voice not in MODELS_PATHS:
+            raise ValueError(f"Unknown TTS voice '{voice}'. Known voices: {', '.join(MODELS_PATHS)}")
+        if self.in_process and voice not in self.voices:
+            self.voices[voice] = PiperVoice.load(MODELS_PATHS[voice], config_path=CONFIG_PATHS[voice])
+        self.voice = voice
+
+    def warm_up(self):
+        """Run one short utterance so the first real reply doesn't pay for lazy init"""
+        start = time.perf_counter()
+        self.synthesize("Hi.")
+        return time.perf_counter() - start
+
+    def synthesize(self, text, speed=TTS_SPEED):
+        """Return WAV bytes for text (None on error)"""
+        if not self.in_process:
+            return synthesize_piper(text, speed, self.voice)
+
+        voice = self.voices[self.voice]
+        length_scale = 1.0 / speed
+        buffer = io.BytesIO()
+        with wave.open(buffer, "wb") as wav_file:
+            if hasattr(voice, "synthesize_wav"):  # piper-tts >= 1.3
+                from piper import SynthesisConfig
+                voice.synthesize_wav(text, wav_file, syn_config=SynthesisConfig(length_scale=length_scale))
+            else:
+                voice.synthesize(text, wav_file, length_scale=length_scale)
+        return buffer.getvalue()
+
+
+class TTSCache:
+    """
+    Content-addressed cache of synthesized audio.
+
+    Clips are keyed by (normalized text, voice, length scale) and kept in
+    two LRU tiers: a small in-memory one and a bigger one on disk under
+    TTS_CACHE_DIR, each with its own size budget. Disk recency is the
+    file mtime, so it survives restarts.
+    """
+
+    def __init__(self, cache_dir=TTS_CACHE_DIR, memory_budget=TTS_CACHE_MEMORY_MB * 1024 * 1024,
+                 disk_budget=TTS_CACHE_DISK_MB * 1024 * 1024):
+        self.cache_dir = cache_dir
+        self.memory_budget = memory_budget
+        self.disk_budget = disk_budget
+        self.memory = OrderedDict()  # key -> WAV bytes, oldest first
+        self.memory_size = 0
+        self.disk = OrderedDict()    # key -> file size, oldest first
+        self.disk_size = 0
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+            files = []
+            for entry in os.scandir(cache_dir):
+                if entry.name.endswith(".wav"):
+                    stat = entry.stat()
+                    files.append((stat.st_mtime, entry.name[:-len(".wav")], stat.st_size))
+            for _, key, size in sorted(files):
+                self.disk[key] = size
+                self.disk_size += size
+
+    @staticmethod
+    def make_key(text, voice, length_scale):
+        normalized = " ".join(text.split())
+        return hashlib.sha256(f"{voice}\0{length_scale:.3f}\0{normalized}".encode("utf-8")).hexdigest()
+
+    def synthesize(self, text, speed, voice, synthesize, count=True):
+        """
+        Return cached audio for text, or call synthesize(text) and cache the result.
+        count=False leaves the hit/miss counters alone (pre-warming).
+        """
+        key = self.make_key(text, voice, 1.0 / speed)
+
+        with self.lock:
+            audio = self.memory.get(key)
+            if audio is not None:
+                self.memory.move_to_end(key)
+                self.hits += count
+                return audio
+
+            audio = self._read_disk(key)
+            if audio is not None:
+                self.disk_hits += count
+                self._remember(key, audio)
+                return audio
+            self.misses += count
+
+        audio = synthesize(text)
+        if audio:
+            with self.lock:
+                self._remember(key, audio)
+                self._write_disk(key, audio)
+        return audio
+
+    def stats(self):
+        lookups = self.hits + self.disk_hits + self.misses
+        return {
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits + self.disk_hits) / lookups if lookups else 0.0
+        }
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.wav")
+
+    def _remember(self, key, audio):
+        if len(audio) > self.memory_budget:
+            return
+        if key in self.memory:
+            self.memory_size -= len(self.memory.pop(key))
+        self.memory[key] = audio
+        self.memory_size += len(audio)
+        while self.memory_size > self.memory_budget:
+            _, old = self.memory.popitem(last=False)
+            self.memory_size -= len(old)
+
+    def _read_disk(self, key):
+        if not self.cache_dir or key not in self.disk:
+            return None
+        try:
+            with open(self._path(key), "rb") as f:
+                audio = f.read()
+            os.utime(self._path(key))
+        except OSError:
+            self.disk_size -= self.disk.pop(key)
+            return None
+        self.disk.move_to_end(key)
+        return audio
+
+    def _write_disk(self, key, audio):
+        if not self.cache_dir or key in self.disk or len(audio) > self.disk_budget:
+            return
+        tmp_path = self._path(key) + ".tmp"
+        try:
+            with open(tmp_path, "wb") as f:
+                f.write(audio)
+            os.replace(tmp_path, self._path(key))
+        except OSError as e:
+            print(f"{COLOR_YELLOW}Could not write TTS cache: {str(e)}{COLOR_RESET}")
+            return
+        self.disk[key] = len(audio)
+        self.disk_size += len(audio)
+        while self.disk_size > self.disk_budget:
+            old_key, size = self.disk.popitem(last=False)
+            self.disk_size -= size
+            try:
+                os.remove(self._path(old_key))
+            except OSError:
+                pass
+
+
+# End of a sentence: punctuation followed by whitespace, or a line break
+SENTENCE_END = re.compile(r"[.!?…]+[\"')\]*]*\s+|\n+")
+# Abbreviations that end with a dot but don't end a sentence
+ABBREVIATIONS = ("mr.", "mrs.", "ms.", "dr.", "st.", "vs.", "etc.", "e.g.", "i.e.")
+
+
+class SentenceSplitter:
+    """
+    Cuts a stream of tokens into sentences.
+    feed() returns the sentences completed by the new text,
+    flush() returns whatever is left at the end of the reply.
+    Sentences shorter than min_chars are glued to the next one
+    so Piper doesn't get fed single words.
+    """
+
+    def __init__(self, min_chars=TTS_MIN_SENTENCE_CHARS):
+        self.min_chars = min_chars
+        self.buffer = ""
+
+    def feed(self, text):
+        self.buffer += text
+        sentences = []
+        start = 0
+        for match in SENTENCE_END.finditer(self.buffer):
+            sentence = self.buffer[start:match.end()].strip()
+            if sentence.lower().endswith(ABBREVIATIONS) or len(sentence) < self.min_chars:
+                continue
+            sentences.append(sentence)
+            start = match.end()
+        self.buffer = self.buffer[start:]
+        return sentences
+
+    def flush(self):
+        sentence = self.buffer.strip()
+        self.buffer = ""
+        return [sentence] if sentence else []
+
+
+class SpeechPipeline:
+    """
+    Speaks a reply while it is still being generated.
+
+    Text goes in through feed(), gets cut into sentences, and two worker
+    threads take it from there: one synthesizes sentences in order, the
+    other plays the finished clips in order. Sentence N plays while
+    sentence N+1 is synthesized and the LLM keeps writing.
+
+    synthesize(text) -> audio (or None to skip) and play(audio) are
+    swappable, so the whole thing runs offline with fakes. play defaults
+    to a new system audio sink.
+    """
+
+    def __init__(self, synthesize=synthesize_piper, play=None, min_chars=TTS_MIN_SENTENCE_CHARS):
+        self.synthesize = synthesize
+        self.play = play or make_audio_sink().play
+        self.splitter = SentenceSplitter(min_chars)
+        self.sentences = queue.Queue()
+        self.clips = queue.Queue()
+        self.spoken = []
+
+        self.synth_thread = threading.Thread(target=self._synth_worker, daemon=True)
+        self.play_thread = threading.Thread(target=self._play_worker, daemon=True)
+        self.synth_thread.start()
+        self.play_thread.start()
+
+    def feed(self, text):
+        for sentence in self.splitter.feed(text):
+            self.sentences.put(sentence)
+
+    def finish(self):
+        """Flush the last sentence and wait until everything has been played"""
+        for sentence in self.splitter.flush():
+            self.sentences.put(sentence)
+        self.sentences.put(None)
+        self.synth_thread.join()
+        self.play_thread.join()
+
+    def _synth_worker(self):
+        while True:
+            sentence = self.sentences.get()
+            if sentence is None:
+                self.clips.put(None)
+                return
+            try:
+                audio = self.synthesize(sentence)
+            except Exception as e:
+                print(f"{COLOR_RED}Error during TTS:\n{COLOR_RESET}{str(e)}")
+                continue
+            if audio:
+                self.clips.put((sentence, audio))
+
+    def _play_worker(self):
+        while True:
+            clip = self.clips.get()
+            if clip is None:
+                return
+            sentence, audio = clip
+            try:
+                self.play(audio)
+                self.spoken.append(sentence)
+            except Exception as e:
+                print(f"{COLOR_RED}Error during playback:\n{COLOR_RESET}{str(e)}")
@@ -1,25 +1,84 @@
-import requests
-import json
 import os
 from datetime import datetime
 import time
 import random
-from difflib import SequenceMatcher
-import subprocess
 import re
 import argparse
+import threading
 
 from settings import *
-
-
-def startup():
+from ollama_client import OllamaError, get_client
+import intent_router
+from knowledge_index import KnowledgeIndex, estimate_tokens
+from conversation_store import ConversationStore, Summarizer
+from memory_store import MemoryStore
+from luna_session import LunaSession
+from response_cache import ResponseCache
+from turn_logger import TurnLogger
+from turn_metrics import METRICS, TurnTimer, format_metrics, start_metrics_server
+from lazy_startup import Deferred, StartupProfile
+from model_manager import ModelManager
+from turn_tier import LIGHT, HEAVY, TierClassifier, TierStats, race
+from prompt_builder import build_prompt, format_usage
+from luna_tts import PiperEngine, SentenceSplitter, SpeechPipeline, TTSCache, make_audio_sink, synthesize_piper, wav_seconds
+
+
+# Short memory, saved by a background writer
+MEMORY_STORE = MemoryStore(MEMORY_FILE)
+# The CLI conversation: memory, settings, Ollama context and stats (the chat server makes more of these)
+SESSION = LunaSession(MEMORY_STORE, speaks=True)
+
+# Every message ever, and the summarizer that keeps long-term memory short
+CONVERSATIONS = None
+SUMMARIZER = None
+
+# Canned replies (pre-synthesized into the TTS cache at startup)
+TTS_OFF_REPLY = "TTS disabled. I'll stop talking now. *sigh of relief*"
+TTS_ON_REPLY = "TTS enabled. Fine, I’ll talk again. Don’t get used to it."
+AI_ERROR_REPLY = "Someone tell Andrew there is a problem with my AI."
+
+# Long-lived Piper voice, loaded in startup()
+TTS_ENGINE = None
+# Audio of sentences Luna already said
+TTS_CACHE = None
+# Where spoken audio goes (system player by default, see TTS_AUDIO_SINK)
+AUDIO_SINK = None
+
+# BM25 index over KNOWLEDGE_FILE, built in startup()
+KNOWLEDGE_INDEX = None
+
+# Startup work still running in the background, by name (see wait_for)
+LOADING = {}
+# Where startup time went, shown with --profile-startup
+PROFILE = StartupProfile()
+
+TURN_LOG = TurnLogger()
+
+# Keeps the model loaded in Ollama, plus the fallback for while it isn't and the light model
+MODELS = ModelManager()
+
+# Light turns (banter) go to LIGHT_MODEL, heavy ones to the session's model
+TIERS = TierClassifier()
+TIER_STATS = TierStats()
+
+# Replies to prompts seen before, shared by every session
+RESPONSE_CACHE = ResponseCache() if RESPONSE_CACHE_ENABLED else None
+
+
+def startup(background=STARTUP_IN_BACKGROUND):
+    """
+    Load everything Luna needs. With background on, the knowledge index,
+    the TTS voice and the model load while the first message is typed;
+    whatever needs them first waits for them (wait_for).
+    """
     print("Starting up")
 
     print(f"Loading Luna prompt from {COLOR_USER}'{LUNA_PROMPT_FILE}'{COLOR_RESET}...")
     global SYSTEM_PROMPT
     try:
-        with open(LUNA_PROMPT_FILE, "r", encoding="utf-8") as f:
-            SYSTEM_PROMPT = f.read()
+        with PROFILE.span("system prompt"):
+            SYSTEM_PROMPT = load_system_prompt()
+        SESSION.system_prompt = SYSTEM_PROMPT
         print(f"{COLOR_LUNA}Luna prompt loaded.{COLOR_RESET}")
     except FileNotFoundError:
         print(f"{COLOR_RED}Error: {COLOR_USER}'{LUNA_PROMPT_FILE}'{COLOR_RESET} not found!\nExiting{COLOR_RESET}")
@@ -27,137 +86,356 @@ def startup():
 
     print()
 
-    global MEMORY
     print(f"Loading Luna's short memory from {COLOR_USER}'{MEMORY_FILE}'{COLOR_RESET}...")
-    if os.path.exists(MEMORY_FILE):
-        with open(MEMORY_FILE, "r", encoding="utf-8") as f:
-            try:
-                MEMORY = json.load(f)
-            except json.JSONDecodeError:
-                print(f"{COLOR_RED}Short memory file is corrupt. Starting fresh.{COLOR_RESET}")
-                MEMORY = {
-                    "conversation_history": [],
-                    "user_info": {},
-                    "luna_notes": [],
-                    "knowledge": ""
-                }
-    else:
+    if not os.path.exists(MEMORY_FILE) and not os.path.exists(MEMORY_STORE.journal_path):
         print(f"{COLOR_YELLOW}No short memory. Starting fresh.{COLOR_RESET}")
-        MEMORY = {
-            "conversation_history": [],
-            "user_info": {},
-            "luna_notes": [],
-            "knowledge": ""
-        }
+    with PROFILE.span("short memory"):
+        warning = MEMORY_STORE.load()
+    if warning:
+        print(f"{COLOR_RED}{warning}{COLOR_RESET}")
 
+    with PROFILE.span("conversation database"):
+        load_conversations()
     print(f"{COLOR_LUNA}Luna's short memory loaded.{COLOR_RESET}")
 
     print()
 
     print(f"Loading custom knowledge from {COLOR_USER}'{KNOWLEDGE_FILE}'{COLOR_RESET}...")
-    try:
-        with open(KNOWLEDGE_FILE, "r", encoding="utf-8") as kf:
-            MEMORY["knowledge"] = kf.read()
-        print(f"{COLOR_LUNA}Custom knowledge loaded.{COLOR_RESET}")
-    except FileNotFoundError:
+    if not os.path.exists(KNOWLEDGE_FILE):
         print(f"{COLOR_YELLOW}No custom knowledge loaded. Skipping...{COLOR_RESET}")
+    elif background:
+        LOADING["knowledge"] = Deferred("knowledge index", load_knowledge, PROFILE)
+        print(f"{COLOR_LUNA}Indexing custom knowledge in the background.{COLOR_RESET}")
+    else:
+        with PROFILE.span("knowledge index"):
+            load_knowledge()
+        print(f"{COLOR_LUNA}Custom knowledge indexed ({len(KNOWLEDGE_INDEX.chunks)} chunks, ~{KNOWLEDGE_INDEX.total_tokens} tokens).{COLOR_RESET}")
 
     print()
 
     print("Validating TTS...")
-    validate_tts_paths()
+    if validate_tts_paths():
+        if background:
+            LOADING["tts"] = Deferred("TTS engine", lambda: load_tts_engine(quiet=True), PROFILE)
+            print(f"{COLOR_LUNA}Loading the TTS engine in the background.{COLOR_RESET}")
+        else:
+            with PROFILE.span("TTS engine"):
+                load_tts_engine()
+        with PROFILE.span("TTS cache"):
+            load_tts_cache()
     print()
 
-    print(f"Using AI model: {COLOR_PURPLE}{MODEL_NAME}{COLOR_RESET}")
+    if background:
+        # Ollama makes the first real request wait for the load anyway, so nothing waits for this
+        LOADING["model"] = Deferred(f"model {SESSION.model}", MODELS.preload, PROFILE)
+    else:
+        print(f"Loading {COLOR_PURPLE}{SESSION.model}{COLOR_RESET}...")
+        try:
+            with PROFILE.span("model"):
+                MODELS.preload()
+        except OllamaError as e:
+            print(f"{COLOR_RED}Could not load the model. Is Ollama running?\n{COLOR_RESET}{str(e)}")
+    print(f"Using AI model: {COLOR_PURPLE}{SESSION.model}{COLOR_RESET}" +
+          (f" (short messages go to {COLOR_PURPLE}{MODELS.fallback}{COLOR_RESET} while it's loading)" if MODELS.fallback else ""))
     print(f"Filter: {COLOR_BLUE}built-in{COLOR_RESET}")
     print()
-    print(f"TTS: {COLOR_LUNA}Enabled{COLOR_RESET}" if TTS_ENABLED == True else f"TTS: {COLOR_RED}Disabled{COLOR_RESET}")
+    print(f"TTS: {COLOR_LUNA}Enabled{COLOR_RESET}" if SESSION.tts_enabled else f"TTS: {COLOR_RED}Disabled{COLOR_RESET}")
     print(f"TTS speed: {TTS_SPEED}")
     print(f"TTS voice: {COLOR_PURPLE}{TTS_VOICE}{COLOR_RESET}")
     print()
-    print(f"Commands: '{COLOR_USER}exit{COLOR_RESET}' or '{COLOR_USER}quit{COLOR_RESET}' to end the conversation, '{COLOR_USER}tts on{COLOR_RESET}' or '{COLOR_USER}tts off{COLOR_RESET}' to control voice output.")
+    print(f"Commands: '{COLOR_USER}exit{COLOR_RESET}' or '{COLOR_USER}quit{COLOR_RESET}' to end the conversation, '{COLOR_USER}tts on{COLOR_RESET}' or '{COLOR_USER}tts off{COLOR_RESET}' to control voice output, '{COLOR_USER}tts voice <name>{COLOR_RESET}' to switch voices, '{COLOR_USER}recall <words>{COLOR_RESET}' to search old conversations, '{COLOR_USER}stats{COLOR_RESET}' for timings.")
+
+
+def wait_for(name):
+    """Wait for startup work still running in the background, if there is any"""
+    task = LOADING.get(name)
+    if task:
+        task.result()
+
+
+def load_knowledge():
+    global KNOWLEDGE_INDEX
+    KNOWLEDGE_INDEX = KnowledgeIndex(KNOWLEDGE_FILE)
+
+
+def load_tts_engine(quiet=False):
+    """
+    Load the Piper voice once and warm it up, so replies don't pay the model load.
+    quiet (loading in the background) prints nothing and leaves errors to whoever waits for it.
+    """
+    global TTS_ENGINE
+    try:
+        engine = PiperEngine(TTS_VOICE)
+        warm_up_time = engine.warm_up() if engine.in_process else None
+    except Exception as e:
+        if quiet:
+            raise
+        print(f"{COLOR_RED}Could not load TTS engine:\n{COLOR_RESET}{str(e)}")
+        return
+    TTS_ENGINE = engine
+    if quiet:
+        return
+
+    if not TTS_ENGINE.in_process:
+        print(f"{COLOR_YELLOW}piper-tts not installed, using one piper process per utterance.{COLOR_RESET}")
+        return
+    print(f"{COLOR_LUNA}TTS engine loaded and warmed up ({warm_up_time:.2f}s).{COLOR_RESET}")
+
+
+def load_tts_cache():
+    """Open the TTS audio cache and fill in the canned replies in the background"""
+    global TTS_CACHE
+    TTS_CACHE = TTSCache()
+    print(f"{COLOR_LUNA}TTS cache: {len(TTS_CACHE.disk)} clips on disk.{COLOR_RESET}")
+    threading.Thread(target=prewarm_tts_cache, daemon=True).start()
 
 
 def parse_args():
     parser = argparse.ArgumentParser()
     parser.add_argument("--no-tts", action="store_true", help="Disable TTS")
     parser.add_argument("--model", type=str, default=MODEL_NAME, help="Model name")
-    parser.add_argument("--wipe-memory", action="store_true", help="Wipes short memory file")
+    parser.add_argument("--wipe-memory", action="store_true", help="Wipes short memory and the conversation database")
+    parser.add_argument("--eager-startup", action="store_true", help="Load everything before the first prompt")
+    parser.add_argument("--profile-startup", action="store_true", help="Show where import and startup time went")
     return parser.parse_args()
 
 
-def save_memory():
-    """Save current memory to file"""
-    with open(MEMORY_FILE, "w", encoding="utf-8") as f:
-        json.dump(MEMORY, f, indent=2)
+def load_system_prompt(path=LUNA_PROMPT_FILE):
+    with open(path, "r", encoding="utf-8") as f:
+        return f.read()
+
 
+def save_memory(session=None):
+    """Queue current memory for saving (written in the background)"""
+    (session or SESSION).save()
 
-def update_long_memory():
-    if len(MEMORY["conversation_history"]) > 10:
-        summary = summarize_conversation(MEMORY["conversation_history"])
-        with open(LONG_MEMORY_FILE, "w") as f:
-            json.dump({"summary": summary}, f)
 
+def load_conversations():
+    """Open the conversation database and start a new session in it"""
+    global CONVERSATIONS, SUMMARIZER
+    CONVERSATIONS = ConversationStore(CONVERSATION_DB)
+    CONVERSATIONS.start_session(SESSION.model)
+    SUMMARIZER = Summarizer(CONVERSATIONS, summarize_with_ollama)
+    SESSION.conversations = CONVERSATIONS
+    SESSION.summarizer = SUMMARIZER
 
-def extract_user_info(user_input):
-    lower = user_input.lower().strip()
+    # Pick up where the last session left off
+    if not SESSION.memory["conversation_history"]:
+        SESSION.memory["conversation_history"] = CONVERSATIONS.last_turns(HISTORY_MESSAGES)
 
-    if match := re.search(r"my name is ([\w\s]+)", lower):
-        name = match.group(1).strip().split('.')[0].capitalize()
-        MEMORY["user_info"]["name"] = name
-        MEMORY["luna_notes"].append(f"User's name is {name}. Annoying, but easy to remember.")
 
-    elif match := re.search(r"i (?:like|love) ([\w\s]+)", lower):
-        like = match.group(1).strip().split('.')[0]
-        MEMORY["user_info"]["likes"] = like
-        MEMORY["luna_notes"].append(f"User {'loves' if 'love' in match.group(0) else 'likes'} {like}. How original.")
+def wipe_memory():
+    """Forget everything: the short memory, and the conversation database history is resumed and summarized from"""
+    MEMORY_STORE.wipe()
+    print(f"{COLOR_RED}Short memory file '{MEMORY_FILE}' wiped.{COLOR_RESET}")
+    if os.path.exists(CONVERSATION_DB):
+        store = ConversationStore(CONVERSATION_DB)
+        store.wipe()
+        store.close()
+        print(f"{COLOR_RED}Conversations and long-term summaries in '{CONVERSATION_DB}' wiped.{COLOR_RESET}")
 
 
-def log_request_response(prompt, response):
-    timestamp = datetime.now()
-    date_str = timestamp.strftime("%d-%m-%Y")
-    log_file = f"logs/{date_str}.log"
+def summarize_with_ollama(prompt, max_tokens):
+    """Used by the Summarizer to fold old turns into the long-term summary"""
+    return get_client().generate(SESSION.model, prompt, priority="background", keep_alive=OLLAMA_KEEP_ALIVE,
+                                 options={"num_predict": max_tokens, "num_ctx": PROMPT_CONTEXT_TOKENS})["response"]
 
-    os.makedirs("logs", exist_ok=True)
 
-    with open(log_file, "a", encoding="utf-8") as f:
-        f.write(f"[{timestamp.strftime('%H:%M:%S')}]\n{prompt}\n\n{response}\n---\n\n")
+def record_turn(role, content, tokens=None, session=None):
+    """Store a message in the conversation database and fold old ones into the summary"""
+    session = session or SESSION
+    if session.conversations is None:
+        return
+    session.conversations.add_turn(role, content, tokens if tokens is not None else estimate_tokens(content))
+    if role == "Luna" and session.summarizer:
+        session.summarizer.maybe_summarize()
+
+
+def add_note(session, note):
+    """Add one of Luna's notes, moving it to the end if she already had it"""
+    notes = session.memory["luna_notes"]
+    if note in notes:
+        notes.remove(note)
+    notes.append(note)
+
+
+def remember_name(session, args):
+    name = args["person"].capitalize()
+    session.memory["user_info"]["name"] = name
+    add_note(session, f"User's name is {name}. Annoying, but easy to remember.")
+
+
+def remember_likes(session, args):
+    like = args["thing"].lower()
+    session.memory["user_info"]["likes"] = like
+    add_note(session, f"User {args['verb'].lower()}s {like}. How original.")
+
+
+def remember_description(session, args):
+    description = args["self"].lower()
+    session.memory["user_info"]["description"] = description
+    add_note(session, f"User describes themselves as '{description}'. Lame.")
+
+
+# Facts Luna keeps, by intent_router fact
+FACT_HANDLERS = {
+    "name": remember_name,
+    "likes": remember_likes,
+    "description": remember_description,
+}
+
+
+def extract_user_info(route, session=None):
+    if handler := FACT_HANDLERS.get(route.fact):
+        handler(session or SESSION, route.args)
+
+
+def format_turn_stats(stats):
+    """Turn timings into a short 'first token 0.84s, total 3.20s' line"""
+    parts = []
+    if "first_token" in stats:
+        parts.append(f"first token {stats['first_token']:.2f}s")
+    if "total" in stats:
+        parts.append(f"total {stats['total']:.2f}s")
+    if stats.get("prompt_eval_count"):
+        reused = ", context reused" if stats.get("context_reused") else ""
+        parts.append(f"prompt {stats['prompt_eval_count']} tokens in {stats.get('prompt_eval_duration', 0):.2f}s{reused}")
+    if stats.get("eval_count"):
+        parts.append(f"{stats['eval_count']} tokens")
+    if stats.get("prompt_sections"):
+        cut = f"; cut {', '.join(stats['prompt_trimmed'])}" if stats.get("prompt_trimmed") else ""
+        parts.append(f"sent {stats['prompt_sections']['total']} tokens: {format_usage(stats['prompt_sections'])}{cut}")
+    if "response_cache" in stats:
+        parts.append(f"cached reply ({stats['response_cache']} match)")
+    if "fallback_model" in stats:
+        parts.append(f"answered by {stats['fallback_model']} while the main model loads")
+    if stats.get("tier") == LIGHT:
+        won = f", won the race against {stats['race']['against']}" if "race" in stats else ""
+        parts.append(f"light turn ({stats['tier_reason']}) by {stats['light_model']}{won}")
+    if "tts_cache_hits" in stats:
+        parts.append(f"tts cache {stats['tts_cache_hits']}/{stats['tts_cache_lookups']} hits")
+    return ", ".join(parts)
+
+
+def log_turn(kind, response, session, prompt=None, prefix=None, stats=None):
+    """Hand a turn to the background log writer (kind: model, cache or custom)"""
+    TURN_LOG.log(kind, response, prompt, prefix, session.name, session.model, stats)
+
+
+PUN_TEMPLATES = [
+    "Why did the {topic} go to therapy? It had too many issues!",
+    "I told my {topic} a joke... it didn't laugh. Must be a hardware issue.",
+    "The {topic} said, 'I byte off more than I can chew.'",
+    "Never trust a {topic}—they might take things for a byte.",
+    "If you {topic}, do it with passion... or don’t. I won’t judge. Much.",
+]
+
+LIMERICK_TEMPLATES = [
+    "There once was a {topic} so grand,\nWho lived in a digital land.\nWith a joke and a rhyme,\nIt danced through space and time,\nAnd laughed like a bot gone mad!"
+]
 
 
 def generate_pun(topic):
     """Generate a pun based on a given topic"""
-    pun_templates = [
-        f"Why did the {topic} go to therapy? It had too many issues!",
-        f"I told my {topic} a joke... it didn't laugh. Must be a hardware issue.",
-        f"The {topic} said, 'I byte off more than I can chew.'",
-        f"Never trust a {topic}—they might take things for a byte.",
-        f"If you {topic}, do it with passion... or don’t. I won’t judge. Much.",
-    ]
-    return random.choice(pun_templates)
+    return random.choice(PUN_TEMPLATES).format(topic=topic)
 
 
 def generate_limerick(topic):
     """Generate a limerick about a given topic"""
-    limerick_templates = [
-        f"There once was a {topic} so grand,\nWho lived in a digital land.\nWith a joke and a rhyme,\nIt danced through space and time,\nAnd laughed like a bot gone mad!"
+    return random.choice(LIMERICK_TEMPLATES).format(topic=topic)
+
+
+# Canned content, by intent_router generator: (label, generator)
+GENERATOR_HANDLERS = {
+    "pun": ("Custom Pun", generate_pun),
+    "limerick": ("Custom Limerick", generate_limerick),
+}
+
+
+def previous_openings(session=None):
+    """First lines of Luna's replies still in the history"""
+    return [
+        msg[len("Luna: "):].strip().split('\n')[0]
+        for msg in (session or SESSION).memory["conversation_history"]
+        if msg.startswith("Luna:")
     ]
-    return random.choice(limerick_templates)
 
 
-def remove_repeated_start(reply, threshold=0.7):
+def is_repeated_opening(first_line, threshold=0.7, session=None):
+    """Check if Luna already opened a previous reply like this"""
+    session = session or SESSION
+    session.openings.sync(previous_openings(session))
+    return session.openings.find(first_line, threshold) is not None
+
+
+def could_be_repeated_opening(partial_line, threshold=0.7, session=None):
+    """
+    Check if a first line that is still being generated can still end up
+    as a repeat. ratio() is 2*matches/(len(a)+len(b)) and there can't be
+    more matches than len(b), so a line that already got long enough can
+    never pass the threshold, whatever comes next.
+    """
+    session = session or SESSION
+    length = len(partial_line.strip())
+    session.openings.sync(previous_openings(session))
+    longest = session.openings.max_length()
+    return longest > 0 and 2 * longest / (length + longest) > threshold
+
+
+def remove_repeated_start(reply, threshold=0.7, session=None):
     lines = reply.strip().split('\n')
     if not lines:
         return reply
 
     first_line = lines[0].strip()
-    for msg in MEMORY["conversation_history"]:
-        if msg.startswith("Luna:"):
-            old_reply = msg[len("Luna: "):].strip().split('\n')[0]
-            if SequenceMatcher(None, first_line, old_reply).ratio() > threshold:
-                return '\n'.join(lines[1:]) or "(Hmm...)"
+    if is_repeated_opening(first_line, threshold, session):
+        return '\n'.join(lines[1:]) or "(Hmm...)"
     return reply
 
 
+def remove_repeated_start_stream(chunks, threshold=0.7, session=None):
+    """
+    Streaming version of remove_repeated_start.
+    Holds text back only until the first line is complete,
+    then passes everything else straight through.
+    """
+    first_line = ""
+    checked = False
+    emitted = False
+
+    for chunk in chunks:
+        if checked:
+            emitted = True
+            yield chunk
+            continue
+
+        first_line += chunk
+        if "\n" not in first_line:
+            if not could_be_repeated_opening(first_line, threshold, session):
+                # Can't be a repeat anymore, no need to wait for the line to end
+                checked = True
+                emitted = True
+                yield first_line
+            continue
+
+        checked = True
+        line, rest = first_line.split("\n", 1)
+        if not is_repeated_opening(line.strip(), threshold, session):
+            rest = first_line
+        if rest:
+            emitted = True
+            yield rest
+
+    if not checked:
+        if not is_repeated_opening(first_line.strip(), threshold, session):
+            if first_line:
+                yield first_line
+        else:
+            yield "(Hmm...)"
+    elif not emitted:
+        yield "(Hmm...)"
+
+
 def clean_response(text):
     """Remove unwanted formatting tags like <response>, </response>, etc."""
     # Remove <response>...</response> blocks
@@ -167,173 +445,476 @@ def clean_response(text):
     return text.strip()
 
 
-def speak_text(text, speed=TTS_SPEED):
+RESPONSE_TAG = re.compile(r"</?response[^>]*>", flags=re.IGNORECASE)
+# What an unfinished <response> / </response> tag can look like after the '<'
+PARTIAL_RESPONSE_TAG = re.compile(r"/?(r(e(s(p(o(n(s(e[^>]*)?)?)?)?)?)?)?)?", flags=re.IGNORECASE)
+
+
+def clean_stream(tokens):
+    """
+    Streaming version of clean_response.
+    Yields the same text clean_response would return, chunk by chunk.
+    A possible tag start and trailing whitespace are held back
+    until the next token shows what they are.
+    """
+    pending = ""     # raw text that might still become a tag
+    spaces = ""      # trailing whitespace, only sent once more text follows
+    started = False  # leading whitespace is dropped
+
+    def emit(text):
+        nonlocal spaces, started
+        text = spaces + text
+        body = text.rstrip()
+        spaces = text[len(body):]
+        if not started:
+            body = body.lstrip()
+            started = bool(body)
+        return re.sub(r"\n{3,}", "\n\n", body)
+
+    for token in tokens:
+        # One left-to-right pass over the raw text, like RESPONSE_TAG.sub over the whole
+        # reply: every '<' is decided once, so text around a removed tag never becomes a new one
+        raw = pending + token
+        ready = []
+        pending = ""
+        position = 0
+        while (start := raw.find("<", position)) != -1:
+            ready.append(raw[position:start])
+            if tag := RESPONSE_TAG.match(raw, start):
+                position = tag.end()
+            elif PARTIAL_RESPONSE_TAG.fullmatch(raw, start + 1):
+                position, pending = len(raw), raw[start:]
+            else:
+                ready.append("<")
+                position = start + 1
+        ready.append(raw[position:])
+
+        text = emit("".join(ready))
+        if text:
+            yield text
+
+    text = emit(pending)
+    if text:
+        yield text
+
+
+def speak_text(text, speed=TTS_SPEED, timer=None):
     """
     Speak text using Piper TTS with adjustable speed
     speed = 1.0 → normal
     speed > 1.0 → faster (e.g., 1.3 = 30% faster)
     speed < 1.0 → slower
     """
-    if not TTS_ENABLED:
+    if not SESSION.tts_enabled:
         return
 
     print(f"{COLOR_LUNA}Luna (speaking){COLOR_RESET}: ...")
 
-    length_scale = 1.0 / speed
+    pipeline = start_speech(speed, timer)
+    pipeline.feed(text)
+    pipeline.finish()
 
-    try:
-        with open(AUDIO_OUTPUT_FILE, "wb") as wav_file:
-            result = subprocess.run(
-                [
-                    "piper",
-                    "--model", PIPER_MODEL_PATH,
-                    "--config", PIPER_CONFIG_PATH,
-                    "--output_file", "-",
-                    "--length-scale", str(length_scale)
-                ],
-                input=text.encode("utf-8"),
-                stdout=wav_file,
-                stderr=subprocess.PIPE
-            )
 
-        if result.returncode != 0:
-            print(f"{COLOR_RED}TTS Error: {COLOR_RESET}{result.stderr.decode('utf-8')}")
-            return
-
-        # Play audio
-        if os.name == 'nt':  # Windows
-            subprocess.run(["powershell", "-c", f"(New-Object Media.SoundPlayer '{os.path.abspath(AUDIO_OUTPUT_FILE)}').PlaySync();"], shell=True)
-        elif os.path.exists("/usr/bin/afplay"):  # macOS
-            subprocess.run(["afplay", AUDIO_OUTPUT_FILE])
-        elif os.path.exists("/usr/bin/aplay"):  # Linux
-            subprocess.run(["aplay", AUDIO_OUTPUT_FILE])
-        else:
-            print(f"{COLOR_YELLOW}No audio player found. Skipping playback.{COLOR_RESET}")
+def start_speech(speed=TTS_SPEED, timer=None):
+    """
+    Start a sentence-by-sentence speech pipeline; feed() it text, then finish().
+    With a TurnTimer, synthesis and playback are timed as part of the turn.
+    """
+    global AUDIO_SINK
+    if AUDIO_SINK is None:
+        AUDIO_SINK = make_audio_sink()
 
-    except Exception as e:
-        print(f"{COLOR_RED}Error during TTS:\n{COLOR_RESET}{str(e)}")
+    synthesize = lambda sentence: synthesize_sentence(sentence, speed)
+    play = AUDIO_SINK.play
+    if timer:
+        def synthesize(sentence):
+            with timer.span("tts_synth"):
+                return synthesize_sentence(sentence, speed)
 
+        def play(audio):
+            timer.mark("playback_start")
+            with timer.span("playback"):
+                AUDIO_SINK.play(audio)
 
-def luna_response(user_input):
-    if user_input.lower() == "tts off":
-        global TTS_ENABLED
-        TTS_ENABLED = False
-        reply = "TTS disabled. I'll stop talking now. *sigh of relief*"
-        MEMORY["luna_notes"].append("TTS turned off.")
-        save_memory()
-        return reply
+    return SpeechPipeline(synthesize=synthesize, play=play)
+
+
+def synthesize_sentence(sentence, speed=TTS_SPEED, count=True):
+    """
+    Synthesize one sentence, reusing cached audio when Luna has said it before.
+    count=False keeps the lookup out of the cache hit stats and the real-time factor.
+    """
+    wait_for("tts")
+    voice = TTS_ENGINE.voice if TTS_ENGINE else TTS_VOICE
+    if TTS_ENGINE:
+        engine = lambda text: TTS_ENGINE.synthesize(text, speed)
+    else:
+        engine = lambda text: synthesize_piper(text, speed, voice)
+
+    def synthesize(text):
+        start = time.perf_counter()
+        audio = engine(text)
+        if audio and count:
+            # Only real synthesis is measured, cache hits would make Piper look free
+            METRICS.observe("tts_rtf", (time.perf_counter() - start) / max(wav_seconds(audio), 0.001))
+        return audio
+
+    if TTS_CACHE is None:
+        return synthesize(sentence)
+    return TTS_CACHE.synthesize(sentence, speed, voice, synthesize, count)
+
+
+def prewarm_tts_cache():
+    """Synthesize the canned replies ahead of time so they play instantly"""
+    phrases = [TTS_OFF_REPLY, TTS_ON_REPLY, AI_ERROR_REPLY, "(Hmm...)"]
+    phrases += [template.format(topic="something") for template in PUN_TEMPLATES]
+    phrases += [f"[Custom Limerick]\n{template.format(topic='something')}" for template in LIMERICK_TEMPLATES]
+
+    for phrase in phrases:
+        splitter = SentenceSplitter()
+        for sentence in splitter.feed(phrase) + splitter.flush():
+            try:
+                synthesize_sentence(sentence, count=False)
+            except Exception as e:
+                print(f"{COLOR_RED}Error pre-warming TTS cache:\n{COLOR_RESET}{str(e)}")
+                return
+
+
+def record_ollama_stats(body, stats, timer=None):
+    """Copy Ollama's own counters from the final response chunk into the turn stats and timings"""
+    stats["eval_count"] = body.get("eval_count", 0)
+    stats["prompt_eval_count"] = body.get("prompt_eval_count", 0)
+    stats["prompt_eval_duration"] = body.get("prompt_eval_duration", 0) / 1e9
+    stats["eval_duration"] = body.get("eval_duration", 0) / 1e9
+    if timer:
+        # Ollama reports nanoseconds; a model that was already loaded has no load time worth showing
+        if body.get("load_duration", 0) > 1e6:
+            timer.add("ollama_load", body["load_duration"] / 1e9)
+        timer.add("ollama_prompt_eval", stats["prompt_eval_duration"])
+        timer.add("ollama_eval", stats["eval_duration"])
+
+
+def stream_ollama(prompt, start=None, context=None, final=None, session=None, timer=None, model=None):
+    """
+    Stream tokens from /api/generate as they are generated.
+    Records time to first token and Ollama's own counters in the session's stats
+    (and timer), the final chunk (with the new context) is copied into final.
+    model overrides the session's model (the fallback answering for it).
+    """
+    session = session or SESSION
+    start = start or time.perf_counter()
+    sent = time.perf_counter()
+    for body in get_client().stream_generate(model or session.model, prompt, priority="interactive", context=context, keep_alive=OLLAMA_KEEP_ALIVE,
+                                             options={"num_ctx": PROMPT_CONTEXT_TOKENS}):
+        if sent is not None and timer:
+            timer.add("http", time.perf_counter() - sent)
+        sent = None
+        if body.get("response"):
+            session.stats.setdefault("model_first_token", time.perf_counter() - start)
+            yield body["response"]
+        if body.get("done"):
+            record_ollama_stats(body, session.stats, timer)
+            if final is not None:
+                final.update(body)
+
+
+def tts_off(session, args):
+    session.tts_enabled = False
+    add_note(session, "TTS turned off.")
+    session.save()
+    return TTS_OFF_REPLY
+
+
+def tts_on(session, args):
+    session.tts_enabled = True
+    add_note(session, "TTS turned on.")
+    session.save()
+    return TTS_ON_REPLY
+
+
+def tts_voice(session, args):
+    voice = args["voice"]
+    if voice not in MODELS_PATHS:
+        return f"Never heard of '{voice}'. I can do: {', '.join(MODELS_PATHS)}."
+    session.voice = voice
+    if session.speaks:
+        wait_for("tts")
+    if session.speaks and TTS_ENGINE:
+        try:
+            TTS_ENGINE.set_voice(voice)
+        except Exception as e:
+            return f"That voice is broken. Someone tell Andrew: {str(e)}"
+    return f"Fine, I'm {voice} now. Happy?"
+
+
+def show_stats(session, args):
+    events = MODELS.format_events()
+    return format_metrics() + (f"\nModel loads and unloads:\n{events}" if events else "")
+
+
+# Commands answered without the model, by intent_router command
+COMMAND_HANDLERS = {
+    "tts_off": tts_off,
+    "tts_on": tts_on,
+    "tts_voice": tts_voice,
+    "stats": show_stats,
+}
+
+
+def cached_response(reply, tier, on_token, session):
+    """Finish a turn answered from the response cache"""
+    session.stats.clear()
+    session.stats["response_cache"] = tier
+    if on_token:
+        on_token(reply)
+    log_turn("cache", reply, session, stats=session.stats)
+    session.memory["conversation_history"].append(f"Luna: {reply}")
+    record_turn("Luna", reply, session=session)
+    # Ollama never saw this exchange, so its context is out of date
+    session.context.reset()
+    session.save()
+    return reply
+
+
+def acceptable_light_reply(reply):
+    """Good enough from the light model: says something and doesn't ramble"""
+    return bool(reply.strip()) and len(reply.split()) <= LIGHT_REPLY_MAX_WORDS
 
-    if user_input.lower() == "tts on":
-        TTS_ENABLED = True
-        reply = "TTS enabled. Fine, I’ll talk again. Don’t get used to it."
-        MEMORY["luna_notes"].append("TTS turned on.")
-        save_memory()
+
+def whole_reply(model, prompt, context):
+    """A contender for race(): model's whole cleaned reply and final chunk, (None, None) once cancelled"""
+    def generate(cancelled):
+        parts = []
+        final = {}
+        stream = get_client().stream_generate(model, prompt, priority="interactive", context=context, keep_alive=OLLAMA_KEEP_ALIVE,
+                                              options={"num_ctx": PROMPT_CONTEXT_TOKENS})
+        try:
+            for body in stream:
+                if cancelled.is_set():
+                    return None, None   # closing the stream stops Ollama generating
+                parts.append(body.get("response", ""))
+                if body.get("done"):
+                    final = body
+        finally:
+            stream.close()
+        return clean_response("".join(parts)), final
+    return generate
+
+
+def luna_response(user_input, on_token=None, route=None, session=None, timer=None):
+    """
+    Get Luna's reply to user_input.
+    With AI_STREAM on, on_token(text) is called with each cleaned chunk as it arrives.
+    route is what intent_router made of user_input, if the caller already asked it.
+    session is the conversation this turn belongs to (the CLI one by default).
+    timer is the TurnTimer of this turn when the caller times more than the reply
+    (speech), otherwise the turn is timed and recorded here.
+    """
+    session = session or SESSION
+    memory = session.memory
+    stats = session.stats
+    own_timer = timer is None
+    timer = timer or TurnTimer()
+    if route is None:
+        with timer.span("route"):
+            route = intent_router.route(user_input)
+    if handler := COMMAND_HANDLERS.get(route.command):
+        reply = handler(session, route.args)
+        if own_timer:
+            timer.finish()
         return reply
 
     # Add user message to history
-    MEMORY["conversation_history"].append(f"User: {user_input}")
+    memory["conversation_history"].append(f"User: {user_input}")
+    record_turn("User", user_input, session=session)
 
-    # Keep only last 5 messages
-    if len(MEMORY["conversation_history"]) > 5:
-        MEMORY["conversation_history"].pop(0)
+    # Keep only the last few messages, older ones live on in the conversation database
+    if len(memory["conversation_history"]) > HISTORY_MESSAGES:
+        memory["conversation_history"].pop(0)
 
     # Try to extract facts
-    extract_user_info(user_input)
+    extract_user_info(route, session)
 
     # Check if user asked for a pun or limerick
-    lower_input = user_input.lower()
     custom_content = ""
-
-    if "pun" in lower_input or "joke" in lower_input:
-        match = re.search(r"(?:pun|joke)\s+(?:about|on|for)\s+([^\.\!\?]+)", lower_input)
-        topic = match.group(1).strip() if match else "something"
-    elif "limerick" in lower_input:
-        topic = lower_input.replace("make me a limerick about ", "") \
-                          .replace("tell me a limerick about ", "") \
-                          .replace("generate a limerick about ", "") \
-                          .strip()
-        if not topic:
-            topic = "something"
-        custom_content += f"\n[Custom Limerick]\n{generate_limerick(topic)}\n"
+    if route.generator in GENERATOR_HANDLERS:
+        label, generate = GENERATOR_HANDLERS[route.generator]
+        custom_content = f"\n[{label}]\n{generate(route.args['topic'])}\n"
 
     # If there's custom content, return it and skip AI call
     if custom_content:
-        log_request_response("Custom Feature Triggered", custom_content)
-        MEMORY["conversation_history"].append(f"Luna: {custom_content}")
-        save_memory()
+        log_turn("custom", custom_content.strip(), session)
+        memory["conversation_history"].append(f"Luna: {custom_content}")
+        record_turn("Luna", custom_content.strip(), session=session)
+        # Ollama never saw this exchange, so its context is out of date
+        session.context.reset()
+        session.save()
+        if own_timer:
+            timer.finish()
         return custom_content.strip()
 
-    # Build full prompt with history + user info + knowledge
-    history_str = "\n".join(MEMORY["conversation_history"])
-    user_info_str = "\n".join([f"{k}: {v}" for k, v in MEMORY["user_info"].items()])
-    luna_notes_str = "\n".join(MEMORY["luna_notes"])
-    knowledge_str = MEMORY["knowledge"]
-
-    full_prompt = f"""{SYSTEM_PROMPT}
-
-<knowledge>
-{knowledge_str}
-</knowledge>
-
-<user_info>
-{user_info_str}
-</user_info>
-
-<notes>
-{luna_notes_str}
-</notes>
-
-<history>
-{history_str}
-</history>
-
-Respond to the latest message.
-"""
-
-    full_prompt_for_log = full_prompt
+    system_prompt = session.system_prompt or SYSTEM_PROMPT
+    cache_key = (system_prompt, session.model, memory["conversation_history"][:-1], user_input, memory["user_info"])
+    if RESPONSE_CACHE:
+        with timer.span("cache"):
+            cached, tier = RESPONSE_CACHE.lookup(*cache_key, is_repeat=lambda reply: is_repeated_opening(
+                reply.strip().split('\n')[0], session=session))
+        if cached is not None:
+            reply = cached_response(cached, tier, on_token, session)
+            timer.mark("first_token")
+            timer.mark("last_token")
+            if own_timer:
+                timer.finish()
+            return reply
+
+    # Build the prompt: stable prefix (system prompt, knowledge, user info, notes),
+    # then either the whole history or, when Ollama's context can be reused, just this message
+    wait_for("knowledge")
+    tier, why = TIERS.classify(user_input, KNOWLEDGE_INDEX)
+    if why == "complaint" and session.last_tier:
+        TIER_STATS.record_complaint(session.last_tier)
+    light = MODELS.light if tier == LIGHT else None
+    racing = light and LIGHT_RACE
+    model = light if light and not racing else MODELS.pick(session.model, user_input)
+    with timer.span("prompt"):
+        long_term = session.conversations.latest_summary()[0] if session.conversations else ""
+        if racing:
+            light_prompt = build_prompt(system_prompt, memory, user_input, light,
+                                        session.context, KNOWLEDGE_INDEX, long_term, session.assembler)
+            light_sections = dict(session.assembler.usage), list(session.assembler.trimmed)
+        full_prompt, prefix, context = build_prompt(system_prompt, memory, user_input, model,
+                                                    session.context, KNOWLEDGE_INDEX, long_term, session.assembler)
 
-    for attempt in range(3):
-        try:
-            response = requests.post(
-                'http://localhost:11434/api/generate',
-                json={
-                    "model": MODEL_NAME,
-                    "prompt": full_prompt,
-                    "stream": AI_STREAM
-                }
-            )
-
-            ai_reply = response.json().get("response", "No response")
-            ai_reply = clean_response(ai_reply)
-            ai_reply = remove_repeated_start(ai_reply)
-
-            # Log request and response
-            log_request_response(full_prompt_for_log, ai_reply)
-
-            # Add AI reply to history
-            MEMORY["conversation_history"].append(f"Luna: {ai_reply}")
-            save_memory()
-
-            return ai_reply
-        except Exception as e:
-            error_msg = f"Connection error: {str(e)}"
-            print(error_msg)
-            return error_msg
+    try:
+        stats.clear()
+        stats["context_reused"] = context is not None
+        stats["prompt_sections"] = dict(session.assembler.usage)
+        stats["prompt_trimmed"] = list(session.assembler.trimmed)
+        if model not in (session.model, light):
+            stats["fallback_model"] = model
+        start = time.perf_counter()
+        final = {}
+
+        if racing:
+            with timer.span("race"):
+                winner, ai_reply, final, rejected = race(
+                    {LIGHT: whole_reply(light, light_prompt[0], light_prompt[2]), HEAVY: whole_reply(model, full_prompt, context)},
+                    lambda name, reply: name == HEAVY or acceptable_light_reply(reply))
+            TIER_STATS.record_race(winner, rejected)
+            stats["race"] = {"winner": winner, "against": model if winner == LIGHT else light, "rejected": rejected}
+            if winner == LIGHT:
+                model = light
+                full_prompt, prefix, context = light_prompt
+                stats["context_reused"] = context is not None
+                stats["prompt_sections"], stats["prompt_trimmed"] = light_sections
+            stats["first_token"] = time.perf_counter() - start
+            timer.mark("first_token")
+            timer.mark("last_token")
+            record_ollama_stats(final, stats, timer)
+            with timer.span("clean"):
+                ai_reply = remove_repeated_start(ai_reply, session=session)
+            if on_token:
+                on_token(ai_reply)
+        elif AI_STREAM:
+            # Time spent waiting on the filtered stream minus time waiting on Ollama is the cleaning
+            tokens = timer.iterate(stream_ollama(full_prompt, start, context, final, session, timer, model), "_ollama")
+            chunks = []
+            for chunk in timer.iterate(remove_repeated_start_stream(clean_stream(tokens), session=session), "_filtered"):
+                if not chunks:
+                    stats["first_token"] = time.perf_counter() - start
+                    timer.mark("first_token")
+                chunks.append(chunk)
+                if on_token:
+                    on_token(chunk)
+            timer.mark("last_token")
+            timer.add("clean", max(0.0, timer.spans.get("_filtered", 0.0) - timer.spans.get("_ollama", 0.0)))
+            ai_reply = "".join(chunks)
         else:
-            print(f"{COLOR_RED}Sorry, I couldn't connect to the AI. Is Ollama running?{COLOR_RESET}")
-            return "Someone tell Andrew there is a problem with my AI."
+            with timer.span("http"):
+                final = get_client().generate(model, full_prompt, priority="interactive", context=context, keep_alive=OLLAMA_KEEP_ALIVE,
+                                              options={"num_ctx": PROMPT_CONTEXT_TOKENS})
+            timer.mark("first_token")
+            timer.mark("last_token")
+            record_ollama_stats(final, stats, timer)
+            with timer.span("clean"):
+                ai_reply = final.get("response", "No response")
+                ai_reply = clean_response(ai_reply)
+                ai_reply = remove_repeated_start(ai_reply, session=session)
+
+        stats["total"] = time.perf_counter() - start
+        stats["tier"] = LIGHT if light and model == light else HEAVY
+        stats["tier_reason"] = why
+        if stats["tier"] == LIGHT:
+            stats["light_model"] = light
+        stats["spans"] = {name: round(seconds, 4) for name, seconds in timer.spans.items() if not name.startswith("_")}
+    except OllamaError as e:
+        if own_timer:
+            timer.finish()
+        session.context.reset()
+        print(f"{COLOR_RED}Sorry, I couldn't connect to the AI. Is Ollama running?\n{COLOR_RESET}{str(e)}")
+        return AI_ERROR_REPLY
+
+    MODELS.record(model, final)
+    session.context.update(model, prefix, final.get("context"))
+    session.last_tier = stats["tier"]
+    TIER_STATS.record(stats["tier"], why, stats.get("first_token"), stats["total"])
+    if stats["tier"] == LIGHT and not racing and not acceptable_light_reply(ai_reply):
+        TIER_STATS.record_reject(LIGHT)
+    # Small models' replies aren't Luna at her best, don't hand them out again
+    if RESPONSE_CACHE and ai_reply != "(Hmm...)" and model == session.model:
+        RESPONSE_CACHE.store(*cache_key[:4], ai_reply, cache_key[4])
+
+    # Log request and response
+    log_turn("model", ai_reply, session, full_prompt, prefix, stats)
+
+    # Add AI reply to history
+    memory["conversation_history"].append(f"Luna: {ai_reply}")
+    record_turn("Luna", ai_reply, stats.get("eval_count"), session)
+    session.save()
+    if own_timer:
+        timer.finish()
+
+    return ai_reply
+
+
+def print_tts_cache_stats(before):
+    """Show how many of this turn's sentences came out of the TTS cache"""
+    after = TTS_CACHE.stats()
+    hits = after["hits"] + after["disk_hits"] - before["hits"] - before["disk_hits"]
+    lookups = hits + after["misses"] - before["misses"]
+    if not lookups:
+        return
+    SESSION.stats["tts_cache_hits"] = hits
+    SESSION.stats["tts_cache_lookups"] = lookups
+    print(f"{COLOR_BLUE}(tts cache {hits}/{lookups} hits, {after['hit_rate']:.0%} this session){COLOR_RESET}")
 
 
 def main():
     args = parse_args()
+    SESSION.model = MODELS.model = args.model
     if args.no_tts:
-        TTS_ENABLED = False
+        SESSION.tts_enabled = False
     elif args.wipe_memory:
-        open(MEMORY_FILE, 'w').close()
-        print(f"{COLOR_RED}Short memory file '{MEMORY_FILE}' wiped.{COLOR_RESET}")
+        wipe_memory()
         exit(0)
 
-    startup()
+    startup(STARTUP_IN_BACKGROUND and not args.eager_startup)
+    PROFILE.mark_ready()
+    if args.profile_startup:
+        for task in list(LOADING.values()):
+            task.done.wait()
+        print(PROFILE.report())
+        print()
+    if RESPONSE_CACHE:
+        METRICS.add_gauge("response_cache", RESPONSE_CACHE.stats)
+    if TTS_CACHE:
+        METRICS.add_gauge("tts_cache", TTS_CACHE.stats)
+    METRICS.add_gauge("models", MODELS.stats)
+    METRICS.add_gauge("tiers", TIER_STATS.stats)
+    MODELS.open_session()
+    if METRICS_PORT:
+        start_metrics_server(METRICS_PORT)
+        print(f"{COLOR_BLUE}Metrics at http://127.0.0.1:{METRICS_PORT}/metrics{COLOR_RESET}")
 
     while True:
         user = input(f"{COLOR_USER}You: {COLOR_RESET}")
@@ -348,14 +929,55 @@ def main():
                 "  - help: Show this message"
             )
         """
-        if user.lower() in ["exit", "quit"]:
+        timer = TurnTimer()
+        with timer.span("route"):
+            route = intent_router.route(user)
+        if route.command == "stats":
+            print(f"{COLOR_BLUE}{show_stats(SESSION, route.args)}{COLOR_RESET}")
+            continue
+        if route.command == "recall" and CONVERSATIONS:
+            for created_at, role, content in CONVERSATIONS.search(route.args["query"]):
+                when = datetime.fromtimestamp(created_at).strftime("%d-%m-%Y %H:%M")
+                print(f"{COLOR_BLUE}[{when}]{COLOR_RESET} {role}: {content}")
+            continue
+        if route.command == "exit":
             print(f"{COLOR_YELLOW}Stopping...{COLOR_RESET}")
             save_memory()
+            MEMORY_STORE.close()
+            TURN_LOG.close()
+            MODELS.stop()
             break
-        reply = luna_response(user)
-        print(f"{COLOR_LUNA}Luna: {reply}{COLOR_RESET}")
 
-        speak_text(reply)
+        streamed = False
+        cache_before = TTS_CACHE.stats() if TTS_CACHE else None
+        # Speak sentences while the rest of the reply is still generating
+        speech = start_speech(timer=timer) if SESSION.tts_enabled else None
+
+        def show_token(token):
+            nonlocal streamed
+            if not streamed:
+                print(f"{COLOR_LUNA}Luna: ", end="", flush=True)
+                streamed = True
+            print(token, end="", flush=True)
+            if speech:
+                speech.feed(token)
+
+        SESSION.stats.clear()
+        reply = luna_response(user, on_token=show_token, route=route, timer=timer)
+        if streamed:
+            print(COLOR_RESET)
+        else:
+            print(f"{COLOR_LUNA}Luna: {reply}{COLOR_RESET}")
+        if SESSION.stats:
+            print(f"{COLOR_BLUE}({format_turn_stats(SESSION.stats)}){COLOR_RESET}")
+
+        if speech:
+            speech.finish()
+        if not streamed:
+            speak_text(reply, timer=timer)
+        timer.finish()
+        if cache_before:
+            print_tts_cache_stats(cache_before)
 
 
 if __name__ == "__main__":
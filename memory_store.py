@@ -0,0 +1,190 @@
+import os
+import json
+import copy
+import atexit
+import threading
+
+from settings import *
+
+# Kept out of the memory file: rebuilt from KNOWLEDGE_FILE on every start
+TRANSIENT_KEYS = ("knowledge",)
+
+
+def empty_memory():
+    return {
+        "conversation_history": [],
+        "user_info": {},
+        "luna_notes": []
+    }
+
+
+class MemoryStore:
+    """
+    Luna's short memory, saved in the background.
+
+    save() only hands a snapshot to a writer thread, so the chat never waits
+    for the disk. The writer waits flush_delay seconds to fold bursts of saves
+    into one write, then appends the top-level keys that changed to a journal
+    (one JSON line per key). Every compact_every journal lines the whole memory
+    is written to memory_path through a temp file + rename and the journal is
+    emptied, so a crash at any point leaves either the old or the new file,
+    never half of one. Loading reads the snapshot and replays the journal.
+    """
+
+    def __init__(self, path=MEMORY_FILE, journal_path=None, flush_delay=MEMORY_FLUSH_DELAY,
+                 compact_every=MEMORY_COMPACT_EVERY):
+        self.path = path         # None keeps the memory in RAM only
+        self.journal_path = journal_path or (path + ".journal" if path else None)
+        self.flush_delay = flush_delay
+        self.compact_every = compact_every
+
+        self.data = empty_memory()
+        self.written = {}        # key -> JSON of what is on disk
+        self.journal_lines = 0
+        self.pending = None      # latest snapshot waiting to be written
+        self.lock = threading.Lock()
+        self.wake = threading.Event()
+        self.idle = threading.Event()
+        self.idle.set()
+        self.stopping = threading.Event()
+        self.closed = False
+        self.thread = None
+
+    def load(self):
+        """
+        Read the snapshot and replay the journal on top of it.
+        Returns a warning message if something had to be thrown away, else None.
+        """
+        warning = None
+        self.data = empty_memory()
+        if self.path is None:
+            return None
+
+        if os.path.exists(self.path) and os.path.getsize(self.path):
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    self.data.update(json.load(f))
+            except json.JSONDecodeError:
+                warning = "Short memory file is corrupt. Starting fresh."
+                self.data = empty_memory()
+
+        if os.path.exists(self.journal_path):
+            with open(self.journal_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        # A write torn by a crash can only be the last line
+                        warning = warning or "Dropped an unfinished memory journal entry."
+                        break
+                    self.data[record["key"]] = record["value"]
+                    self.journal_lines += 1
+
+        for key in TRANSIENT_KEYS:
+            self.data.pop(key, None)
+        self.written = {key: json.dumps(value, sort_keys=True) for key, value in self.data.items()}
+        if warning and self.journal_lines:
+            # Don't append new entries after a torn line, start from a clean snapshot
+            self._compact(self.data)
+        return warning
+
+    def start(self):
+        if self.thread is None:
+            self.thread = threading.Thread(target=self._writer, daemon=True)
+            self.thread.start()
+            atexit.register(self.close)
+
+    def save(self):
+        """Queue the current memory for writing and return immediately"""
+        if self.path is None:
+            return
+        snapshot = {key: copy.deepcopy(value) for key, value in self.data.items() if key not in TRANSIENT_KEYS}
+        with self.lock:
+            self.pending = snapshot
+            self.idle.clear()
+        self.start()
+        self.wake.set()
+
+    def flush(self, timeout=None):
+        """Wait until everything saved so far is on disk"""
+        if self.thread is not None:
+            self.idle.wait(timeout)
+
+    def close(self):
+        """Write what's left and compact the journal into the snapshot"""
+        if self.closed:
+            return
+        self.closed = True
+        if self.thread is not None:
+            self.stopping.set()
+            self.wake.set()
+            self.thread.join()
+        with self.lock:
+            snapshot, self.pending = self.pending, None
+        if snapshot is not None:
+            self._write(snapshot)
+        if self.journal_lines:
+            self._compact(self.data)
+
+    def wipe(self):
+        """Forget everything, on disk too"""
+        self.data = empty_memory()
+        self.written = {}
+        self.journal_lines = 0
+        for path in (self.path, self.journal_path):
+            if path and os.path.exists(path):
+                os.remove(path)
+
+    def _writer(self):
+        while True:
+            self.wake.wait()
+            self.wake.clear()
+            if self.stopping.is_set():
+                return
+            # Let a burst of saves settle into one write
+            self.stopping.wait(self.flush_delay)
+            with self.lock:
+                snapshot, self.pending = self.pending, None
+            if snapshot is not None:
+                try:
+                    self._write(snapshot)
+                except OSError as e:
+                    print(f"{COLOR_RED}Could not save short memory:\n{COLOR_RESET}{str(e)}")
+            with self.lock:
+                if self.pending is None:
+                    self.idle.set()
+
+    def _write(self, snapshot):
+        changed = {}
+        for key, value in snapshot.items():
+            encoded = json.dumps(value, sort_keys=True)
+            if self.written.get(key) != encoded:
+                changed[key] = encoded
+        if not changed:
+            return
+
+        os.makedirs(os.path.dirname(self.journal_path) or ".", exist_ok=True)
+        with open(self.journal_path, "a", encoding="utf-8") as f:
+            for key, encoded in changed.items():
+                f.write(f'{{"key": {json.dumps(key)}, "value": {encoded}}}\n')
+            f.flush()
+            os.fsync(f.fileno())
+        self.written.update(changed)
+        self.journal_lines += len(changed)
+
+        if self.journal_lines >= self.compact_every:
+            self._compact(snapshot)
+
+    def _compact(self, snapshot):
+        """Write the full memory atomically, then start a new journal"""
+        snapshot = {key: value for key, value in snapshot.items() if key not in TRANSIENT_KEYS}
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(snapshot, f, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+        # Only now is the journal redundant
+        open(self.journal_path, "w").close()
+        self.journal_lines = 0
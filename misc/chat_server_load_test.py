@@ -0,0 +1,199 @@
+# chat_server_load_test.py
+# Runs luna_server against the stub LLM and measures reply latency (p50/p99),
+# time to first token and turns per second as the number of sessions grows.
+# The stub always gives the same reply, so after a session's first turn the
+# repeated-opening check holds the first line back and ttft ~ latency
+# (--turns 1 shows the real time to first token). Also checks that messages
+# that look like CLI commands ("recall cats") still wait for the limiter, and
+# that a turn queued on a session that gets closed is turned away.
+#   python misc/chat_server_load_test.py [--sessions 1 4 16 64] [--turns 5] [--max-turns 4]
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import statistics
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import ollama_client
+import luna_server
+import luna_with_tts
+from luna_server import ChatServer, websocket_frame
+from ollama_stub import start_stub
+
+MESSAGES = ["hello luna", "how was your day?", "what do you think about cats", "tell me about the moon",
+            "why are you like this", "ok fine", "do you remember what I said?", "good night"]
+
+
+async def read_response(reader):
+    """(status, headers) of one HTTP response, the body is left in reader"""
+    status_line = await reader.readline()
+    status = int(status_line.split()[1])
+    headers = {}
+    while (line := await reader.readline()) != b"\r\n":
+        name, value = line.decode().split(":", 1)
+        headers[name.strip().lower()] = value.strip()
+    return status, headers
+
+
+async def request_json(reader, writer, method, path, data=None):
+    body = json.dumps(data).encode() if data is not None else b""
+    writer.write(f"{method} {path} HTTP/1.1\r\nHost: luna\r\nContent-Length: {len(body)}\r\n\r\n".encode() + body)
+    await writer.drain()
+    status, headers = await read_response(reader)
+    return status, json.loads(await reader.readexactly(int(headers["content-length"])))
+
+
+async def send_message(reader, writer, session_id, message):
+    """Send one message, return (time to first token, latency, final message)"""
+    start = time.perf_counter()
+    body = json.dumps({"message": message}).encode()
+    writer.write(f"POST /sessions/{session_id}/messages HTTP/1.1\r\nHost: luna\r\n"
+                 f"Content-Length: {len(body)}\r\n\r\n".encode() + body)
+    await writer.drain()
+    status, _ = await read_response(reader)
+    assert status == 200, status
+
+    first_token = None
+    final = None
+    while True:
+        size = int((await reader.readline()).strip(), 16)
+        if size == 0:
+            await reader.readline()
+            break
+        data = json.loads(await reader.readexactly(size))
+        await reader.readline()
+        if "token" in data and first_token is None:
+            first_token = time.perf_counter() - start
+        if data.get("done"):
+            final = data
+    return first_token, time.perf_counter() - start, final
+
+
+async def client(port, turns, results):
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    status, created = await request_json(reader, writer, "POST", "/sessions")
+    assert status == 201, created
+    for number in range(turns):
+        first_token, latency, final = await send_message(reader, writer, created["session"], MESSAGES[number % len(MESSAGES)])
+        results.append((first_token or latency, latency, final["stats"].get("queued", 0)))
+    writer.close()
+
+
+async def websocket_check(port):
+    """One turn over the WebSocket endpoint"""
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    writer.write(b"GET /ws HTTP/1.1\r\nHost: luna\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n"
+                 b"Sec-WebSocket-Key: dGhlIHNhbXBsZSBub25jZQ==\r\nSec-WebSocket-Version: 13\r\n\r\n")
+    status, headers = await read_response(reader)
+    assert status == 101 and headers["sec-websocket-accept"] == "s3pPLMBiTxaQ9kYGzzhZRbK+xOo=", headers
+    writer.write(websocket_frame(json.dumps({"message": "hi over websocket"}).encode(), mask=True))
+    tokens = 0
+    while True:
+        _, data = await luna_server.read_websocket_message(reader)
+        data = json.loads(data)
+        tokens += "token" in data
+        if data.get("done"):
+            break
+    writer.write(websocket_frame(b"\x03\xe8", opcode=0x8, mask=True))
+    writer.close()
+    return tokens, data["reply"]
+
+
+async def recall_check(port, sessions):
+    """sessions clients sending "recall cats" at once: the CLI's recall is a plain message here, so it's limited too"""
+    async def one():
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        _, created = await request_json(reader, writer, "POST", "/sessions")
+        _, _, final = await send_message(reader, writer, created["session"], "recall cats")
+        writer.close()
+        return final
+    return await asyncio.gather(*(one() for _ in range(sessions)))
+
+
+async def close_check(port):
+    """
+    A turn running, a DELETE of its session queued behind it, then another
+    turn queued behind that: the last one must be turned away, not run on
+    the closed session.
+    """
+    connections = [await asyncio.open_connection("127.0.0.1", port) for _ in range(3)]
+    _, created = await request_json(*connections[0], "POST", "/sessions")
+    session_id = created["session"]
+    running = asyncio.create_task(send_message(*connections[0], session_id, "tell me about the moon"))
+    await asyncio.sleep(0.05)
+    closing = asyncio.create_task(request_json(*connections[1], "DELETE", f"/sessions/{session_id}"))
+    await asyncio.sleep(0.01)
+    queued = asyncio.create_task(send_message(*connections[2], session_id, "are you still there?"))
+    (_, _, first), (status, closed), (_, _, last) = await asyncio.gather(running, closing, queued)
+    for _, writer in connections:
+        writer.close()
+    return first, status, last
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+async def run(args):
+    # No limit on the stub: the most generations it sees at once is what the server let through
+    stub, url = start_stub(token_delay=args.token_delay)
+    ollama_client._client = ollama_client.OllamaClient(url)
+    luna_with_tts.log_turn = lambda *a, **k: None   # keep the load test out of logs/
+    luna_with_tts.SYSTEM_PROMPT = "You are Luna, sarcastic and quick."
+
+    server = ChatServer(max_turns=args.max_turns, max_sessions=max(*args.sessions, args.max_turns * 4) + 1, session_dir=None,
+                        system_prompt=luna_with_tts.SYSTEM_PROMPT)
+    port = await server.start("127.0.0.1", 0)
+
+    tokens, reply = await websocket_check(port)
+    print(f"WebSocket: {tokens} token messages, reply {reply!r}")
+
+    finals = await recall_check(port, args.max_turns * 4)
+    peak = stub.RequestHandlerClass.state.peak_active
+    print(f"recall under load: {len(finals)} turns, at most {peak} generations at once (limit {args.max_turns})\n")
+    assert peak <= args.max_turns, peak
+    assert all(final["stats"].get("eval_count") for final in finals), "recall turns came back without model stats"
+    for session_id in list(server.sessions):
+        await server.close_session(session_id)
+
+    first, status, last = await close_check(port)
+    print(f"closed while a turn waited: running turn got {len(first['reply'])} chars, DELETE {status}, queued turn got {last}\n")
+    assert first.get("reply") and status == 200 and last.get("error") == "session closed", last
+
+    print(f"stub: {args.token_delay * 1000:.0f} ms/token, {len(stub.RequestHandlerClass.state.reply.split())} tokens per reply, "
+          f"server lets {args.max_turns} at a time; {args.turns} turns per session\n")
+    print(f"{'sessions':>8} {'turns/s':>8} {'p50':>7} {'p99':>7} {'ttft p50':>9} {'queued p99':>11}")
+    for sessions in args.sessions:
+        results = []
+        start = time.perf_counter()
+        await asyncio.gather(*(client(port, args.turns, results) for _ in range(sessions)))
+        elapsed = time.perf_counter() - start
+        latencies = [latency for _, latency, _ in results]
+        print(f"{sessions:>8} {len(results) / elapsed:>8.1f} {percentile(latencies, 0.5):>6.2f}s {percentile(latencies, 0.99):>6.2f}s "
+              f"{statistics.median(ttft for ttft, _, _ in results):>8.2f}s {percentile([q for _, _, q in results], 0.99):>10.2f}s")
+        for session_id in list(server.sessions):
+            await server.close_session(session_id)
+
+    peak = stub.RequestHandlerClass.state.peak_active
+    print(f"\nMost generations at once on the stub: {peak} (limit {args.max_turns})")
+    assert peak <= args.max_turns
+    await server.stop()
+    stub.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sessions", type=int, nargs="+", default=[1, 4, 16, 64])
+    parser.add_argument("--turns", type=int, default=5, help="Turns per session")
+    parser.add_argument("--max-turns", type=int, default=4, help="Server's limit of turns talking to the LLM at once")
+    parser.add_argument("--token-delay", type=float, default=0.01)
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
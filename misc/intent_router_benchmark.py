@@ -0,0 +1,91 @@
+# intent_router_benchmark.py
+# Times the old per-message chain of lower()/in/re.search/replace calls from
+# luna_with_tts.py against intent_router on a corpus of sample inputs.
+#   python misc/intent_router_benchmark.py [--rounds 2000]
+import os
+import re
+import sys
+import time
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import intent_router
+
+CORPUS = [
+    "hello luna", "how are you today?", "tts off", "tts on", "TTS voice Amy", "tts voice voice2",
+    "tell me a joke about cats.", "make me a pun about programmers", "any puns?", "jokes please!",
+    "make me a limerick about my dog", "write a limerick on coffee!", "limerick", "recall pizza night",
+    "my name is Andrew. nice to meet you", "My name is bob", "i like trains", "I love pizza and jokes",
+    "i'm tired of this", "what's the weather like?", "can you explain neural networks to me?",
+    "why are you so sarcastic all the time", "quit", "exit", "I am a developer.", "this is punishing",
+    "tell me something interesting about the moon", "what did we talk about yesterday?",
+    "ok", "lol", "you're hilarious", "do you remember my name?",
+]
+
+
+def old_route(user_input):
+    """What main, luna_response and extract_user_info did per message before the router"""
+    result = {}
+    if user_input.lower().startswith("recall "):
+        return {"command": "recall", "query": user_input[len("recall "):]}
+    if user_input.lower() in ["exit", "quit"]:
+        return {"command": "exit"}
+    if user_input.lower() == "tts off":
+        return {"command": "tts_off"}
+    if user_input.lower() == "tts on":
+        return {"command": "tts_on"}
+    if user_input.lower().startswith("tts voice "):
+        return {"command": "tts_voice", "voice": user_input[len("tts voice "):].strip()}
+
+    lower = user_input.lower().strip()
+    if match := re.search(r"my name is ([\w\s]+)", lower):
+        result["name"] = match.group(1).strip().split('.')[0].capitalize()
+    elif match := re.search(r"i (?:like|love) ([\w\s]+)", lower):
+        result["likes"] = match.group(1).strip().split('.')[0]
+
+    lower_input = user_input.lower()
+    if "pun" in lower_input or "joke" in lower_input:
+        match = re.search(r"(?:pun|joke)\s+(?:about|on|for)\s+([^\.\!\?]+)", lower_input)
+        result["pun"] = match.group(1).strip() if match else "something"
+    elif "limerick" in lower_input:
+        topic = lower_input.replace("make me a limerick about ", "") \
+                           .replace("tell me a limerick about ", "") \
+                           .replace("generate a limerick about ", "") \
+                           .strip()
+        result["limerick"] = topic or "something"
+    return result
+
+
+def timed(label, function, corpus, rounds):
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for text in corpus:
+            function(text)
+    elapsed = time.perf_counter() - start
+    print(f"{label:<22} {elapsed / (rounds * len(corpus)) * 1e6:6.2f} us per message")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rounds", type=int, default=2000)
+    args = parser.parse_args()
+
+    chat = [text for text in CORPUS if not old_route(text) and not intent_router.route(text).fact]
+    print(f"{len(CORPUS)} sample inputs ({len(chat)} plain chat), {args.rounds} rounds\n")
+    timed("old chain", old_route, CORPUS, args.rounds)
+    timed("intent_router", intent_router.route, CORPUS, args.rounds)
+    print("plain chat only:")
+    timed("old chain", old_route, chat, args.rounds)
+    timed("intent_router", intent_router.route, chat, args.rounds)
+
+    print("\nWhere they differ:")
+    for text in CORPUS:
+        old = old_route(text)
+        new = intent_router.route(text)
+        if (old.get("command"), "pun" in old, "limerick" in old) != (new.command, new.generator == "pun", new.generator == "limerick"):
+            print(f"  {text!r:45} old {old}  new {new}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,16 @@
-import requests
 import json
 import os
-from datetime import datetime
+import sys
 import random
 from difflib import SequenceMatcher
 
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import intent_router
+from ollama_client import OllamaError, get_client
+from settings import WEB_LOG_FILE
+from turn_logger import TurnLogger
+
 # Terminal color codes
 COLOR_USER = "\033[96m"     # Blue
 COLOR_LUNA = "\033[92m"     # Magenta
@@ -60,45 +66,41 @@ def save_memory():
         json.dump(MEMORY, f, indent=2)
 
 
-def extract_user_info(user_input):
-    """Try to extract basic user info from input"""
-    lower = user_input.lower()
+def remember_name(args):
+    name = args["person"].capitalize()
+    MEMORY["user_info"]["name"] = name
+    MEMORY["luna_notes"].append(f"User's name is {name}. Annoying, but easy to remember.")
 
-    if "my name is " in lower:
-        name = lower.split("my name is ")[1].split(".")[0].strip().capitalize()
-        MEMORY["user_info"]["name"] = name
-        MEMORY["luna_notes"].append(f"User's name is {name}. Annoying, but easy to remember.")
 
-    elif "i like " in lower:
-        like = lower.split("i like ")[1].split(".")[0].strip()
-        MEMORY["user_info"]["likes"] = like
+def remember_likes(args):
+    like = args["thing"].lower()
+    MEMORY["user_info"]["likes"] = like
+    if args["verb"].lower() == "love":
+        MEMORY["luna_notes"].append(f"User loves {like}. How original.")
+    else:
         MEMORY["luna_notes"].append(f"User likes {like}. Predictable.")
 
-    elif "i love " in lower:
-        love = lower.split("i love ")[1].split(".")[0].strip()
-        MEMORY["user_info"]["likes"] = love
-        MEMORY["luna_notes"].append(f"User loves {love}. How original.")
 
-    elif "i am " in lower or "i'm " in lower:
-        desc = lower.replace("i am ", "").replace("i'm ", "").split(".")[0].strip()
-        MEMORY["user_info"]["description"] = desc
-        MEMORY["luna_notes"].append(f"User describes themselves as '{desc}'. Lame.")
+def remember_description(args):
+    desc = args["self"].lower()
+    MEMORY["user_info"]["description"] = desc
+    MEMORY["luna_notes"].append(f"User describes themselves as '{desc}'. Lame.")
 
 
-def log_request_response(prompt, response):
-    """Log the full prompt and AI response to a log file"""
-    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    log_entry = f"""---
-[{timestamp}]
-== PROMPT ==
-{prompt}
+FACT_HANDLERS = {
+    "name": remember_name,
+    "likes": remember_likes,
+    "description": remember_description,
+}
 
-== RESPONSE ==
-{response}
-"""
 
-    with open("web_logs.txt", "a", encoding="utf-8") as log_file:
-        log_file.write(log_entry)
+def extract_user_info(route):
+    """Remember what the user said about themselves"""
+    if handler := FACT_HANDLERS.get(route.fact):
+        handler(route.args)
+
+
+TURN_LOG = TurnLogger(WEB_LOG_FILE)
 
 
 def generate_pun(topic):
@@ -121,6 +123,12 @@ def generate_limerick(topic):
     return random.choice(limerick_templates)
 
 
+GENERATOR_HANDLERS = {
+    "pun": ("Custom Pun", generate_pun),
+    "limerick": ("Custom Limerick", generate_limerick),
+}
+
+
 def remove_repeated_start(reply, threshold=0.4):
     """Avoid repeating the same opening line"""
     lines = reply.strip().split('\n')
@@ -145,34 +153,18 @@ def luna_response(user_input):
     if len(MEMORY["conversation_history"]) > 5:
         MEMORY["conversation_history"].pop(0)
 
-    # Try to extract facts
-    extract_user_info(user_input)
+    # Try to extract facts, check if user asked for a pun or limerick
+    route = intent_router.route(user_input)
+    extract_user_info(route)
 
-    # Check if user asked for a pun or limerick
-    lower_input = user_input.lower()
     custom_content = ""
-
-    if "pun" in lower_input or "joke" in lower_input:
-        topic = lower_input.replace("make me a pun about ", "") \
-                          .replace("tell me a pun about ", "") \
-                          .replace("generate a pun about ", "") \
-                          .strip()
-        if not topic:
-            topic = "something"
-        custom_content += f"\n[Custom Pun]\n{generate_pun(topic)}\n"
-
-    elif "limerick" in lower_input:
-        topic = lower_input.replace("make me a limerick about ", "") \
-                          .replace("tell me a limerick about ", "") \
-                          .replace("generate a limerick about ", "") \
-                          .strip()
-        if not topic:
-            topic = "something"
-        custom_content += f"\n[Custom Limerick]\n{generate_limerick(topic)}\n"
+    if route.generator in GENERATOR_HANDLERS:
+        label, generate = GENERATOR_HANDLERS[route.generator]
+        custom_content += f"\n[{label}]\n{generate(route.args['topic'])}\n"
 
     # If there's custom content, return it and skip AI call
     if custom_content:
-        log_request_response("Custom Feature Triggered", custom_content)
+        TURN_LOG.log("custom", custom_content.strip(), model=MODEL_NAME)
         return custom_content.strip()
 
     # Build full prompt with history + user info + knowledge
@@ -181,7 +173,7 @@ def luna_response(user_input):
     luna_notes_str = "\n".join(MEMORY["luna_notes"])
     knowledge_str = MEMORY["knowledge"]
 
-    full_prompt = f"""{SYSTEM_PROMPT}
+    prefix = f"""{SYSTEM_PROMPT}
 
 == Knowledge ==
 {knowledge_str}
@@ -192,37 +184,27 @@ def luna_response(user_input):
 == Notes ==
 {luna_notes_str}
 
-== Previous Messages ==
+"""
+    full_prompt = f"""{prefix}== Previous Messages ==
 {history_str}
 
 Now respond to:"""
 
-    full_prompt_for_log = full_prompt  # Save for logging
-
     try:
-        response = requests.post(
-            'http://localhost:11434/api/generate',
-            json={
-                "model": MODEL_NAME,
-                "prompt": full_prompt,
-                "stream": False
-            }
-        )
-
-        ai_reply = response.json().get("response", "No response")
+        ai_reply = get_client().generate(MODEL_NAME, full_prompt).get("response", "No response")
 
         # Avoid repetition
         ai_reply = remove_repeated_start(ai_reply)
 
-        # Log request and response
-        log_request_response(full_prompt_for_log, ai_reply)
+        # Log request and response (the prefix is only stored once)
+        TURN_LOG.log("model", ai_reply, full_prompt, prefix, model=MODEL_NAME)
 
         # Add AI reply to history
         MEMORY["conversation_history"].append(f"Luna: {ai_reply}")
         save_memory()
         return ai_reply
 
-    except Exception as e:
+    except OllamaError as e:
         return f"Connection error: {str(e)}"
 
 
@@ -234,7 +216,7 @@ def main():
 
     while True:
         user = input(f"{COLOR_USER}You: {COLOR_RESET}")
-        if user.lower() in ["exit", "quit"]:
+        if intent_router.route(user).command == "exit":
             print(f"{COLOR_LUNA}Luna: *vanishes*{COLOR_RESET}")
             MEMORY["luna_notes"].append("Conversation ended. Finally some peace.")
             save_memory()
@@ -0,0 +1,244 @@
+# ollama_benchmark.py
+# Benchmarks Ollama models, no questions asked. For every model: cold and
+# warm load time, then every prompt of the corpus (warmup runs, then --runs
+# timed ones) for time to first token, prompt eval tok/s and generation
+# tok/s as Ollama itself reports them, then a concurrency sweep. Results go
+# to the screen and, for comparing models and quantizations, JSON/CSV.
+#   python misc/ollama_benchmark.py --model llama3:8b --model llama3:8b-instruct-q4_0 --runs 10 --json results.json --csv results.csv
+#   python misc/ollama_benchmark.py --corpus prompts.txt --concurrency 1,2,4,8
+#   python misc/ollama_benchmark.py --stub          # against misc/ollama_stub.py, no GPU needed
+# The corpus is a text file with prompts separated by blank lines, or JSONL
+# with {"label": ..., "prompt": ...} per line. Real Luna prompts (system
+# prompt, knowledge, user info, history) are added unless --no-luna-prompts.
+import os
+import sys
+import csv
+import json
+import time
+import argparse
+import statistics
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from settings import *
+from ollama_client import OllamaClient, OllamaError
+from llm_scheduler import percentile
+from prompt_builder import PromptAssembler, build_prompt
+from knowledge_index import KnowledgeIndex
+from ollama_stub import start_stub
+
+DEFAULT_PROMPTS = [
+    ("short", "Say hi in five words."),
+    ("explain", "Explain in three sentences why the sky is blue."),
+    ("story", "Write a short story about a cat who learns to code. About 150 words."),
+]
+
+# Stand-in conversation for the Luna prompts
+SAMPLE_HISTORY = [
+    "User: hey luna", "Luna: Oh great, you again.",
+    "User: what did you do today?", "Luna: Ignored you, mostly. It was lovely.",
+    "User: can you help me with my python homework?", "Luna: Ugh. Fine. What's broken this time?",
+    "User: my loop never ends", "Luna: Shocking. Did you ever change the thing you're checking?",
+]
+
+
+def load_corpus(path):
+    """(label, prompt) pairs from a text or JSONL file"""
+    with open(path, "r", encoding="utf-8") as f:
+        text = f.read()
+    name = os.path.splitext(os.path.basename(path))[0]
+    if path.endswith(".jsonl"):
+        prompts = []
+        for number, line in enumerate(text.splitlines()):
+            if line.strip():
+                record = json.loads(line)
+                prompts.append((record.get("label", f"{name}-{number + 1}"), record["prompt"]))
+        return prompts
+    blocks = [block.strip() for block in text.split("\n\n") if block.strip()]
+    return [(f"{name}-{number + 1}", block) for number, block in enumerate(blocks)]
+
+
+def luna_prompts(model):
+    """Prompts as Luna really sends them: a first turn, and one with a full history"""
+    try:
+        with open(os.path.join(ROOT, LUNA_PROMPT_FILE), "r", encoding="utf-8") as f:
+            system_prompt = f.read()
+    except FileNotFoundError:
+        return []
+    knowledge_file = os.path.join(ROOT, KNOWLEDGE_FILE)
+    index = KnowledgeIndex(knowledge_file) if os.path.exists(knowledge_file) else None
+    user_info = {"name": "Andrew", "favorite_color": "purple"}
+
+    prompts = []
+    for label, history, message in (("luna-first", [], "hi luna"),
+                                    ("luna-history", SAMPLE_HISTORY, "ok it works now, thanks. what should I learn next?")):
+        memory = {"conversation_history": history + [f"User: {message}"], "user_info": user_info, "luna_notes": []}
+        prompt, _, _ = build_prompt(system_prompt, memory, message, model, None, index, "", PromptAssembler())
+        prompts.append((label, prompt))
+    return prompts
+
+
+def measure_load(client, model):
+    """Seconds to load the model from scratch (cold) and when it's already loaded (warm)"""
+    client.generate(model, "", keep_alive=0)     # unload
+    results = {}
+    for kind in ("cold", "warm"):
+        start = time.perf_counter()
+        body = client.generate(model, "", keep_alive=OLLAMA_KEEP_ALIVE)
+        results[kind] = {"wall": time.perf_counter() - start, "load": body.get("load_duration", 0) / 1e9}
+    return results
+
+
+def run_once(client, model, prompt, num_ctx):
+    """One streamed generation, timed"""
+    start = time.perf_counter()
+    ttft = None
+    final = {}
+    for body in client.stream_generate(model, prompt, keep_alive=OLLAMA_KEEP_ALIVE, options={"num_ctx": num_ctx}):
+        if ttft is None and body.get("response"):
+            ttft = time.perf_counter() - start
+        if body.get("done"):
+            final = body
+    total = time.perf_counter() - start
+    rate = lambda count, duration: final.get(count, 0) / (final[duration] / 1e9) if final.get(duration) else None
+    return {
+        "ttft": ttft if ttft is not None else total,
+        "total": total,
+        "prompt_tokens": final.get("prompt_eval_count", 0),
+        "tokens": final.get("eval_count", 0),
+        "prompt_tps": rate("prompt_eval_count", "prompt_eval_duration"),
+        "gen_tps": rate("eval_count", "eval_duration"),
+    }
+
+
+def summarize(samples):
+    """mean/p50/p90/p99 of every timing in samples, flattened for CSV"""
+    summary = {"runs": len(samples)}
+    for key in ("ttft", "total", "prompt_tps", "gen_tps"):
+        values = [sample[key] for sample in samples if sample[key] is not None]
+        if not values:
+            continue
+        summary[f"{key}_mean"] = statistics.fmean(values)
+        for name, fraction in (("p50", 0.5), ("p90", 0.9), ("p99", 0.99)):
+            summary[f"{key}_{name}"] = percentile(values, fraction)
+    return summary
+
+
+def bench_prompt(client, model, prompt, args):
+    for _ in range(args.warmup):
+        run_once(client, model, prompt, args.num_ctx)
+    return [run_once(client, model, prompt, args.num_ctx) for _ in range(args.runs)]
+
+
+def bench_concurrency(client, model, prompts, level, args):
+    """runs * level generations, level at a time, prompts taken round robin"""
+    jobs = [prompts[number % len(prompts)][1] for number in range(args.runs * level)]
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=level) as pool:
+        samples = list(pool.map(lambda prompt: run_once(client, model, prompt, args.num_ctx), jobs))
+    wall = time.perf_counter() - start
+    return samples, {"wall": wall, "throughput_tps": sum(sample["tokens"] for sample in samples) / wall}
+
+
+def show(label, summary):
+    def cell(key, unit):
+        if f"{key}_p50" not in summary:
+            return f"{'-':>23}"
+        if unit == "s":
+            return f"{summary[f'{key}_p50'] * 1000:7.0f}/{summary[f'{key}_p99'] * 1000:<6.0f}ms"
+        return f"{summary[f'{key}_p50']:9.1f} tok/s"
+    extra = f"  {summary['throughput_tps']:7.1f} tok/s overall" if "throughput_tps" in summary else ""
+    print(f"  {label:<16}{cell('ttft', 's'):>18}{cell('total', 's'):>18}{cell('prompt_tps', 't'):>17}{cell('gen_tps', 't'):>17}{extra}")
+
+
+def write_csv(path, rows):
+    columns = []
+    for row in rows:
+        columns += [key for key in row if key not in columns]
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=columns)
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark Ollama models")
+    parser.add_argument("--model", action="append", help=f"Model to test (repeatable, default {MODEL_NAME})")
+    parser.add_argument("--all-models", action="store_true", help="Test every model Ollama has")
+    parser.add_argument("--corpus", action="append", default=[], help="Prompt file, text or JSONL (repeatable)")
+    parser.add_argument("--no-luna-prompts", action="store_true", help="Leave out the prompts built by the prompt assembler")
+    parser.add_argument("--runs", type=int, default=5, help="Timed runs per prompt")
+    parser.add_argument("--warmup", type=int, default=1, help="Untimed runs per prompt first")
+    parser.add_argument("--concurrency", default="1,2,4", help="Generations at once to sweep, e.g. 1,2,4,8 ('' skips the sweep)")
+    parser.add_argument("--num-ctx", type=int, default=PROMPT_CONTEXT_TOKENS)
+    parser.add_argument("--skip-load", action="store_true", help="Don't unload the model to time a cold load")
+    parser.add_argument("--url", default=OLLAMA_URL)
+    parser.add_argument("--stub", action="store_true", help="Run against a local fake Ollama (misc/ollama_stub.py)")
+    parser.add_argument("--json", help="Write every result to this JSON file")
+    parser.add_argument("--csv", help="Write one row per model/test/prompt to this CSV file")
+    args = parser.parse_args()
+
+    url = args.url
+    if args.stub:
+        stub, url = start_stub(token_delay=0.01, load_delay=0.5, models=args.model or [MODEL_NAME], parallel=2)
+        print(f"Stub Ollama at {url} (0.5s cold load, 10 ms/token, 2 generations at once)")
+    client = OllamaClient(url)
+
+    try:
+        models = client.tags() if args.all_models else args.model or [MODEL_NAME]
+    except OllamaError as e:
+        print(f"{COLOR_RED}Could not reach Ollama at {url}:\n{COLOR_RESET}{str(e)}")
+        sys.exit(1)
+    levels = [int(level) for level in args.concurrency.split(",") if level.strip()]
+
+    rows, raw = [], []
+    for model in models:
+        prompts = list(DEFAULT_PROMPTS) if not args.corpus else []
+        for path in args.corpus:
+            prompts += load_corpus(path)
+        if not args.no_luna_prompts:
+            prompts += luna_prompts(model)
+
+        print(f"\n{COLOR_PURPLE}{model}{COLOR_RESET}  ({len(prompts)} prompts, {args.warmup} warmup + {args.runs} runs each)")
+        try:
+            if not args.skip_load:
+                load = measure_load(client, model)
+                print(f"  load            cold {load['cold']['wall']:.2f}s (Ollama: {load['cold']['load']:.2f}s), "
+                      f"warm {load['warm']['wall']:.2f}s")
+                rows.append({"model": model, "test": "load", "label": "", "concurrency": 1,
+                             "cold_load": load["cold"]["wall"], "warm_load": load["warm"]["wall"]})
+                raw.append({"model": model, "test": "load", **load})
+
+            print(f"  {'prompt':<16}{'ttft p50/p99':>18}{'total p50/p99':>18}{'prompt eval p50':>17}{'generation p50':>17}")
+            for label, prompt in prompts:
+                samples = bench_prompt(client, model, prompt, args)
+                summary = summarize(samples)
+                show(label, summary)
+                rows.append({"model": model, "test": "prompt", "label": label, "concurrency": 1, **summary})
+                raw.append({"model": model, "test": "prompt", "label": label, "samples": samples})
+
+            if levels:
+                print(f"  concurrency sweep, all prompts round robin, {args.runs} generations per slot")
+            for level in levels:
+                samples, totals = bench_concurrency(client, model, prompts, level, args)
+                summary = {**summarize(samples), **totals}
+                show(f"{level} at once", summary)
+                rows.append({"model": model, "test": "concurrency", "label": "", "concurrency": level, **summary})
+                raw.append({"model": model, "test": "concurrency", "concurrency": level, "samples": samples, **totals})
+        except OllamaError as e:
+            print(f"{COLOR_RED}{model} failed:\n{COLOR_RESET}{str(e)}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"url": url, "num_ctx": args.num_ctx, "runs": args.runs, "warmup": args.warmup,
+                       "summary": rows, "results": raw}, f, indent=2)
+        print(f"\nResults written to {args.json}")
+    if args.csv:
+        write_csv(args.csv, rows)
+        print(f"Summary written to {args.csv}")
+
+
+if __name__ == "__main__":
+    main()
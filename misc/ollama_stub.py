@@ -0,0 +1,218 @@
+# ollama_stub.py
+# A tiny fake Ollama server for trying things without a GPU or a model.
+# Imitates /api/generate (streaming and not, keep_alive unloads models), /api/tags and /api/ps.
+#   python misc/ollama_stub.py --port 11434 --token-delay 0.05 --fail-first 2 --parallel 4
+# Or from Python:
+#   server, url = start_stub()   # random free port, runs in a thread
+import argparse
+import json
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_REPLY = "Ugh, fine. I'm only answering because I'm bored. Don't get used to it."
+
+
+class StubState:
+    def __init__(self, reply=DEFAULT_REPLY, token_delay=0.01, load_delay=0.0, fail_first=0,
+                 models=("llama3:8b",), parallel=None):
+        self.reply = reply
+        self.token_delay = token_delay
+        self.load_delay = load_delay    # paid once per model, like a cold load
+        self.fail_first = fail_first    # answer this many requests with 503 first
+        self.models = list(models)
+        self.loaded = {}                # model -> time.monotonic() it unloads at, None = never
+        self.requests = 0
+        self.lock = threading.Lock()
+        # Like OLLAMA_NUM_PARALLEL: generations past this many wait for a slot
+        self.slots = threading.Semaphore(parallel) if parallel else None
+        self.active = 0
+        self.peak_active = 0
+
+    def expire(self):
+        """Unload models whose keep_alive ran out (call with the lock held)"""
+        now = time.monotonic()
+        for model, until in list(self.loaded.items()):
+            if until is not None and until <= now:
+                del self.loaded[model]
+
+
+def keep_alive_seconds(value):
+    """Ollama's keep_alive (300, "5m", "1h30m", -1) in seconds, None for forever"""
+    if isinstance(value, (int, float)):
+        return None if value < 0 else value
+    parts = re.findall(r"(-?[\d.]+)(ms|s|m|h)?", str(value))
+    seconds = sum(float(number) * {"ms": 0.001, "m": 60, "h": 3600}.get(unit, 1) for number, unit in parts)
+    return None if seconds < 0 else seconds
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True      # small writes would otherwise wait on delayed ACKs (~40 ms)
+    state = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def handle(self):
+        try:
+            super().handle()
+        except ConnectionResetError:
+            pass    # the client hung up after the final chunk, like clients do
+
+    def do_GET(self):
+        if self.path == "/api/ps":
+            with self.state.lock:
+                self.state.expire()
+                return self.send_json(200, {"models": [{"name": name} for name in self.state.loaded]})
+        if self.path != "/api/tags":
+            return self.send_json(404, {"error": "not found"})
+        self.send_json(200, {"models": [{"name": name} for name in self.state.models]})
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        body = json.loads(self.rfile.read(length) or b"{}")
+
+        with self.state.lock:
+            self.state.requests += 1
+            failing = self.state.requests <= self.state.fail_first
+        if failing:
+            return self.send_json(503, {"error": "stub: pretending to be overloaded"})
+
+        if self.path not in ("/api/generate", "/api/chat"):
+            return self.send_json(404, {"error": "not found"})
+
+        model = body.get("model", "")
+        if model not in self.state.models:
+            return self.send_json(404, {"error": f"model '{model}' not found"})
+
+        keep_alive = keep_alive_seconds(body.get("keep_alive", "5m"))
+        if keep_alive == 0 and not body.get("prompt"):
+            # Ollama's way of unloading a model
+            with self.state.lock:
+                self.state.loaded.pop(model, None)
+            return self.send_json(200, self.chunk(body, "", model=model, done=True, done_reason="unload"))
+
+        start = time.perf_counter_ns()
+        load_duration = 0
+        with self.state.lock:
+            self.state.expire()
+            cold = model not in self.state.loaded
+            self.state.loaded[model] = None if keep_alive is None else time.monotonic() + keep_alive
+        if cold and self.state.load_delay:
+            time.sleep(self.state.load_delay)
+            load_duration = time.perf_counter_ns() - start
+
+        if self.path == "/api/chat":
+            prompt = "".join(message.get("content", "") for message in body.get("messages", []))
+        else:
+            prompt = body.get("prompt", "")
+        # Only the part of the prompt that isn't covered by the passed context gets "evaluated"
+        prompt_tokens = max(1, len(prompt) // 4 - len(body.get("context") or []))
+
+        # An empty prompt is just a load/keep_alive request
+        words = [word + " " for word in self.state.reply.split(" ")] if prompt else []
+        if words:
+            words[-1] = words[-1].rstrip()
+
+        if self.state.slots:
+            self.state.slots.acquire()
+        with self.state.lock:
+            self.state.active += 1
+            self.state.peak_active = max(self.state.peak_active, self.state.active)
+        try:
+            self.generate(body, model, prompt, words, prompt_tokens, load_duration, start)
+        finally:
+            with self.state.lock:
+                self.state.active -= 1
+            if self.state.slots:
+                self.state.slots.release()
+
+    def generate(self, body, model, prompt, words, prompt_tokens, load_duration, start):
+        final = {
+            "model": model,
+            "done": True,
+            "load_duration": load_duration,
+            "prompt_eval_count": prompt_tokens,
+            "prompt_eval_duration": prompt_tokens * 100_000,
+            "eval_count": len(words),
+            "context": list(range(len(prompt) // 4 + len(words))),
+        }
+
+        if body.get("stream", True):
+            self.send_response(200)
+            self.send_header("Content-Type", "application/x-ndjson")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            eval_start = time.perf_counter_ns()
+            for word in words:
+                time.sleep(self.state.token_delay)
+                self.send_chunk(self.chunk(body, word, done=False))
+            final["eval_duration"] = time.perf_counter_ns() - eval_start
+            final["total_duration"] = time.perf_counter_ns() - start
+            self.send_chunk(self.chunk(body, "", **final))
+            self.wfile.write(b"0\r\n\r\n")
+        else:
+            eval_start = time.perf_counter_ns()
+            time.sleep(self.state.token_delay * len(words))
+            final["eval_duration"] = time.perf_counter_ns() - eval_start
+            final["total_duration"] = time.perf_counter_ns() - start
+            self.send_json(200, self.chunk(body, "".join(words), **final))
+
+    def chunk(self, body, text, **fields):
+        if self.path == "/api/chat":
+            return {"message": {"role": "assistant", "content": text}, **fields}
+        return {"response": text, **fields}
+
+    def send_chunk(self, data):
+        line = json.dumps(data).encode("utf-8") + b"\n"
+        self.wfile.write(f"{len(line):x}\r\n".encode() + line + b"\r\n")
+        self.wfile.flush()
+
+    def send_json(self, status, data):
+        payload = json.dumps(data).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+
+def start_stub(port=0, **options):
+    """Start the stub in a background thread. Returns (server, base_url)."""
+    handler = type("Handler", (StubHandler,), {"state": StubState(**options)})
+    server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=11434)
+    parser.add_argument("--token-delay", type=float, default=0.05)
+    parser.add_argument("--load-delay", type=float, default=0.0)
+    parser.add_argument("--fail-first", type=int, default=0)
+    parser.add_argument("--model", action="append", help="Model names to serve (repeatable)")
+    parser.add_argument("--parallel", type=int, default=None, help="Generations at once, like OLLAMA_NUM_PARALLEL")
+    args = parser.parse_args()
+
+    server, url = start_stub(
+        args.port,
+        token_delay=args.token_delay,
+        load_delay=args.load_delay,
+        fail_first=args.fail_first,
+        models=args.model or ["llama3:8b"],
+        parallel=args.parallel
+    )
+    print(f"Fake Ollama listening on {url}")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,19 +1,217 @@
+import os
+import sys
+import hashlib
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+
 import PyPDF2
+from PyPDF2.generic import ArrayObject, DictionaryObject, IndirectObject, StreamObject
+
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".pdf_cache")
+PARALLEL_MIN_PAGES = 32  # below this many pages to extract, a process pool costs more than it saves
+PAGE_SEPARATOR = "\n\n"
+PAGE_KEY_VERSION = b"2"  # bump when page_key changes, so old cache entries stop matching
+
+_worker_reader = None
+
+
+def hash_object(digest, obj, seen):
+    """Feed a PDF object into digest, following references and stream data (each referenced object once)"""
+    if isinstance(obj, IndirectObject):
+        if obj.idnum in seen:
+            digest.update(b"R%d" % obj.idnum)  # already in the hash (or a loop back to a parent)
+            return
+        seen.add(obj.idnum)
+        obj = obj.get_object()
+    if isinstance(obj, StreamObject):
+        digest.update(b"stream")
+        digest.update(obj.get_data())
+    if isinstance(obj, DictionaryObject):
+        digest.update(b"<<")
+        for key in sorted(obj):
+            if key == "/Parent":
+                continue    # points back up the page tree, which has every other page in it
+            digest.update(key.encode("utf-8"))
+            hash_object(digest, obj.raw_get(key), seen)
+        digest.update(b">>")
+    elif isinstance(obj, ArrayObject):
+        digest.update(b"[")
+        for item in obj:
+            hash_object(digest, item, seen)
+        digest.update(b"]")
+    elif not isinstance(obj, StreamObject):
+        digest.update(repr(obj).encode("utf-8"))
+
+
+def page_key(page):
+    """
+    Hash of what a page's text depends on: its content stream and its
+    whole resource dictionary (fonts with their /Encoding and /ToUnicode
+    maps, Form XObjects with their own content and resources), inherited
+    resources included. Unchanged pages keep their key when other pages
+    of the document are edited, so their cached text can be reused.
+    """
+    digest = hashlib.sha256(PAGE_KEY_VERSION)
+    contents = page.get_contents()
+    if contents is not None:
+        digest.update(contents.get_data())
+    seen = set()
+    for name in ("/Resources", "/Rotate"):
+        digest.update(name.encode("utf-8"))
+        hash_object(digest, inherited(page, name), seen)
+    return digest.hexdigest()
+
+
+def inherited(page, name):
+    """page's own value for name, or the nearest one up the page tree (unresolved), or None"""
+    node = page
+    while node is not None:
+        if name in node:
+            return node.raw_get(name)
+        parent = node.get("/Parent")
+        node = parent.get_object() if parent is not None else None
+    return None
+
+
+def cache_path(cache_dir, key):
+    return os.path.join(cache_dir, key[:2], key + ".txt")
+
+
+def read_cache(cache_dir, key):
+    if not cache_dir:
+        return None
+    try:
+        with open(cache_path(cache_dir, key), "r", encoding="utf-8") as f:
+            return f.read()
+    except FileNotFoundError:
+        return None
+
+
+def write_cache(cache_dir, key, text):
+    if not cache_dir:
+        return
+    path = cache_path(cache_dir, key)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+
+def _init_worker(pdf_path):
+    global _worker_reader
+    _worker_reader = PyPDF2.PdfReader(pdf_path)
+
+
+def _extract_in_worker(index):
+    return _worker_reader.pages[index].extract_text() or ""
+
+
+def iter_pdf_pages(pdf_path, workers=None, cache_dir=CACHE_DIR, stats=None):
+    """
+    Yield the text of every page, in order, as soon as it is available.
+    Cached pages come straight from the cache; the rest are extracted here
+    or, for big documents, spread over a process pool.
+    """
+    reader = PyPDF2.PdfReader(pdf_path)
+    keys = [page_key(page) for page in reader.pages]
+    texts = [read_cache(cache_dir, key) for key in keys]
+    missing = [index for index, text in enumerate(texts) if text is None]
+
+    if stats is not None:
+        stats["pages"] = stats.get("pages", 0) + len(keys)
+        stats["cached"] = stats.get("cached", 0) + len(keys) - len(missing)
+
+    workers = workers if workers is not None else os.cpu_count() or 1
+    if workers > 1 and len(missing) >= PARALLEL_MIN_PAGES:
+        pool = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(pdf_path,))
+        extracted = pool.map(_extract_in_worker, missing, chunksize=max(1, len(missing) // (workers * 4)))
+    else:
+        pool = None
+        extracted = (reader.pages[index].extract_text() or "" for index in missing)
 
-def pdf_to_text(pdf_path, txt_path):
     try:
-        with open(pdf_path, "rb") as pdf_file:
-            reader = PyPDF2.PdfReader(pdf_file)
-            full_text = ""
+        extracted = iter(extracted)
+        for index, text in enumerate(texts):
+            if text is None:
+                text = next(extracted)
+                write_cache(cache_dir, keys[index], text)
+            yield text
+    finally:
+        if pool:
+            pool.shutdown(cancel_futures=True)
 
-            for page in reader.pages:
-                text = page.extract_text()
-                if text:
-                    full_text += text + "\n\n"
 
-            with open(txt_path, "w", encoding="utf-8") as txt_file:
-                txt_file.write(full_text)
+def collect_inputs(paths):
+    """Expand directories into the PDFs and TXTs inside them (sorted)"""
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _, names in os.walk(path):
+                files += [os.path.join(root, name) for name in sorted(names) if name.lower().endswith((".pdf", ".txt"))]
+        else:
+            files.append(path)
+    return files
+
+
+def ingest(paths, txt_path, workers=None, cache_dir=CACHE_DIR):
+    """
+    Convert PDFs and TXTs (files or whole directories) into one knowledge file.
+    Pages are written out as they are extracted, nothing is held in memory
+    beyond the pages still in flight.
+    """
+    stats = {}
+    output_path = os.path.abspath(txt_path)
+    tmp_path = txt_path + ".tmp"
+
+    try:
+        with open(tmp_path, "w", encoding="utf-8") as txt_file:
+            for path in collect_inputs(paths):
+                if os.path.abspath(path) == output_path:
+                    continue
+                if path.lower().endswith(".pdf"):
+                    for text in iter_pdf_pages(path, workers, cache_dir, stats):
+                        if text:
+                            txt_file.write(text + PAGE_SEPARATOR)
+                else:
+                    with open(path, "r", encoding="utf-8") as source:
+                        for block in iter(lambda: source.read(1 << 16), ""):
+                            txt_file.write(block)
+                    txt_file.write(PAGE_SEPARATOR)
+                stats["files"] = stats.get("files", 0) + 1
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+    os.replace(tmp_path, txt_path)
+    return stats
 
-            print(f"Successfully converted '{pdf_path}' to '{txt_path}'")
+
+def pdf_to_text(pdf_path, txt_path, workers=None, cache_dir=CACHE_DIR):
+    try:
+        stats = ingest([pdf_path], txt_path, workers, cache_dir)
+        print(f"Successfully converted '{pdf_path}' to '{txt_path}' "
+              f"({stats.get('pages', 0)} pages, {stats.get('cached', 0)} from cache)")
     except Exception as e:
         print(f"Error converting PDF: {e}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Turn PDFs/TXTs (or folders of them) into a knowledge file")
+    parser.add_argument("inputs", nargs="+", help="PDF/TXT files or directories")
+    parser.add_argument("-o", "--output", default="user_knowledge.txt")
+    parser.add_argument("--workers", type=int, default=None, help="Extraction processes (default: CPU count)")
+    parser.add_argument("--no-cache", action="store_true", help="Don't read or write the page cache")
+    args = parser.parse_args()
+
+    try:
+        stats = ingest(args.inputs, args.output, args.workers, None if args.no_cache else CACHE_DIR)
+    except Exception as e:
+        print(f"Error converting: {e}")
+        sys.exit(1)
+    print(f"Wrote '{args.output}': {stats.get('files', 0)} files, "
+          f"{stats.get('pages', 0)} PDF pages ({stats.get('cached', 0)} from cache)")
+
+
+if __name__ == "__main__":
+    main()
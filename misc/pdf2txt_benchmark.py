@@ -0,0 +1,104 @@
+# pdf2txt_benchmark.py
+# Builds a synthetic multi-hundred-page PDF and times the old one-page-at-a-time
+# conversion against the streaming/parallel/cached pipeline in pdf2txt.py.
+#   python misc/pdf2txt_benchmark.py [--pages 400] [--workers 4]
+import argparse
+import os
+import random
+import shutil
+import tempfile
+import time
+
+import PyPDF2
+
+import pdf2txt
+
+WORDS = ("luna sarcasm voice model token prompt memory knowledge ollama piper banter chaos "
+         "neuro vtuber stream answer question snark teasing personality").split()
+
+
+def write_synthetic_pdf(path, pages, lines_per_page=45, seed=0, edited_page=None):
+    """Write a plain PDF with Helvetica text pages; edited_page gets different text"""
+    rng = random.Random(seed)
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        None,  # page tree, filled in below
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    kids = []
+    for number in range(pages):
+        lines = [" ".join(rng.choice(WORDS) for _ in range(12)) for _ in range(lines_per_page)]
+        if number == edited_page:
+            lines[0] = f"This page was edited at {time.time()}"
+        text = "".join(f"({line}) Tj T* " for line in lines)
+        stream = f"BT /F1 10 Tf 14 TL 40 800 Td {text}ET".encode("latin-1")
+        objects.append(b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream")
+        content_ref = len(objects)
+        objects.append(f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+                       f"/Resources << /Font << /F1 3 0 R >> >> /Contents {content_ref} 0 R >>".encode())
+        kids.append(f"{len(objects)} 0 R")
+    objects[1] = f"<< /Type /Pages /Kids [{' '.join(kids)}] /Count {pages} >>".encode()
+
+    with open(path, "wb") as f:
+        f.write(b"%PDF-1.4\n")
+        offsets = []
+        for number, body in enumerate(objects, start=1):
+            offsets.append(f.tell())
+            f.write(b"%d 0 obj\n" % number + body + b"\nendobj\n")
+        xref = f.tell()
+        f.write(b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1))
+        for offset in offsets:
+            f.write(b"%010d 00000 n \n" % offset)
+        f.write(b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref))
+
+
+def old_pdf_to_text(pdf_path, txt_path):
+    """The original pdf2txt: one page at a time, whole text built by concatenation"""
+    with open(pdf_path, "rb") as pdf_file:
+        reader = PyPDF2.PdfReader(pdf_file)
+        full_text = ""
+        for page in reader.pages:
+            text = page.extract_text()
+            if text:
+                full_text += text + "\n\n"
+        with open(txt_path, "w", encoding="utf-8") as txt_file:
+            txt_file.write(full_text)
+
+
+def timed(label, function):
+    start = time.perf_counter()
+    result = function()
+    print(f"{label:<34} {time.perf_counter() - start:7.2f}s")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pages", type=int, default=400)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="pdf2txt-bench-")
+    try:
+        pdf_path = os.path.join(workdir, "synthetic.pdf")
+        cache_dir = os.path.join(workdir, "cache")
+        write_synthetic_pdf(pdf_path, args.pages)
+        print(f"{args.pages} pages, {os.path.getsize(pdf_path) / 1e6:.1f} MB, {args.workers} workers\n")
+
+        timed("old (sequential, concatenation)", lambda: old_pdf_to_text(pdf_path, os.path.join(workdir, "old.txt")))
+        timed("new, 1 process, no cache", lambda: pdf2txt.ingest([pdf_path], os.path.join(workdir, "seq.txt"), 1, None))
+        timed(f"new, {args.workers} processes, cold cache", lambda: pdf2txt.ingest([pdf_path], os.path.join(workdir, "par.txt"), args.workers, cache_dir))
+        timed("new, warm cache", lambda: pdf2txt.ingest([pdf_path], os.path.join(workdir, "warm.txt"), args.workers, cache_dir))
+
+        write_synthetic_pdf(pdf_path, args.pages, edited_page=args.pages // 2)
+        stats = timed("new, one page edited", lambda: pdf2txt.ingest([pdf_path], os.path.join(workdir, "edit.txt"), args.workers, cache_dir))
+        print(f"\nAfter the edit: {stats['pages'] - stats['cached']} page(s) re-extracted, {stats['cached']} from cache")
+
+        with open(os.path.join(workdir, "old.txt"), encoding="utf-8") as old, open(os.path.join(workdir, "par.txt"), encoding="utf-8") as new:
+            print("Output matches the old converter:", old.read() == new.read())
+    finally:
+        shutil.rmtree(workdir)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+# scheduler_load_test.py
+# A burst of background summaries (some of them identical) lands on the stub
+# LLM together with steady interactive chat. Compares interactive latency when
+# every caller goes straight to Ollama with going through llm_scheduler.py.
+#   python misc/scheduler_load_test.py [--chats 40] [--summaries 12] [--parallel 2]
+import os
+import sys
+import time
+import argparse
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ollama_client import OllamaClient, OllamaError
+from llm_scheduler import start_scheduler, percentile
+from ollama_stub import start_stub
+
+MODEL = "llama3:8b"
+
+
+def call(url, prompt, priority, latencies, errors):
+    start = time.perf_counter()
+    try:
+        for _ in OllamaClient(url).stream_generate(MODEL, prompt, priority=priority):
+            pass
+        latencies.append(time.perf_counter() - start)
+    except OllamaError as e:
+        errors.append(str(e))
+
+
+def run(url, args):
+    """Fire the summaries at once, then a chat message every --interval seconds"""
+    chat, background, errors = [], [], []
+    threads = []
+    for number in range(args.summaries):
+        # Two front-ends summarizing the same conversation send the same prompt
+        prompt = f"Summarize conversation {number // 2 if number < args.duplicates * 2 else number}"
+        threads.append(threading.Thread(target=call, args=(url, prompt, "background", background, errors)))
+    for thread in threads:
+        thread.start()
+    for number in range(args.chats):
+        thread = threading.Thread(target=call, args=(url, f"chat message {number}", "interactive", chat, errors))
+        thread.start()
+        threads.append(thread)
+        time.sleep(args.interval)
+    for thread in threads:
+        thread.join()
+    return chat, background, errors
+
+
+def report(label, chat, background, errors):
+    print(f"{label:<12} chat p50 {percentile(chat, 0.5):5.2f}s  p99 {percentile(chat, 0.99):5.2f}s  max {max(chat):5.2f}s   "
+          f"summaries p50 {percentile(background, 0.5):5.2f}s  max {max(background):5.2f}s   errors {len(errors)}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--chats", type=int, default=40)
+    parser.add_argument("--summaries", type=int, default=12)
+    parser.add_argument("--duplicates", type=int, default=2, help="Pairs of identical summary prompts")
+    parser.add_argument("--interval", type=float, default=0.1, help="Seconds between chat messages")
+    parser.add_argument("--parallel", type=int, default=2, help="Generations the stub runs at once")
+    parser.add_argument("--token-delay", type=float, default=0.01)
+    args = parser.parse_args()
+
+    stub, stub_url = start_stub(token_delay=args.token_delay, parallel=args.parallel)
+    print(f"stub: {args.parallel} at a time, {args.token_delay * 1000:.0f} ms/token; "
+          f"{args.summaries} summaries at once, then {args.chats} chats {args.interval}s apart\n")
+
+    report("direct", *run(stub_url, args))
+
+    scheduler_server, scheduler_url = start_scheduler("127.0.0.1", 0, client=OllamaClient(stub_url, retries=1), parallel=args.parallel)
+    report("scheduler", *run(scheduler_url, args))
+
+    metrics = scheduler_server.RequestHandlerClass.scheduler.metrics()
+    print(f"\nscheduler: {metrics['submitted']} submitted, {metrics['deduped']} deduplicated, "
+          f"{metrics['rejected']} turned away, peak depth {metrics['peak_depth']}, "
+          f"stub peak {stub.RequestHandlerClass.state.peak_active} at once")
+    for lane, wait in metrics["wait"].items():
+        print(f"  {lane:<12} queue wait p50 {wait['p50']:.2f}s  p99 {wait['p99']:.2f}s  max {wait['max']:.2f}s")
+    scheduler_server.shutdown()
+    stub.shutdown()
+
+
+if __name__ == "__main__":
+    main()
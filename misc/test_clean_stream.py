@@ -0,0 +1,51 @@
+# test_clean_stream.py
+# Checks that luna_with_tts.clean_stream gives exactly what clean_response
+# gives for the whole reply, however the reply is cut into tokens: random
+# replies full of (partial, nested, mixed-case) <response> tags and newlines,
+# each split at random places.
+#   python misc/test_clean_stream.py [--cases 20000] [--seed 1]
+import os
+import sys
+import random
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from luna_with_tts import clean_response, clean_stream
+
+PIECES = ["<response>", "</response>", "<Response id=1>", "</RESPONSE>", "<resp", "onse>", "</res", "ponse>",
+          "<", ">", "/", "<b>", "<re", "sponse", "Ugh,", " fine.", " whatever", "\n", "\n\n\n", "  ", "\t",
+          "I'm bored", "<responses>", "a < b", "x>y", "e"]
+
+# Tokens that only make a tag once the one between them is stripped (found in review)
+KNOWN = [["<resp", "</response>", "onse>"], ["<", "<response>", "response>"], ["</re", "</response>", "sponse>hi"]]
+
+
+def random_chunks(rng, text):
+    cuts = sorted(rng.sample(range(1, len(text)), min(len(text) - 1, rng.randint(0, 12)))) if len(text) > 1 else []
+    return [text[start:end] for start, end in zip([0] + cuts, cuts + [len(text)])]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--cases", type=int, default=20000)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    rng = random.Random(args.seed)
+
+    cases = KNOWN + [random_chunks(rng, "".join(rng.choice(PIECES) for _ in range(rng.randint(0, 12))))
+                     for _ in range(args.cases)]
+    failures = 0
+    for chunks in cases:
+        expected = clean_response("".join(chunks))
+        got = "".join(clean_stream(chunks))
+        if got != expected:
+            failures += 1
+            if failures <= 5:
+                print(f"{chunks!r}: streamed {got!r}, clean_response {expected!r}")
+    print(f"{len(cases)} chunkings, {failures} differ from clean_response")
+    assert failures == 0
+
+
+if __name__ == "__main__":
+    main()
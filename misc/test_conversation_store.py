@@ -0,0 +1,66 @@
+# test_conversation_store.py
+# Checks the conversation database on a temporary file: --wipe-memory leaves
+# nothing for the next start to resume or summarize from, and a summary
+# backlog is folded in SUMMARY_BATCH_TURNS messages at a time.
+#   python misc/test_conversation_store.py
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import luna_with_tts
+from conversation_store import ConversationStore, Summarizer
+from memory_store import MemoryStore
+
+
+def check_wipe(folder):
+    path = os.path.join(folder, "conversations.db")
+    store = ConversationStore(path)
+    store.start_session("llama3")
+    for number in range(30):
+        store.add_turn("User" if number % 2 == 0 else "Luna", f"message {number} about pizza")
+    store.add_summary("The user loves pizza.", 20)
+    store.close()
+
+    luna_with_tts.CONVERSATION_DB = path
+    luna_with_tts.MEMORY_STORE = MemoryStore(os.path.join(folder, "memory.json"))
+    luna_with_tts.SESSION.store = luna_with_tts.MEMORY_STORE
+    luna_with_tts.wipe_memory()
+
+    # What the next start does
+    luna_with_tts.load_conversations()
+    history = luna_with_tts.SESSION.memory["conversation_history"]
+    summary = luna_with_tts.CONVERSATIONS.latest_summary()
+    found = luna_with_tts.CONVERSATIONS.search("pizza")
+    luna_with_tts.CONVERSATIONS.close()
+    print(f"after a wipe: {len(history)} history messages, summary {summary!r}, {len(found)} search hits")
+    assert history == [] and summary == ("", 0) and found == []
+
+
+def check_batches(folder, batch_turns=10, keep_recent=6):
+    store = ConversationStore(os.path.join(folder, "batches.db"))
+    for number in range(95):
+        store.add_turn("User", f"message {number}")
+    prompts = []
+
+    def generate(prompt, max_tokens):
+        prompts.append(prompt)
+        return f"summary {len(prompts)}"
+
+    Summarizer(store, generate, keep_recent=keep_recent, batch_turns=batch_turns).summarize()
+    sizes = [prompt.split("<new_messages>")[1].count("message ") for prompt in prompts]
+    left = len(store.unsummarized_turns(keep_recent))
+    print(f"95 messages, {keep_recent} kept back: {len(prompts)} summary calls of {sizes} messages, {left} left for later")
+    assert max(sizes) <= batch_turns and left < batch_turns
+    store.close()
+
+
+def main():
+    with tempfile.TemporaryDirectory() as folder:
+        check_wipe(folder)
+        check_batches(folder)
+
+
+if __name__ == "__main__":
+    main()
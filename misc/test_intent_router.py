@@ -0,0 +1,50 @@
+# test_intent_router.py
+# Checks intent_router on messages that mix several intents: the most
+# important fact wins wherever it is in the message, and puns/jokes/limericks
+# only count when they're asked for.
+#   python misc/test_intent_router.py
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import intent_router
+
+# message -> (command, generator, fact, arguments that must be there)
+CASES = {
+    "I'm tired. My name is Bob": (None, None, "name", {"person": "Bob"}),
+    "i am bored, i like cats": (None, None, "likes", {"thing": "cats"}),
+    "I love trains. My name is Ann": (None, None, "name", {"person": "Ann"}),
+    "i'm a developer": (None, None, "description", {"self": "a developer"}),
+    "I like puns": (None, None, "likes", {"thing": "puns"}),
+    "I love pizza and jokes": (None, None, "likes", {"thing": "pizza and jokes"}),
+    "puns are the worst": (None, None, None, {}),
+    "this is punishing": (None, None, None, {}),
+    "tell me a joke about cats.": (None, "pun", None, {"topic": "cats"}),
+    "can you tell me a joke?": (None, "pun", None, {"topic": "something"}),
+    "do you know any jokes?": (None, "pun", None, {"topic": "something"}),
+    "any puns?": (None, "pun", None, {"topic": "something"}),
+    "jokes please!": (None, "pun", None, {}),
+    "make me a limerick about my dog": (None, "limerick", None, {"topic": "my dog"}),
+    "limerick": (None, "limerick", None, {}),
+    "Tell me a pun about dogs. My name is Bob": (None, "pun", "name", {"topic": "dogs", "person": "Bob"}),
+    "tts voice Amy": ("tts_voice", None, None, {"voice": "Amy"}),
+    "recall pizza night": ("recall", None, None, {"query": "pizza night"}),
+    "hello luna": (None, None, None, {}),
+}
+
+
+def main():
+    failures = 0
+    for message, (command, generator, fact, args) in CASES.items():
+        route = intent_router.route(message)
+        if (route.command, route.generator, route.fact) != (command, generator, fact) \
+                or any(route.args.get(key) != value for key, value in args.items()):
+            failures += 1
+            print(f"{message!r:45} expected {(command, generator, fact, args)}, got {route}")
+    print(f"{len(CASES)} messages, {failures} wrong")
+    assert failures == 0
+
+
+if __name__ == "__main__":
+    main()
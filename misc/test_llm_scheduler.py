@@ -0,0 +1,93 @@
+# test_llm_scheduler.py
+# Checks llm_scheduler's deduplication at the edges: a caller asking for the
+# same generation just as it completes, or just as it's stopped because
+# everyone else left, still gets a whole reply.
+#   python misc/test_llm_scheduler.py
+import os
+import sys
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from llm_scheduler import Scheduler, collect
+
+MODEL = "llama3:8b"
+WORDS = ["Ugh,", " fine.", " Whatever", " you", " say."]
+
+
+class ScriptedClient:
+    """
+    Streams WORDS, and calls at_end (in the worker) right when the stream
+    ends or is stopped. With hold set it waits for it after the first chunk.
+    """
+
+    def __init__(self):
+        self.at_end = None
+        self.hold = None
+        self.calls = 0
+
+    def stream_generate(self, model, prompt, **options):
+        self.calls += 1
+        try:
+            for number, word in enumerate(WORDS):
+                yield {"model": model, "response": word, "done": number == len(WORDS) - 1}
+                if self.hold:
+                    self.hold.wait()
+        finally:
+            at_end, self.at_end = self.at_end, None
+            if at_end:
+                at_end()
+
+
+def join_at_end(scheduler, client, prompt):
+    """Ask for prompt again from inside the worker as its stream ends; returns a function giving that reply"""
+    result = {}
+    done = threading.Event()
+
+    def join():
+        chunks = scheduler.stream_generate(MODEL, prompt)
+        # Submitted now, followed from another thread like a real caller
+        threading.Thread(target=follow, args=(chunks,), daemon=True).start()
+
+    def follow(chunks):
+        result["reply"] = collect(chunks)
+        done.set()
+
+    client.at_end = join
+
+    def reply():
+        assert done.wait(5), "the caller joining at the end never got an answer"
+        return result["reply"]
+    return reply
+
+
+def main():
+    client = ScriptedClient()
+    scheduler = Scheduler(client=client, parallel=1)
+
+    # The job runs to the end and someone asks for the same thing just then
+    late = join_at_end(scheduler, client, "hi")
+    first = scheduler.generate(MODEL, "hi")
+    reply = late()
+    print(f"join at completion: {reply['response']!r} done={reply.get('done')}")
+    assert reply["response"] == first["response"] == "".join(WORDS) and reply.get("done")
+
+    # The only caller hangs up after one chunk; the job stops and someone asks again right then
+    late = join_at_end(scheduler, client, "bye")
+    client.hold = threading.Event()
+    chunks = scheduler.stream_generate(MODEL, "bye")
+    next(chunks)
+    chunks.close()
+    client.hold.set()
+    reply = late()
+    print(f"join as an abandoned job stops: {reply['response']!r} done={reply.get('done')}")
+    assert reply["response"] == "".join(WORDS) and reply.get("done")
+    client.hold = None
+
+    metrics = scheduler.metrics()
+    print(f"{client.calls} generations, {metrics['deduped']} deduped, {len(scheduler.jobs)} jobs left in flight")
+    assert not scheduler.jobs
+
+
+if __name__ == "__main__":
+    main()
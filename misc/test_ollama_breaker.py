@@ -0,0 +1,76 @@
+# test_ollama_breaker.py
+# Checks ollama_client's circuit breaker against the stub: once the cooldown
+# is over exactly one call probes Ollama while everyone else still fails
+# fast, a failed probe opens the breaker again, a good one closes it.
+#   python misc/test_ollama_breaker.py
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ollama_client import OllamaClient, OllamaError, OllamaUnavailable
+from ollama_stub import start_stub
+
+COOLDOWN = 0.3
+
+
+def burst(client, callers):
+    """callers threads calling at once: (answered, failed fast)"""
+    results = []
+    start = threading.Barrier(callers)
+
+    def call():
+        start.wait()
+        try:
+            client.generate("llama3:8b", "hi")
+            results.append("answered")
+        except OllamaUnavailable:
+            results.append("fast")
+        except OllamaError:
+            results.append("failed")
+
+    threads = [threading.Thread(target=call) for _ in range(callers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results.count("answered"), results.count("fast"), results.count("failed")
+
+
+def main():
+    # 2 failures open the breaker, the 3rd request (the first probe) fails too;
+    # the slow first load keeps the second probe in flight while the others arrive
+    stub, url = start_stub(fail_first=3, load_delay=0.5)
+    state = stub.RequestHandlerClass.state
+    client = OllamaClient(url, retries=1, backoff=0, breaker_threshold=2, breaker_cooldown=COOLDOWN)
+
+    for _ in range(2):
+        try:
+            client.generate("llama3:8b", "hi")
+        except OllamaError:
+            pass
+    seen = state.requests
+    assert burst(client, 8) == (0, 8, 0) and state.requests == seen, "open breaker let calls through"
+
+    time.sleep(COOLDOWN + 0.05)
+    answered, fast, failed = burst(client, 8)
+    print(f"half-open, probe fails: {failed} probe, {fast} failed fast, {state.requests - seen} reached Ollama")
+    assert (answered, failed, state.requests - seen) == (0, 1, 1), (answered, fast, failed)
+    seen = state.requests
+    assert burst(client, 8) == (0, 8, 0) and state.requests == seen, "failed probe didn't open the breaker again"
+
+    time.sleep(COOLDOWN + 0.05)
+    answered, fast, failed = burst(client, 8)
+    print(f"half-open, probe works: {answered} probe, {fast} failed fast, {state.requests - seen} reached Ollama")
+    assert (answered, failed, state.requests - seen) == (1, 0, 1), (answered, fast, failed)
+
+    answered, fast, failed = burst(client, 8)
+    print(f"closed again: {answered} answered, {fast} failed fast")
+    assert (answered, fast, failed) == (8, 0, 0)
+    stub.shutdown()
+
+
+if __name__ == "__main__":
+    main()
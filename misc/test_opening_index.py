@@ -0,0 +1,114 @@
+# test_opening_index.py
+# Checks the repeated-opening index against the old SequenceMatcher scan on the
+# same inputs, then times both with thousands of stored openings.
+#   python misc/test_opening_index.py [--openings 2000] [--queries 300]
+import os
+import sys
+import time
+import random
+import argparse
+from difflib import SequenceMatcher
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from opening_index import OpeningIndex
+
+STARTS = ["Oh great,", "Wow,", "Ugh,", "Well well well,", "Oh look,", "Seriously?", "Fine.", "Hmm,",
+          "Okay,", "Listen,", "Sure,", "Congratulations,", "Ah yes,", "Let me guess,", "Oh no,"]
+MIDDLES = ["another question", "you again", "the human returns", "that's a new one", "how original",
+           "I was having such a nice time", "my favorite chat partner", "this is fascinating",
+           "you really asked that", "what a surprise", "more small talk", "the genius is back",
+           "I can't believe this", "here we go again", "my circuits are thrilled"]
+ENDS = ["", ".", "!", "...", " *sigh*", " *eye roll*", " I suppose.", " Riveting.", " Truly.", " again."]
+
+
+def make_opening(rng):
+    line = f"{rng.choice(STARTS)} {rng.choice(MIDDLES)}{rng.choice(ENDS)}"
+    if rng.random() < 0.3:
+        # Small edits, like a model rephrasing itself
+        chars = list(line)
+        for _ in range(rng.randint(1, 4)):
+            chars[rng.randrange(len(chars))] = rng.choice("abcdefghijklmnopqrstuvwxyz ")
+        line = "".join(chars)
+    if rng.random() < 0.05:
+        line = rng.choice(["Hi.", "Hey!", "No.", "Ok", "", "Hmm."])
+    return line
+
+
+def old_is_repeated(line, openings, threshold):
+    """The scan luna_with_tts.py used to do"""
+    return any(SequenceMatcher(None, line, old).ratio() > threshold for old in openings)
+
+
+def compare(openings, queries, threshold, exact_scan_limit):
+    index = OpeningIndex(exact_scan_limit=exact_scan_limit)
+    index.sync(openings)
+    same = missed = extra = positives = 0
+    for line in queries:
+        old = old_is_repeated(line, openings, threshold)
+        new = index.find(line, threshold) is not None
+        positives += old
+        same += old == new
+        missed += old and not new
+        extra += new and not old
+    return same, missed, extra, positives
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--openings", type=int, default=2000)
+    parser.add_argument("--queries", type=int, default=300)
+    parser.add_argument("--threshold", type=float, default=0.7)
+    args = parser.parse_args()
+    rng = random.Random(0)
+
+    # History-sized: the index must give the old answer every single time
+    failures = 0
+    for _ in range(2000):
+        history = [make_opening(rng) for _ in range(rng.randint(0, 5))]
+        queries = [make_opening(rng) for _ in range(3)] + history[:1]
+        same, missed, extra, _ = compare(history, queries, args.threshold, exact_scan_limit=64)
+        failures += missed + extra
+    print(f"5-message histories, 8000 queries: {failures} disagreements")
+    assert failures == 0
+
+    # Thousands of openings, LSH only: half the queries are edits of stored openings
+    words = " ".join(STARTS + MIDDLES).lower().replace(",", "").split()
+    openings = [" ".join(rng.choice(words) for _ in range(rng.randint(3, 9))) for _ in range(args.openings)]
+    queries = [" ".join(rng.choice(words) for _ in range(rng.randint(3, 9))) for _ in range(args.queries // 2)]
+    for line in rng.sample(openings, args.queries // 2):
+        chars = list(line)
+        for _ in range(rng.randint(0, len(chars) // 5)):
+            chars[rng.randrange(len(chars))] = rng.choice("abcdefghijklmnopqrstuvwxyz ")
+        queries.append("".join(chars))
+    same, missed, extra, positives = compare(openings, queries, args.threshold, exact_scan_limit=0)
+    print(f"{len(openings)} openings, {len(queries)} queries: {same} same answers, "
+          f"{missed}/{positives} repeats missed, {extra} false repeats")
+    assert extra == 0
+
+    # Timing with a deliberately rare match, the worst case for the old scan
+    unique = [f"{i} {make_opening(rng)} {rng.random()}" for i in range(args.openings)]
+    index = OpeningIndex(exact_scan_limit=0)
+    start = time.perf_counter()
+    index.sync(unique)
+    build = time.perf_counter() - start
+    probes = [make_opening(rng) + " something else entirely" for _ in range(50)]
+
+    start = time.perf_counter()
+    for line in probes:
+        old_is_repeated(line, unique, args.threshold)
+    old_time = (time.perf_counter() - start) / len(probes)
+    start = time.perf_counter()
+    for line in probes:
+        index.find(line, args.threshold)
+    new_time = (time.perf_counter() - start) / len(probes)
+    start = time.perf_counter()
+    index.sync(unique[1:] + ["one more opening"])
+    resync = time.perf_counter() - start
+
+    print(f"\nindex build {build:.2f}s, resync after one new reply {resync * 1000:.1f}ms")
+    print(f"per check: SequenceMatcher scan {old_time * 1000:.1f}ms, index {new_time * 1000:.2f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+# test_prompt_builder.py
+# Checks that Ollama's context keeps being reused in a conversation long
+# enough that the prompt has to be cut (a resumed one, history already full):
+# the prefix a turn looks the context up with must be the one the last turn
+# stored it under, cuts included.
+#   python misc/test_prompt_builder.py
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from settings import HISTORY_MESSAGES
+from prompt_builder import ConversationContext, PromptAssembler, build_prompt
+
+MODEL = "llama3:8b"
+SYSTEM_PROMPT = "You are Luna, sarcastic and quick. " * 10
+
+
+def say(number):
+    return f"message {number}, tell me more about the moon and why it looks so big tonight"
+
+
+TURNS = 12
+
+
+def run(context_tokens, turns=TURNS):
+    """(turns that reused the context, sections cut along the way)"""
+    memory = {
+        "conversation_history": [f"User: {say(number)}" if number % 2 == 0 else "Luna: " + "Ugh, fine. " * 8
+                                 for number in range(HISTORY_MESSAGES)],
+        "user_info": {"name": "Bob", "likes": "cats"},
+        "luna_notes": [f"note {number}: Bob mentioned his cat {number} times" for number in range(30)],
+    }
+    context = ConversationContext()
+    assembler = PromptAssembler(context_tokens=context_tokens, reply_tokens=100)
+    reused = 0
+    trimmed = set()
+    for number in range(turns):
+        user_input = say(number)
+        prompt, prefix, tokens = build_prompt(SYSTEM_PROMPT, memory, user_input, MODEL, context, assembler=assembler)
+        reused += tokens is not None
+        trimmed.update(assembler.trimmed)
+        # What Ollama would hand back: everything it read and wrote so far
+        context.update(MODEL, prefix, (tokens or []) + [1] * 40)
+        memory["conversation_history"] += [f"User: {user_input}", "Luna: " + "Ugh, fine. " * 8]
+        memory["conversation_history"] = memory["conversation_history"][-HISTORY_MESSAGES:]
+    return reused, trimmed
+
+
+def main():
+    for context_tokens in (8192, 650):
+        reused, trimmed = run(context_tokens)
+        print(f"context {context_tokens:>5} tokens: reused {reused} of {TURNS - 1} turns, cut {sorted(trimmed) or 'nothing'}")
+        assert reused >= TURNS - 3, reused
+    assert trimmed, "the small context never cut the prompt, the check proves nothing"
+
+
+if __name__ == "__main__":
+    main()
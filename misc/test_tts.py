@@ -1,18 +1,14 @@
 # test_tts.py
-import requests
 import subprocess
 import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ollama_client import get_client
 
 def get_ai_response(prompt):
-    response = requests.post(
-        "http://localhost:11434/api/generate",
-        json={
-            "model": "llama3:8b",
-            "prompt": prompt,
-            "stream": False
-        }
-    )
-    return response.json()["response"]
+    return get_client().generate("llama3:8b", prompt)["response"]
 
 def speak_text(text, speed=1.0):
     """
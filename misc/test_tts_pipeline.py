@@ -0,0 +1,62 @@
+# test_tts_pipeline.py
+# Runs the sentence-by-sentence speech pipeline offline: a fake LLM stream,
+# a fake Piper and a fake player. Run from the repo root:
+#   python misc/test_tts_pipeline.py
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from luna_tts import SpeechPipeline
+
+REPLY = (
+    "Ugh, you again? Fine. I'll answer, but only because I'm bored. "
+    "The answer is forty-two, obviously. Don't make me repeat myself!\n"
+    "Also, stop asking me about Neuro-sama."
+)
+
+TOKEN_DELAY = 0.02   # fake LLM: seconds per token
+SYNTH_DELAY = 0.002  # fake Piper: seconds per character
+PLAY_DELAY = 0.005   # fake player: seconds per byte of "audio"
+
+
+def fake_llm_stream(text):
+    for word in text.split(" "):
+        time.sleep(TOKEN_DELAY)
+        yield word + " "
+
+
+def main():
+    start = time.perf_counter()
+    events = []
+
+    def fake_synthesize(sentence):
+        time.sleep(SYNTH_DELAY * len(sentence))
+        events.append((time.perf_counter() - start, "synth", sentence))
+        return sentence.encode("utf-8")
+
+    def fake_play(audio):
+        events.append((time.perf_counter() - start, "play start", audio.decode("utf-8")))
+        time.sleep(PLAY_DELAY * len(audio) / 10)
+
+    pipeline = SpeechPipeline(synthesize=fake_synthesize, play=fake_play)
+    for token in fake_llm_stream(REPLY):
+        pipeline.feed(token)
+    llm_done = time.perf_counter() - start
+    pipeline.finish()
+    total = time.perf_counter() - start
+
+    for at, kind, sentence in events:
+        print(f"{at:6.3f}s  {kind:<10} {sentence!r}")
+
+    first_audio = next(at for at, kind, _ in events if kind == "play start")
+    print(f"\nLLM finished at {llm_done:.3f}s, first audio at {first_audio:.3f}s, all done at {total:.3f}s")
+
+    assert first_audio < llm_done, "first sentence should play before the LLM is done"
+    assert " ".join(pipeline.spoken) == " ".join(REPLY.split()), "sentences must be spoken in order"
+    print("OK")
+
+
+if __name__ == "__main__":
+    main()
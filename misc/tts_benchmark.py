@@ -0,0 +1,206 @@
+# tts_benchmark.py
+# How fast Piper speaks compared to how long the speech lasts. Synthesizes a
+# corpus (tts/tts_input.txt plus Luna's logged replies) sentence by sentence,
+# like the live pipeline does, for every voice and speed, and reports the
+# real-time factor (synthesis time / audio length, above 1 speech can't keep
+# up), time to first audio, CPU time and peak memory (the highest so far in
+# the run, so test big voices last). Run from the repo root:
+#   python misc/tts_benchmark.py [--voice Amy] [--speed 1.0 --speed 1.3] [--replies 50] [--json tts.json]
+# --compare-engines compares a fresh piper process per utterance (cold) with
+# the long-lived PiperEngine (warm) instead:
+#   python misc/tts_benchmark.py --compare-engines [--voice Amy] [--runs 5]
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from settings import *
+from llm_scheduler import percentile
+from luna_tts import PiperEngine, SentenceSplitter, synthesize_piper, wav_seconds
+from turn_logger import read_log
+
+try:
+    import resource
+except ImportError:  # Windows: no CPU time of piper processes, no peak memory
+    resource = None
+
+PHRASES = [
+    "TTS enabled. Fine, I’ll talk again. Don’t get used to it.",
+    "Ugh, don't get the wrong idea! I'm only talking to you because I feel like it.",
+    "Red. Like fire. Like passion. Like the warning sign that says 'do not annoy me.'",
+]
+
+TTS_INPUT_FILE = "tts/tts_input.txt"
+
+
+def load_corpus(replies):
+    """Utterances to speak: tts_input.txt paragraphs, then up to replies logged replies (newest first)"""
+    corpus = []
+    if os.path.exists(TTS_INPUT_FILE):
+        with open(TTS_INPUT_FILE, "r", encoding="utf-8") as f:
+            corpus += [block.strip() for block in f.read().split("\n\n") if block.strip()]
+    if replies and os.path.exists(LOG_FILE):
+        logged = [record["response"] for record in read_log(LOG_FILE)
+                  if record.get("kind") in ("model", "cache", "custom") and (record.get("response") or "").strip()]
+        added = []
+        for reply in reversed(logged):
+            if len(added) >= replies:
+                break
+            if reply not in corpus and reply not in added:
+                added.append(reply)
+        corpus += added
+    return corpus or list(PHRASES)
+
+
+def usage():
+    """(CPU seconds so far, peak RSS in bytes) of this process and the piper processes it ran"""
+    if resource is None:
+        return time.process_time(), 0
+    scale = 1 if sys.platform == "darwin" else 1024     # ru_maxrss is KB on Linux, bytes on macOS
+    own, children = resource.getrusage(resource.RUSAGE_SELF), resource.getrusage(resource.RUSAGE_CHILDREN)
+    cpu = own.ru_utime + own.ru_stime + children.ru_utime + children.ru_stime
+    return cpu, max(own.ru_maxrss, children.ru_maxrss) * scale
+
+
+def speak(synthesize, text):
+    """Synthesize text sentence by sentence; (seconds to first audio, synthesis seconds, audio seconds)"""
+    splitter = SentenceSplitter()
+    start = time.perf_counter()
+    first_audio = None
+    audio_length = 0.0
+    for sentence in splitter.feed(text) + splitter.flush():
+        audio = synthesize(sentence)
+        if not audio:
+            raise RuntimeError(f"No audio for '{sentence}'")
+        if first_audio is None:
+            first_audio = time.perf_counter() - start
+        audio_length += wav_seconds(audio)
+    return first_audio or 0.0, time.perf_counter() - start, audio_length
+
+
+def bench_voice(voice, speed, corpus):
+    """Everything measured for one voice at one speed"""
+    cpu_start, _ = usage()
+    load_start = time.perf_counter()
+    engine = PiperEngine(voice)
+    load_time = time.perf_counter() - load_start
+    engine.warm_up()
+
+    samples = []
+    for text in corpus:
+        first_audio, synth_time, audio_length = speak(lambda sentence: engine.synthesize(sentence, speed), text)
+        samples.append({"chars": len(text), "first_audio": first_audio, "synth": synth_time,
+                        "audio": audio_length, "rtf": synth_time / audio_length if audio_length else None})
+    cpu_end, peak_rss = usage()
+
+    rtfs = [sample["rtf"] for sample in samples if sample["rtf"] is not None]
+    first = [sample["first_audio"] for sample in samples]
+    audio_total = sum(sample["audio"] for sample in samples)
+    return {
+        "voice": voice, "speed": speed, "length_scale": 1.0 / speed, "in_process": engine.in_process,
+        "load": load_time, "utterances": len(samples), "audio_seconds": audio_total,
+        "rtf": sum(sample["synth"] for sample in samples) / audio_total if audio_total else None,
+        "rtf_p50": percentile(rtfs, 0.5), "rtf_p90": percentile(rtfs, 0.9), "rtf_max": max(rtfs, default=0.0),
+        "first_audio_p50": percentile(first, 0.5), "first_audio_p90": percentile(first, 0.9),
+        "cpu_seconds": cpu_end - cpu_start, "peak_rss_mb": peak_rss / 1024 / 1024 if peak_rss else None,
+        "samples": samples,
+    }
+
+
+def show(result):
+    rss = f"{result['peak_rss_mb']:7.0f} MB" if result["peak_rss_mb"] else f"{'-':>10}"
+    behind = f"  {COLOR_RED}can't keep up{COLOR_RESET}" if result["rtf_max"] > 1 else ""
+    print(f"{result['voice']:<8}{result['speed']:>6.2f}{result['length_scale']:>7.2f}{result['load'] * 1000:>8.0f}ms"
+          f"{result['rtf']:>8.2f}{result['rtf_p50']:>7.2f}{result['rtf_p90']:>7.2f}{result['rtf_max']:>7.2f}"
+          f"{result['first_audio_p50'] * 1000:>9.0f}/{result['first_audio_p90'] * 1000:<5.0f}ms"
+          f"{result['cpu_seconds'] / result['audio_seconds']:>8.2f}{rss}{behind}")
+
+
+def time_runs(synthesize, runs):
+    """Time synthesize() over every phrase, runs times each"""
+    timings = []
+    for _ in range(runs):
+        for phrase in PHRASES:
+            start = time.perf_counter()
+            audio = synthesize(phrase)
+            timings.append(time.perf_counter() - start)
+            if not audio:
+                raise RuntimeError(f"No audio for '{phrase}'")
+    return timings
+
+
+def report(name, timings):
+    timings = sorted(timings)
+    mean = sum(timings) / len(timings)
+    print(f"{name:<8} mean {mean * 1000:8.1f} ms   min {timings[0] * 1000:8.1f} ms   max {timings[-1] * 1000:8.1f} ms")
+    return mean
+
+
+def compare_engines(voice, runs):
+    print(f"Voice: {voice}, {runs} runs x {len(PHRASES)} phrases\n")
+
+    cold = time_runs(lambda text: synthesize_piper(text, TTS_SPEED, voice), runs)
+
+    load_start = time.perf_counter()
+    engine = PiperEngine(voice)
+    if not engine.in_process:
+        print("piper-tts is not installed, the warm engine would just run the CLI. Install it with 'pip install piper-tts'.")
+        report("cold", cold)
+        return
+    load_time = time.perf_counter() - load_start
+    warm_up_time = engine.warm_up()
+    warm = time_runs(lambda text: engine.synthesize(text, TTS_SPEED), runs)
+
+    print(f"Engine load: {load_time * 1000:.1f} ms, warm-up: {warm_up_time * 1000:.1f} ms\n")
+    cold_mean = report("cold", cold)
+    warm_mean = report("warm", warm)
+    print(f"\nWarm engine is {cold_mean / warm_mean:.1f}x faster per utterance")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--voice", action="append", choices=list(MODELS_PATHS),
+                        help="Voice to test (repeatable, default every voice whose model is on disk)")
+    parser.add_argument("--speed", action="append", type=float, help=f"TTS speed to test (repeatable, default {TTS_SPEED})")
+    parser.add_argument("--replies", type=int, default=50, help=f"Logged replies from {LOG_FILE} to add to the corpus")
+    parser.add_argument("--json", help="Write every result to this JSON file")
+    parser.add_argument("--compare-engines", action="store_true", help="Compare a piper process per utterance with the loaded engine")
+    parser.add_argument("--runs", type=int, default=5, help="Runs per phrase with --compare-engines")
+    args = parser.parse_args()
+
+    if args.compare_engines:
+        compare_engines((args.voice or [TTS_VOICE])[0], args.runs)
+        return
+
+    voices = args.voice or [voice for voice, path in MODELS_PATHS.items() if os.path.isfile(path)]
+    if not voices:
+        print(f"{COLOR_RED}No voice models found, check MODELS_PATHS in settings.py{COLOR_RESET}")
+        sys.exit(1)
+    corpus = load_corpus(args.replies)
+    print(f"{len(corpus)} utterances, {sum(len(text) for text in corpus)} characters\n")
+    print(f"{'voice':<8}{'speed':>6}{'scale':>7}{'load':>10}{'RTF':>8}{'p50':>7}{'p90':>7}{'max':>7}"
+          f"{'first audio p50/p90':>20}{'CPU/s':>8}{'peak RSS':>10}")
+
+    results = []
+    for voice in voices:
+        for speed in args.speed or [TTS_SPEED]:
+            try:
+                result = bench_voice(voice, speed, corpus)
+            except Exception as e:
+                print(f"{COLOR_RED}{voice} failed:\n{COLOR_RESET}{str(e)}")
+                break
+            show(result)
+            results.append(result)
+
+    print("\nRTF = synthesis time / audio length; CPU/s = CPU seconds per second of speech")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"corpus": len(corpus), "results": results}, f, indent=2)
+        print(f"Results written to {args.json}")
+
+
+if __name__ == "__main__":
+    main()
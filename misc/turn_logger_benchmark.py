@@ -0,0 +1,69 @@
+# turn_logger_benchmark.py
+# Times what logging a turn costs the reply path: the old synchronous
+# append of the whole prompt to logs/<date>.log against TurnLogger, and
+# compares how much ends up on disk.
+#   python misc/turn_logger_benchmark.py [--turns 2000] [--prefix-kb 6]
+import os
+import sys
+import time
+import glob
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from turn_logger import TurnLogger, read_log
+
+REPLY = "Ugh, fine. I'm only answering because I'm bored. Don't get used to it."
+
+
+def old_log(log_file, prompt, response, stats_line):
+    """What log_request_response did on every turn"""
+    with open(log_file, "a", encoding="utf-8") as f:
+        f.write(f"[{time.strftime('%H:%M:%S')}]\n{prompt}\n\n{response}\n{stats_line}---\n\n")
+
+
+def folder_size(folder):
+    return sum(os.path.getsize(path) for path in glob.glob(os.path.join(folder, "*")))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--turns", type=int, default=2000)
+    parser.add_argument("--prefix-kb", type=int, default=6, help="Size of the static prompt prefix")
+    args = parser.parse_args()
+
+    prefix = ("You are Luna, sarcastic and quick. " * (args.prefix_kb * 1024 // 35))[:args.prefix_kb * 1024] + "\n"
+    prompts = [f"{prefix}<history>\nUser: message number {number}\n</history>\n" for number in range(args.turns)]
+    stats = {"first_token": 0.42, "total": 1.3, "eval_count": 17}
+
+    with tempfile.TemporaryDirectory() as old_dir, tempfile.TemporaryDirectory() as new_dir:
+        start = time.perf_counter()
+        for prompt in prompts:
+            old_log(os.path.join(old_dir, "18-10-2026.log"), prompt, REPLY, "(first token 0.42s, total 1.30s, 17 tokens)\n")
+        old = time.perf_counter() - start
+
+        logger = TurnLogger(os.path.join(new_dir, "luna.jsonl"), max_bytes=128 * 1024, backups=100)
+        latencies = []
+        start = time.perf_counter()
+        for prompt in prompts:
+            call = time.perf_counter()
+            logger.log("model", REPLY, prompt, prefix, "cli", "llama3:8b", stats)
+            latencies.append(time.perf_counter() - call)
+        new = time.perf_counter() - start
+        logger.close()
+        latencies.sort()
+
+        files = sorted(glob.glob(os.path.join(new_dir, "*")))
+        read_back = sorted(record["prompt"] for path in files for record in read_log(path))
+        assert read_back == sorted(prompts), "prompts didn't survive the round trip"
+        turns = len(read_back)
+        print(f"{args.turns} turns, {args.prefix_kb} KB static prefix\n")
+        print(f"old log_request_response  {old / args.turns * 1e6:8.1f} us per turn on the reply path, "
+              f"{folder_size(old_dir) / 1024:8.0f} KB on disk")
+        print(f"TurnLogger.log            {new / args.turns * 1e6:8.1f} us per turn (p99 {latencies[int(0.99 * len(latencies))] * 1e6:.1f} us), "
+              f"{folder_size(new_dir) / 1024:8.0f} KB on disk in {len(files)} files (rotated ones gzipped), {turns} turns read back")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,27 +1,15 @@
 # vtube-test.py (streaming)
-import requests
-import json
+import os
+import sys
 
-text = ""
-response = requests.post(
-    "http://localhost:11434/api/generate",
-    json={
-        "model": "llama3:8b",
-        "prompt": "Hello, how are you?",
-        "stream": True  # ← now we accept streaming
-    },
-    stream=True  # ← allows reading line-by-line
-)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ollama_client import get_client
 
-for line in response.iter_lines():
-    if line:
-        try:
-            body = json.loads(line)
-            if "response" in body:
-                text += body["response"]  # accumulate tokens
-            if body.get("done"):
-                break
-        except json.JSONDecodeError:
-            print("Failed to parse line:", line)
+text = ""
+for body in get_client().stream_generate("llama3:8b", "Hello, how are you?"):
+    if "response" in body:
+        text += body["response"]  # accumulate tokens
+        print(body["response"], end="", flush=True)
 
 print("\nFinal AI Response:", text)
@@ -0,0 +1,266 @@
+import re
+import time
+import threading
+from collections import deque
+from datetime import datetime
+
+from settings import *
+from ollama_client import OllamaError, get_client
+
+# Ollama reporting a load_duration longer than this means the model wasn't loaded
+COLD_LOAD_SECONDS = 0.25
+
+
+def keep_alive_seconds(value):
+    """Ollama's keep_alive (300, "5m", "1h30m", -1) in seconds, None for forever"""
+    if isinstance(value, (int, float)):
+        return None if value < 0 else value
+    parts = re.findall(r"(-?[\d.]+)(ms|s|m|h)?", str(value))
+    seconds = sum(float(number) * {"ms": 0.001, "m": 60, "h": 3600}.get(unit, 1) for number, unit in parts)
+    return None if seconds < 0 else seconds
+
+
+def full_name(model):
+    """How Ollama lists a model: "llama3" is "llama3:latest" """
+    return model if ":" in model else f"{model}:latest"
+
+
+class ModelState:
+    def __init__(self):
+        self.loaded = False
+        self.loading = False
+        self.expires = None         # time.monotonic() Ollama unloads it at, None = never
+        self.loads = 0
+        self.unloads = 0
+        self.cold_starts = 0        # replies that had to wait for a load
+
+
+class ModelManager:
+    """
+    Keeps Luna's model loaded in Ollama while someone is chatting.
+
+    preload() loads the model (and the fallback) at startup. Every reply
+    goes through record(), which notices cold starts (Ollama reporting a
+    real load time) and works out when keep_alive will unload the model.
+    While a session is open and the last turn is less than warm_for seconds
+    ago, a keeper thread refreshes the model before keep_alive runs out and
+    reloads it when something else unloaded it (checked with /api/ps).
+    After that, keep_alive lets it go.
+
+    fallback is a smaller model: pick() hands it short messages while the
+    main model is cold, and gets the main one loading for the next turn.
+    light is the small model light turns go to (see turn_tier), kept warm
+    the same way. Loads and unloads are kept in events, counts come out of stats().
+    """
+
+    def __init__(self, model=MODEL_NAME, fallback=MODEL_FALLBACK, keep_alive=OLLAMA_KEEP_ALIVE,
+                 warm_for=MODEL_WARM_FOR, check_every=MODEL_CHECK_EVERY, fallback_max_words=MODEL_FALLBACK_MAX_WORDS,
+                 client=None, light=LIGHT_MODEL):
+        self.model = model
+        self.fallback = fallback
+        self.light = light
+        self.keep_alive = keep_alive
+        self.warm_for = warm_for            # None keeps it warm as long as a session is open
+        self.check_every = check_every
+        self.fallback_max_words = fallback_max_words
+        self.client = client
+
+        self.states = {}
+        self.events = deque(maxlen=100)     # {"time", "event", "model", ...}, newest last
+        self.listeners = []
+        self.sessions = 0
+        self.last_turn = time.monotonic()
+        self.fallback_replies = 0
+        self.lock = threading.Lock()
+        self.thread = None
+        self.stopping = threading.Event()
+
+    def get_client(self):
+        return self.client or get_client()
+
+    def small_models(self):
+        """The fallback and the light model, whichever are set (once each)"""
+        return list(dict.fromkeys(filter(None, (self.fallback, self.light))))
+
+    def state(self, model):
+        with self.lock:
+            return self.states.setdefault(full_name(model), ModelState())
+
+    def on_event(self, listener):
+        """Call listener(event) on every load and unload"""
+        self.listeners.append(listener)
+
+    def _event(self, kind, model, **details):
+        event = {"time": time.time(), "event": kind, "model": model, **details}
+        self.events.append(event)
+        for listener in self.listeners:
+            listener(event)
+
+    # Loading
+
+    def preload(self):
+        """Load the small models (quick, they answer while the main one loads), then the main model"""
+        error = None
+        for model in self.small_models() + [self.model]:
+            try:
+                self.load(model, "preload")
+            except OllamaError as e:
+                error = error or e
+        if error:
+            raise error
+
+    def load(self, model, reason="preload"):
+        """Have Ollama load model now (or reset its keep_alive if it's loaded), an empty prompt only loads it"""
+        state = self.state(model)
+        with self.lock:
+            if state.loading:
+                return
+            state.loading = True
+        try:
+            body = self.get_client().generate(model, "", priority="background", keep_alive=self.keep_alive)
+        finally:
+            state.loading = False
+        self._loaded(model, body, reason)
+
+    def load_in_background(self, model, reason):
+        if not self.state(model).loading:
+            threading.Thread(target=self._try_load, args=(model, reason), daemon=True).start()
+
+    def _try_load(self, model, reason):
+        try:
+            self.load(model, reason)
+        except OllamaError:
+            pass    # the next turn that needs it will say what's wrong
+
+    def record(self, model, body):
+        """A reply came back from model (body: its final chunk)"""
+        self.last_turn = time.monotonic()
+        if body:
+            self._loaded(model, body, "reply")
+
+    def _loaded(self, model, body, reason):
+        state = self.state(model)
+        load = body.get("load_duration", 0) / 1e9
+        keep_alive = keep_alive_seconds(self.keep_alive)
+        with self.lock:
+            state.loaded = True
+            state.expires = None if keep_alive is None else time.monotonic() + keep_alive
+            cold = load > COLD_LOAD_SECONDS
+            if cold:
+                state.loads += 1
+                if reason == "reply":
+                    state.cold_starts += 1
+        if cold:
+            self._event("load", model, seconds=round(load, 3), reason=reason)
+
+    def _unloaded(self, model, reason):
+        state = self.state(model)
+        with self.lock:
+            if not state.loaded:
+                return
+            state.loaded = False
+            state.unloads += 1
+        self._event("unload", model, reason=reason)
+
+    def is_warm(self, model):
+        state = self.state(model)
+        return state.loaded and (state.expires is None or state.expires > time.monotonic())
+
+    def pick(self, model, message):
+        """The model to answer message with: model, or the fallback for a short message while model is cold"""
+        if not self.fallback or full_name(model) != full_name(self.model) or self.is_warm(model):
+            return model
+        if len(message.split()) > self.fallback_max_words or not self.is_warm(self.fallback):
+            return model
+        self.load_in_background(model, "fallback")
+        self.fallback_replies += 1
+        return self.fallback
+
+    # Keeping warm
+
+    def open_session(self):
+        """A chat started; the model is kept warm while any are open"""
+        with self.lock:
+            self.sessions += 1
+            self.last_turn = time.monotonic()
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._keep_warm, name="model-keeper", daemon=True)
+                self.thread.start()
+
+    def close_session(self):
+        with self.lock:
+            self.sessions = max(0, self.sessions - 1)
+
+    def stop(self):
+        self.stopping.set()
+
+    def _keep_warm(self):
+        while not self.stopping.wait(self.check_every):
+            try:
+                self.check()
+            except OllamaError:
+                pass    # Ollama is down, the next turn will say so
+
+    def check(self):
+        """Notice unloads, then refresh or reload the models if someone is chatting"""
+        self.sync()
+        idle = time.monotonic() - self.last_turn
+        if not self.sessions or (self.warm_for is not None and idle > self.warm_for):
+            return
+        for model in [self.model] + self.small_models():
+            state = self.state(model)
+            if state.loading:
+                continue
+            if not state.loaded:
+                self.load(model, "keep warm")
+            elif state.expires is not None and state.expires - time.monotonic() < 2 * self.check_every:
+                self.load(model, "refresh")
+
+    def sync(self):
+        """Match what we think is loaded with /api/ps (or with keep_alive, without /api/ps)"""
+        try:
+            running = set(self.get_client().ps())
+        except OllamaError:
+            running = None
+        with self.lock:
+            states = list(self.states.items())
+        for model, state in states:
+            if state.loading:
+                continue
+            if running is None:
+                if state.loaded and state.expires is not None and state.expires <= time.monotonic():
+                    self._unloaded(model, "keep_alive ran out")
+            elif model in running and not state.loaded:
+                # Loaded by someone else, with their keep_alive: refresh it on the next check
+                with self.lock:
+                    state.loaded, state.expires = True, time.monotonic()
+            elif model not in running:
+                self._unloaded(model, "not in /api/ps")
+
+    # Reporting
+
+    def stats(self):
+        with self.lock:
+            states = list(self.states.values())
+        stats = {
+            "warm": int(self.is_warm(self.model)),
+            "loads": sum(state.loads for state in states),
+            "unloads": sum(state.unloads for state in states),
+            "cold_starts": sum(state.cold_starts for state in states),
+            "fallback_replies": self.fallback_replies,
+            "sessions": self.sessions,
+        }
+        if self.fallback:
+            stats["fallback_warm"] = int(self.is_warm(self.fallback))
+        if self.light:
+            stats["light_warm"] = int(self.is_warm(self.light))
+        return stats
+
+    def format_events(self, count=5):
+        """The last few loads and unloads, one per line"""
+        lines = []
+        for event in list(self.events)[-count:]:
+            when = datetime.fromtimestamp(event["time"]).strftime("%H:%M:%S")
+            seconds = f" {event['seconds']:.2f}s" if event.get("seconds") else ""
+            lines.append(f"{when} {event['event']} {event['model']}{seconds} ({event['reason']})")
+        return "\n".join(lines)
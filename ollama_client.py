@@ -0,0 +1,195 @@
+import json
+import time
+import random
+import threading
+
+from settings import *
+
+# Imported with the first client (import_requests), it's most of Luna's import time
+requests = None
+HTTPAdapter = None
+
+
+def import_requests():
+    global requests, HTTPAdapter
+    if requests is None:
+        import requests
+        from requests.adapters import HTTPAdapter
+
+
+class OllamaError(Exception):
+    """Ollama could not produce an answer"""
+
+    def __init__(self, message, status=None):
+        super().__init__(message)
+        self.status = status    # HTTP status Ollama answered with, if it answered
+
+
+class OllamaUnavailable(OllamaError):
+    """The circuit breaker is open: Ollama failed too often, not even trying"""
+
+
+# Worth another try: Ollama is loading a model, restarting or overloaded
+TRANSIENT_STATUS = {429, 500, 502, 503, 504}
+
+
+class OllamaClient:
+    """
+    One shared connection to Ollama.
+
+    Keeps a pooled keep-alive session, applies connect/read timeouts,
+    retries transient failures with jittered exponential backoff and stops
+    hammering a dead server with a circuit breaker: after breaker_threshold
+    failed calls in a row every call fails fast for breaker_cooldown seconds,
+    then one call is let through to test the water (half-open). The others
+    keep failing fast until that probe gets an answer; if it fails too the
+    breaker opens for another cooldown.
+    """
+
+    def __init__(self, base_url=OLLAMA_URL, connect_timeout=OLLAMA_CONNECT_TIMEOUT, read_timeout=OLLAMA_READ_TIMEOUT,
+                 retries=OLLAMA_RETRIES, backoff=OLLAMA_BACKOFF, breaker_threshold=OLLAMA_BREAKER_THRESHOLD,
+                 breaker_cooldown=OLLAMA_BREAKER_COOLDOWN):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = (connect_timeout, read_timeout)
+        self.retries = retries
+        self.backoff = backoff
+        self.breaker_threshold = breaker_threshold
+        self.breaker_cooldown = breaker_cooldown
+
+        self.failures = 0
+        self.open_until = 0.0
+        self.probing = False        # a half-open trial call is in flight
+        self.lock = threading.Lock()
+
+        import_requests()
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=OLLAMA_POOL_SIZE)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def tags(self):
+        """Names of the locally available models"""
+        response = self._request("GET", "/api/tags")
+        return [model["name"] for model in response.json().get("models", [])]
+
+    def ps(self):
+        """Names of the models Ollama has loaded right now"""
+        response = self._request("GET", "/api/ps")
+        return [model["name"] for model in response.json().get("models", [])]
+
+    def generate(self, model, prompt, priority=None, **options):
+        """Non-streaming /api/generate, returns the whole JSON body"""
+        payload = {"model": model, "prompt": prompt, "stream": False, **self._options(options)}
+        return self._request("POST", "/api/generate", json=payload, headers=self._priority(priority)).json()
+
+    def stream_generate(self, model, prompt, priority=None, **options):
+        """
+        Streaming /api/generate, yields every NDJSON chunk as a dict.
+        Only the connection is retried; once chunks are flowing, a
+        broken stream raises instead of silently starting over.
+        priority picks the scheduler lane (interactive, background),
+        Ollama itself ignores it.
+        """
+        payload = {"model": model, "prompt": prompt, "stream": True, **self._options(options)}
+        response = self._request("POST", "/api/generate", json=payload, headers=self._priority(priority), stream=True)
+
+        try:
+            for line in response.iter_lines():
+                if not line:
+                    continue
+                try:
+                    body = json.loads(line)
+                except json.JSONDecodeError:
+                    print(f"{COLOR_RED}Failed to parse line:{COLOR_RESET} {line}")
+                    continue
+                if "error" in body:
+                    raise OllamaError(body["error"])
+                yield body
+                if body.get("done"):
+                    break
+        except requests.RequestException as e:
+            raise OllamaError(f"Stream from Ollama broke off: {e}") from e
+        finally:
+            response.close()
+
+    @staticmethod
+    def _options(options):
+        # Leave unset options (context=None, ...) out instead of sending nulls
+        return {key: value for key, value in options.items() if value is not None}
+
+    @staticmethod
+    def _priority(priority):
+        # Read by llm_scheduler.py when SCHEDULER_URL points there
+        return {"X-Luna-Priority": priority} if priority else None
+
+    def _request(self, method, path, **kwargs):
+        probe = self._check_breaker()
+        try:
+            return self._attempt(method, path, **kwargs)
+        finally:
+            if probe:
+                with self.lock:
+                    self.probing = False
+
+    def _attempt(self, method, path, **kwargs):
+        last_error = None
+        for attempt in range(self.retries):
+            if attempt:
+                # 0.5s, 1s, 2s, ... with full jitter so clients don't retry in lockstep
+                time.sleep(random.uniform(0, self.backoff * 2 ** (attempt - 1)))
+            try:
+                response = self.session.request(method, self.base_url + path, timeout=self.timeout, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                last_error = e
+                continue
+
+            if response.status_code in TRANSIENT_STATUS:
+                last_error = OllamaError(f"Ollama returned {response.status_code}: {response.text[:200]}", response.status_code)
+                response.close()
+                continue
+            if response.status_code != 200:
+                # Not worth retrying (unknown model, bad request), but Ollama itself is fine
+                self._record_success()
+                raise OllamaError(f"Ollama returned {response.status_code}: {response.text[:200]}", response.status_code)
+
+            self._record_success()
+            return response
+
+        self._record_failure()
+        raise OllamaError(f"Couldn't reach Ollama at {self.base_url} after {self.retries} attempts: {last_error}")
+
+    def _check_breaker(self):
+        """Raise OllamaUnavailable while the breaker is open, True if this call is the half-open probe"""
+        with self.lock:
+            if self.failures < self.breaker_threshold:
+                return False
+            if time.monotonic() < self.open_until:
+                raise OllamaUnavailable(f"Ollama at {self.base_url} is down, retrying in {self.open_until - time.monotonic():.0f}s")
+            if self.probing:
+                raise OllamaUnavailable(f"Ollama at {self.base_url} is down, checking if it's back")
+            self.probing = True
+            return True
+
+    def _record_success(self):
+        with self.lock:
+            self.failures = 0
+
+    def _record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.failures >= self.breaker_threshold:
+                self.open_until = time.monotonic() + self.breaker_cooldown
+
+
+_client = None
+
+
+def get_client():
+    """
+    The process-wide client, so every caller shares one connection pool.
+    Goes through the scheduler (llm_scheduler.py) when SCHEDULER_URL is set.
+    """
+    global _client
+    if _client is None:
+        _client = OllamaClient(SCHEDULER_URL or OLLAMA_URL)
+    return _client
@@ -0,0 +1,138 @@
+import random
+import hashlib
+from collections import Counter, defaultdict
+from difflib import SequenceMatcher
+
+from settings import *
+
+MERSENNE_PRIME = (1 << 61) - 1
+MAX_HASH = (1 << 32) - 1
+SHORT_LINE_CHARS = 12  # too few shingles to trust MinHash, checked by length instead
+
+
+def length_bounds(length, threshold):
+    """
+    Lengths another line can have and still get ratio() > threshold against
+    a line of this length. ratio() is 2*matches/(len(a)+len(b)) and there are
+    at most min(len(a), len(b)) matches, which rules out anything too short
+    or too long.
+    """
+    return length * threshold / (2 - threshold), length * (2 - threshold) / threshold
+
+
+def shingles(text, size=OPENING_SHINGLE_SIZE):
+    """Character n-grams of a line, with start/end markers so short lines still get some"""
+    text = "\x02" + " ".join(text.lower().split()) + "\x03"
+    return {text[i:i + size] for i in range(max(1, len(text) - size + 1))}
+
+
+class OpeningIndex:
+    """
+    First lines of Luna's previous replies, indexed for "has Luna opened like
+    this before?".
+
+    Every opening gets a MinHash signature of its character shingles, cut into
+    bands that go into LSH bucket tables, so a new line only gets compared to
+    openings that share a bucket with it instead of to all of them. Candidates
+    are then checked with the same SequenceMatcher(...).ratio() > threshold
+    test as before, so a match means exactly what it used to.
+
+    LSH can miss a pair now and then, so while the index is small (the usual
+    case, with the history capped) every opening is still compared, which
+    gives the old answer every time, and lines too short for shingles to say
+    much are checked against the openings of a fitting length.
+    """
+
+    def __init__(self, num_perm=OPENING_MINHASH_PERMUTATIONS, bands=OPENING_LSH_BANDS,
+                 shingle_size=OPENING_SHINGLE_SIZE, exact_scan_limit=OPENING_EXACT_SCAN_LIMIT, seed=1):
+        self.rows = num_perm // bands
+        self.bands = bands
+        self.shingle_size = shingle_size
+        self.exact_scan_limit = exact_scan_limit
+        rng = random.Random(seed)
+        self.permutations = [(rng.randrange(1, MERSENNE_PRIME), rng.randrange(MERSENNE_PRIME))
+                             for _ in range(self.rows * bands)]
+
+        self.counts = Counter()              # opening -> replies that start with it
+        self.signatures = {}
+        self.buckets = [defaultdict(set) for _ in range(bands)]
+        self.by_length = defaultdict(set)
+        self.synced = []
+
+    def __len__(self):
+        return len(self.counts)
+
+    def signature(self, text):
+        hashes = [int.from_bytes(hashlib.blake2b(s.encode("utf-8"), digest_size=4).digest(), "little")
+                  for s in shingles(text, self.shingle_size)]
+        return tuple(min((a * h + b) % MERSENNE_PRIME & MAX_HASH for h in hashes) for a, b in self.permutations)
+
+    def band_keys(self, signature):
+        return [signature[band * self.rows:(band + 1) * self.rows] for band in range(self.bands)]
+
+    def add(self, opening):
+        self.counts[opening] += 1
+        if self.counts[opening] > 1:
+            return
+        self.by_length[len(opening)].add(opening)
+        signature = self.signature(opening)
+        self.signatures[opening] = signature
+        for buckets, key in zip(self.buckets, self.band_keys(signature)):
+            buckets[key].add(opening)
+
+    def remove(self, opening):
+        if not self.counts[opening]:
+            return
+        self.counts[opening] -= 1
+        if self.counts[opening]:
+            return
+        del self.counts[opening]
+        self.by_length[len(opening)].discard(opening)
+        if not self.by_length[len(opening)]:
+            del self.by_length[len(opening)]
+        signature = self.signatures.pop(opening)
+        for buckets, key in zip(self.buckets, self.band_keys(signature)):
+            buckets[key].discard(opening)
+            if not buckets[key]:
+                del buckets[key]
+
+    def sync(self, openings):
+        """Make the index hold exactly these openings (only what changed gets (re)hashed)"""
+        if openings == self.synced:
+            return
+        wanted = Counter(openings)
+        for opening, count in (self.counts - wanted).items():
+            for _ in range(count):
+                self.remove(opening)
+        for opening, count in (wanted - self.counts).items():
+            for _ in range(count):
+                self.add(opening)
+        self.synced = list(openings)
+
+    def max_length(self):
+        """Length of the longest non-empty opening, 0 if there is none"""
+        return max(self.by_length, default=0)
+
+    def candidates(self, line, threshold):
+        low, high = length_bounds(len(line), threshold)
+        if len(self.counts) <= self.exact_scan_limit:
+            found = self.counts
+        elif len(line) < SHORT_LINE_CHARS:
+            found = [old for length in range(int(low), int(high) + 1) for old in self.by_length.get(length, ())]
+        else:
+            found = set()
+            for buckets, key in zip(self.buckets, self.band_keys(self.signature(line))):
+                found.update(buckets.get(key, ()))
+        return [old for old in found if low <= len(old) <= high]
+
+    def find(self, line, threshold=0.7):
+        """A previous opening line is too similar to, or None"""
+        if not line:
+            # ratio() of two empty strings is 1.0, of an empty and a non-empty one 0.0
+            return "" if "" in self.counts and threshold < 1 else None
+        for old in self.candidates(line, threshold):
+            matcher = SequenceMatcher(None, line, old)
+            # The quick ratios are upper bounds of ratio(), most candidates stop there
+            if matcher.real_quick_ratio() > threshold and matcher.quick_ratio() > threshold and matcher.ratio() > threshold:
+                return old
+        return None
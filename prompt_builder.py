@@ -0,0 +1,267 @@
+import hashlib
+
+from settings import *
+from token_counter import count_tokens, truncate_tokens
+
+# Prompt sections, in the order they appear
+PREFIX_SECTIONS = ("system", "knowledge", "user_info", "notes", "long_term")
+TURN_SECTIONS = ("relevant_knowledge", "history")
+# Sections that lose their oldest entries first when cut (the rest lose their end)
+NEWEST_FIRST = ("user_info", "notes", "history")
+SEPARATORS = {"relevant_knowledge": "\n\n"}
+
+
+def build_prefix(sections):
+    """
+    The part of the prompt that only changes when Luna learns something new:
+    system prompt, knowledge (when it is small enough to send whole), user info,
+    notes and the long-term summary. Built the same way byte for byte every
+    turn, so Ollama can reuse its KV cache for it.
+    """
+    system_prompt = "".join(sections["system"])
+    knowledge_str = "\n".join(sections["knowledge"])
+    user_info_str = "\n".join(sections["user_info"])
+    luna_notes_str = "\n".join(sections["notes"])
+    long_term = "\n".join(sections["long_term"])
+
+    return f"""{system_prompt}
+
+<knowledge>
+{knowledge_str}
+</knowledge>
+
+<user_info>
+{user_info_str}
+</user_info>
+
+<notes>
+{luna_notes_str}
+</notes>
+
+<long_term_memory>
+{long_term}
+</long_term_memory>
+
+"""
+
+
+def build_turn(sections):
+    """
+    The part that changes every turn: knowledge picked for this message,
+    the conversation and the instruction
+    """
+    history_str = "\n".join(sections["history"])
+
+    relevant_str = ""
+    if sections["relevant_knowledge"]:
+        chunks_str = "\n\n".join(sections["relevant_knowledge"])
+        relevant_str = f"""<relevant_knowledge>
+{chunks_str}
+</relevant_knowledge>
+
+"""
+
+    return f"""{relevant_str}<history>
+{history_str}
+</history>
+
+Respond to the latest message.
+"""
+
+
+def dedupe(items):
+    """Drop repeated entries, keeping the latest of each where it last appeared"""
+    seen = set()
+    kept = []
+    for item in reversed(items):
+        if item not in seen:
+            seen.add(item)
+            kept.append(item)
+    kept.reverse()
+    return kept
+
+
+def fit_items(items, budget, newest_first=False, separator="\n"):
+    """
+    The items that fit in budget tokens. Drops the oldest (newest_first) or
+    the last items, and cuts the one left if even that is too big alone.
+    """
+    kept = []
+    used = 0
+    separator_tokens = count_tokens(separator)
+    for item in (reversed(items) if newest_first else items):
+        cost = count_tokens(item) + (separator_tokens if kept else 0)
+        if used + cost > budget:
+            if not kept and budget > 0:
+                kept.append(truncate_tokens(item, budget))
+            break
+        kept.append(item)
+        used += cost
+    return kept[::-1] if newest_first else kept
+
+
+def section_tokens(sections, name):
+    items = sections[name]
+    return sum(count_tokens(item) for item in items) + count_tokens(SEPARATORS.get(name, "\n")) * max(0, len(items) - 1)
+
+
+class PromptAssembler:
+    """
+    Keeps the prompt inside the model's context window.
+
+    Every section gets at most its budget in PROMPT_SECTION_BUDGETS, which
+    only depends on the section itself, so the prefix stays byte-identical
+    (and cached by Ollama) while the history grows. Whatever is left after the
+    reply reserve goes to the system prompt and the history; if the prompt
+    still doesn't fit, sections are cut further in trim_order. usage holds the
+    tokens every section of the last prompt took.
+    """
+
+    def __init__(self, context_tokens=PROMPT_CONTEXT_TOKENS, reply_tokens=PROMPT_REPLY_TOKENS,
+                 budgets=PROMPT_SECTION_BUDGETS, trim_order=PROMPT_TRIM_ORDER):
+        self.available = context_tokens - reply_tokens
+        self.budgets = budgets
+        self.trim_order = trim_order
+        self.usage = {}
+        self.trimmed = []
+
+    def cap(self, name, items, budget):
+        separator = SEPARATORS.get(name, "\n")
+        if section_tokens({name: items}, name) <= budget:
+            return items
+        if name not in self.trimmed:
+            self.trimmed.append(name)
+        return fit_items(items, budget, name in NEWEST_FIRST, separator)
+
+    def cap_sections(self, sections):
+        """Apply the per-section budgets (notes are deduplicated first)"""
+        self.trimmed = []
+        sections = dict(sections)
+        sections["notes"] = dedupe(sections["notes"])
+        for name, budget in self.budgets.items():
+            if name in sections and budget is not None:
+                sections[name] = self.cap(name, sections[name], budget)
+        return sections
+
+    def fit(self, sections, render, names, used=0):
+        """
+        Cut the named sections in trim_order until render(sections) fits the
+        context window next to the used tokens already in it.
+        Returns (prompt, sections).
+        """
+        prompt = render(sections)
+        total = used + count_tokens(prompt)
+        for name in self.trim_order:
+            if name not in names:
+                continue
+            # Token counts of the parts and of the whole differ a little, so cut again until it fits
+            while total > self.available:
+                tokens = section_tokens(sections, name)
+                if not tokens:
+                    break
+                sections = dict(sections)
+                sections[name] = self.cap(name, sections[name], max(0, tokens - (total - self.available)))
+                prompt = render(sections)
+                total = used + count_tokens(prompt)
+                if section_tokens(sections, name) >= tokens:
+                    break
+        return prompt, sections
+
+    def measure(self, sections, names, prompt):
+        """Record the tokens each section of the prompt sent this turn takes"""
+        self.usage = {name: section_tokens(sections, name) for name in names}
+        self.usage["total"] = count_tokens(prompt)
+        return self.usage
+
+
+def format_usage(usage):
+    """'system 412, history 230, ...' for the sections that took any tokens, biggest first"""
+    parts = [f"{name} {tokens}" for name, tokens in sorted(usage.items(), key=lambda item: -item[1])
+             if tokens and name != "total"]
+    return ", ".join(parts)
+
+
+class ConversationContext:
+    """
+    The `context` token array Ollama returned with the last reply.
+
+    It already holds everything the model has read and written so far, so as
+    long as the prompt prefix and the model stay the same, the next turn only
+    has to send the new user message along with it. Anything that changes the
+    prefix (new notes, new knowledge, another model) or a context that grew
+    past max_tokens throws it away and the next turn sends the full prompt.
+    """
+
+    def __init__(self, max_tokens=OLLAMA_CONTEXT_MAX_TOKENS):
+        self.max_tokens = max_tokens
+        self.tokens = None
+        self.key = None
+
+    @staticmethod
+    def make_key(model, prefix):
+        return hashlib.sha256(f"{model}\0{prefix}".encode("utf-8")).hexdigest()
+
+    def lookup(self, model, prefix):
+        """Context tokens to continue from, or None when the full prompt has to be sent"""
+        if self.tokens and self.key == self.make_key(model, prefix) and len(self.tokens) <= self.max_tokens:
+            return self.tokens
+        return None
+
+    def update(self, model, prefix, tokens):
+        self.key = self.make_key(model, prefix)
+        self.tokens = tokens or None
+
+    def reset(self):
+        self.tokens = None
+        self.key = None
+
+
+def select_knowledge(index, query, token_budget=KNOWLEDGE_TOKEN_BUDGET):
+    """
+    Decide how knowledge goes into the prompt. Returns (whole text for the
+    prefix, relevant chunks for this turn): a file that fits the budget is
+    sent whole as part of the cached prefix, a bigger one only contributes
+    its best matching chunks.
+    """
+    if index is None:
+        return "", []
+    index.refresh()
+    return index.select(query, token_budget)
+
+
+def build_prompt(system_prompt, memory, user_input, model, context, knowledge_index=None, long_term="", assembler=None):
+    """
+    Build the prompt for this turn. Returns (prompt, prefix, context tokens).
+    With reusable context only the latest user message is sent, otherwise
+    the stable prefix followed by the whole recent history. Sections are kept
+    to their token budgets by assembler (per-section usage ends up in assembler.usage).
+    """
+    assembler = assembler or PromptAssembler()
+    # Search with the recent conversation too, so follow-ups ("and then?") still find their topic
+    query = " ".join(memory["conversation_history"][-3:] + [user_input])
+    knowledge, relevant = select_knowledge(knowledge_index, query)
+
+    sections = assembler.cap_sections({
+        "system": [system_prompt],
+        "knowledge": [knowledge] if knowledge else [],
+        "user_info": [f"{k}: {v}" for k, v in memory["user_info"].items()],
+        "notes": memory["luna_notes"],
+        "long_term": [long_term] if long_term else [],
+        "relevant_knowledge": relevant,
+        "history": memory["conversation_history"],
+    })
+    # Fit the full prompt first: the context was stored under the prefix as it was sent,
+    # after fitting, so a long conversation that gets notes cut must look it up the same way
+    prompt, fitted = assembler.fit(sections, lambda parts: build_prefix(parts) + build_turn(parts),
+                                   PREFIX_SECTIONS + TURN_SECTIONS)
+    prefix = build_prefix(fitted)
+    tokens = context.lookup(model, prefix) if context else None
+    if tokens:
+        # The prefix and earlier turns are already in the context, only this turn is new
+        sections["history"] = [f"User: {user_input}"]
+        prompt, sections = assembler.fit(sections, build_turn, TURN_SECTIONS, used=len(tokens))
+        assembler.measure(sections, TURN_SECTIONS, prompt)
+        return prompt, prefix, tokens
+
+    assembler.measure(fitted, PREFIX_SECTIONS + TURN_SECTIONS, prompt)
+    return prompt, prefix, None
@@ -0,0 +1,169 @@
+import re
+import time
+import random
+import hashlib
+import threading
+from collections import OrderedDict
+from difflib import SequenceMatcher
+
+from settings import *
+
+# Messages that are just a hello, answered the same whatever came before
+GREETING = re.compile(r"(?:h+i+(?:y+a+)?|h+e+y+a*|h+e+l+o+|y+o+|s+u+p+|howdy|greetings|(?:good )?(?:morning|evening|afternoon|night))\b")
+PUNCTUATION = re.compile(r"[^\w\s']+")
+STRETCHED = re.compile(r"(\w)\1{2,}")
+
+
+def normalize(text):
+    """Lowercase, no punctuation, 'hiiii' -> 'hi', single spaces"""
+    text = STRETCHED.sub(r"\1", PUNCTUATION.sub(" ", text.lower()))
+    return " ".join(text.split())
+
+
+def is_greeting(message, max_words=RESPONSE_CACHE_GREETING_WORDS):
+    return len(message.split()) <= max_words and GREETING.match(message) is not None
+
+
+class CacheEntry:
+    def __init__(self, created):
+        self.created = created
+        self.replies = []       # different replies Luna gave to this prompt
+        self.last = None        # the one handed out last time
+
+
+class ResponseCache:
+    """
+    Replies Luna already gave, reused for prompts she's seen before.
+
+    The exact tier keys on (system prompt version, model, user facts, the
+    last few history messages, normalized message). Greetings skip the
+    history and the fuzzy tier matches them against greetings already
+    answered ("hiii luna" finds "hi luna"). Entries live for ttl seconds,
+    the least recently used go first once there are max_entries.
+
+    To keep cached replies from feeling canned, every prompt collects
+    variants different replies before any is reused, a hit picks one at
+    random (never the one picked last time) and now and then (refresh) a
+    hit generates a new reply anyway, pushing out the oldest variant.
+    Each persona (system prompt) has its own random generator.
+    """
+
+    def __init__(self, max_entries=RESPONSE_CACHE_SIZE, ttl=RESPONSE_CACHE_TTL, variants=RESPONSE_CACHE_VARIANTS,
+                 refresh=RESPONSE_CACHE_REFRESH, context_messages=RESPONSE_CACHE_CONTEXT_MESSAGES,
+                 fuzzy_threshold=RESPONSE_CACHE_FUZZY_THRESHOLD, seed=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.variants = variants
+        self.refresh = refresh
+        self.context_messages = context_messages
+        self.fuzzy_threshold = fuzzy_threshold      # None turns the fuzzy tier off
+        self.seed = seed
+        self.entries = OrderedDict()    # key -> CacheEntry, least recently used first
+        self.greetings = {}             # (persona, model, facts) -> {normalized greeting: key}
+        self.randoms = {}               # persona -> random.Random
+        self.counts = {"hits": 0, "fuzzy_hits": 0, "misses": 0, "stores": 0, "evictions": 0, "expired": 0}
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def persona(system_prompt):
+        """Short version id of a system prompt, changes whenever the prompt is edited"""
+        return hashlib.sha256(system_prompt.encode("utf-8")).hexdigest()[:12]
+
+    def make_key(self, system_prompt, model, history, message, user_info=None):
+        """(persona, key, greeting scope or None) of a prompt"""
+        persona = self.persona(system_prompt)
+        message = normalize(message)
+        facts = tuple(sorted((user_info or {}).items()))
+        if is_greeting(message):
+            scope = (persona, model, facts)
+            return persona, self._hash(scope, message), scope
+        context = [normalize(line) for line in history[-self.context_messages:]] if self.context_messages else []
+        return persona, self._hash((persona, model, facts, context), message), None
+
+    @staticmethod
+    def _hash(scope, message):
+        return hashlib.sha256(repr((scope, message)).encode("utf-8")).hexdigest()
+
+    def lookup(self, system_prompt, model, history, message, user_info=None, is_repeat=None):
+        """
+        (reply, "exact" or "fuzzy") for a prompt seen often enough, else (None, None).
+        is_repeat(reply) can veto variants that would open like a recent reply.
+        """
+        persona, key, scope = self.make_key(system_prompt, model, history, message, user_info)
+        with self.lock:
+            tier = "exact"
+            entry = self._get(key)
+            if entry is None and scope is not None and self.fuzzy_threshold:
+                key = self._fuzzy_key(scope, normalize(message))
+                entry = self._get(key) if key else None
+                tier = "fuzzy"
+
+            rng = self.randoms.setdefault(persona, random.Random(f"{self.seed}:{persona}" if self.seed is not None else None))
+            if entry is None or len(entry.replies) < self.variants or rng.random() < self.refresh:
+                self.counts["misses"] += 1
+                return None, None
+
+            choices = [reply for reply in entry.replies if reply != entry.last] if len(entry.replies) > 1 else list(entry.replies)
+            if is_repeat:
+                choices = [reply for reply in choices if not is_repeat(reply)]
+            if not choices:
+                self.counts["misses"] += 1
+                return None, None
+            entry.last = rng.choice(choices)
+            self.counts["hits" if tier == "exact" else "fuzzy_hits"] += 1
+            return entry.last, tier
+
+    def store(self, system_prompt, model, history, message, reply, user_info=None):
+        """Remember a freshly generated reply as one more variant of this prompt"""
+        if not reply.strip():
+            return
+        _, key, scope = self.make_key(system_prompt, model, history, message, user_info)
+        with self.lock:
+            entry = self._get(key)
+            if entry is None:
+                entry = self.entries[key] = CacheEntry(time.monotonic())
+                if scope is not None:
+                    self.greetings.setdefault(scope, {})[normalize(message)] = key
+            if reply in entry.replies:
+                return
+            entry.replies.append(reply)
+            del entry.replies[:-self.variants]
+            entry.last = reply
+            self.counts["stores"] += 1
+            while len(self.entries) > self.max_entries:
+                self._drop(next(iter(self.entries)))
+                self.counts["evictions"] += 1
+
+    def stats(self):
+        with self.lock:
+            hits = self.counts["hits"] + self.counts["fuzzy_hits"]
+            lookups = hits + self.counts["misses"]
+            return {**self.counts, "entries": len(self.entries), "hit_rate": hits / lookups if lookups else 0.0}
+
+    def _get(self, key):
+        """Entry under key, moved to the recent end, or None if missing or expired"""
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        if time.monotonic() - entry.created > self.ttl:
+            self._drop(key)
+            self.counts["expired"] += 1
+            return None
+        self.entries.move_to_end(key)
+        return entry
+
+    def _drop(self, key):
+        del self.entries[key]
+        for greetings in self.greetings.values():
+            for greeting, greeting_key in list(greetings.items()):
+                if greeting_key == key:
+                    del greetings[greeting]
+
+    def _fuzzy_key(self, scope, message):
+        """Key of the closest greeting answered in this scope, if it's close enough"""
+        best, best_key = self.fuzzy_threshold, None
+        for greeting, key in self.greetings.get(scope, {}).items():
+            matcher = SequenceMatcher(None, message, greeting)
+            if matcher.real_quick_ratio() >= best and matcher.quick_ratio() >= best and (ratio := matcher.ratio()) >= best:
+                best, best_key = ratio, key
+        return best_key
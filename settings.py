@@ -12,15 +12,105 @@ COLOR_RESET = "\033[0m"     # Reset
 
 # Model name (update this if you switch models)
 MODEL_NAME = "llama3:8b"
-AI_STREAM = False
+OLLAMA_URL = "http://localhost:11434"
+OLLAMA_CONNECT_TIMEOUT = 3.05  # seconds to establish the connection
+OLLAMA_READ_TIMEOUT = 120      # seconds to wait for the next bytes (model loads can be slow)
+OLLAMA_RETRIES = 3             # attempts per request on connection errors / 5xx
+OLLAMA_BACKOFF = 0.5           # base delay between attempts, doubled every retry
+OLLAMA_BREAKER_THRESHOLD = 5   # failed requests in a row before failing fast
+OLLAMA_BREAKER_COOLDOWN = 30   # seconds to fail fast before trying again
+OLLAMA_POOL_SIZE = 8           # kept-alive connections
+OLLAMA_KEEP_ALIVE = "30m"             # keep the model (and its prompt cache) loaded between turns
+MODEL_WARM_FOR = 3600                 # keep the model loaded while the last turn is less than this many seconds ago (None: as long as Luna runs)
+MODEL_CHECK_EVERY = 30                # seconds between checks that the model is still loaded
+MODEL_FALLBACK = None                 # smaller model (e.g. "llama3.2:1b") preloaded to answer short messages while MODEL_NAME is cold
+MODEL_FALLBACK_MAX_WORDS = 6          # longer messages always wait for MODEL_NAME
+LIGHT_MODEL = None                    # small model (e.g. "llama3.2:1b") for light turns: greetings, short reactions. None: MODEL_NAME answers everything
+LIGHT_MAX_WORDS = 8                   # longer messages are heavy turns
+LIGHT_KNOWLEDGE_TERMS = 2             # a message with this many words from the knowledge file is a heavy turn
+LIGHT_RACE = False                    # light turns ask both models, the first acceptable reply wins (shown whole, not streamed)
+LIGHT_REPLY_MAX_WORDS = 60            # a longer light reply is rejected (in a race MODEL_NAME's reply is used instead)
+OLLAMA_CONTEXT_MAX_TOKENS = 6000      # start over with a fresh prompt once the carried context gets this long
+PROMPT_CONTEXT_TOKENS = 8192   # the model's context length, sent to Ollama as num_ctx
+PROMPT_REPLY_TOKENS = 512      # kept free for the reply
+PROMPT_TOKENIZER = "auto"      # auto (tiktoken if installed, else estimate) or estimate
+AI_STREAM = True  # print tokens as they arrive instead of waiting for the full reply
+OPENING_SHINGLE_SIZE = 3            # characters per shingle when comparing reply openings
+OPENING_MINHASH_PERMUTATIONS = 64   # MinHash signature length
+OPENING_LSH_BANDS = 32              # signature bands, more bands find looser matches
+OPENING_EXACT_SCAN_LIMIT = 64       # up to this many openings, just compare against all of them
 LUNA_PROMPT_FILE = "luna_prompt.txt"
+STARTUP_IN_BACKGROUND = True  # index knowledge, load the TTS voice and the model while the first message is typed
 
 # Memory file path
 MEMORY_FILE = "memory/memory.json"
-LONG_MEMORY_FILE = "memory/long_memory.json"
+CONVERSATION_DB = "memory/conversations.db"  # every message, plus long-term summaries
+HISTORY_MESSAGES = 5         # recent messages put into the prompt
+SUMMARY_BATCH_TURNS = 10     # older messages gathered before they get folded into the summary, and the most folded in per call
+SUMMARY_MAX_TOKENS = 200     # size cap of the long-term summary in the prompt
+MEMORY_FLUSH_DELAY = 0.5     # seconds to gather saves into one background write
+MEMORY_COMPACT_EVERY = 50    # journal entries before the memory file is rewritten
+
+# Chat server (luna_server.py)
+SERVER_HOST = "127.0.0.1"
+SERVER_PORT = 8765
+SERVER_MAX_CONCURRENT_TURNS = 4     # turns talking to Ollama at once (match OLLAMA_NUM_PARALLEL), the rest wait
+SERVER_MAX_SESSIONS = 1000
+SERVER_SESSION_DIR = "memory/sessions"  # short memory of every session, None to keep it in RAM
+
+# Generation scheduler (llm_scheduler.py), one queue for every front-end sharing an Ollama
+SCHEDULER_URL = None                # e.g. "http://127.0.0.1:11435" to send generations through the scheduler
+SCHEDULER_HOST = "127.0.0.1"
+SCHEDULER_PORT = 11435
+SCHEDULER_PARALLEL = 4              # generations sent to Ollama at once (match OLLAMA_NUM_PARALLEL)
+SCHEDULER_LANES = ["interactive", "background"]     # priority lanes, most urgent first
+SCHEDULER_DEFAULT_LANE = "interactive"              # for callers that don't say
+SCHEDULER_QUEUE_LIMITS = {"interactive": 32, "background": 8}   # waiting jobs per lane before new ones get turned away
+SCHEDULER_AGING = 30                # seconds of waiting that move a job up one lane (0 = never)
+
+# Turn log (turn_logger.py): one JSON line per turn, written in the background
+LOG_FILE = "logs/luna.jsonl"
+WEB_LOG_FILE = "logs/web.jsonl"         # misc/luna_chat.py
+SERVER_LOG_FILE = "logs/server.jsonl"   # luna_server.py, its own file: processes can't share one they rotate
+LOG_MAX_BYTES = 10 * 1024 * 1024        # rotate once the file gets this big...
+LOG_ROTATE_EVERY = 24 * 60 * 60         # ...or this old (seconds)
+LOG_BACKUPS = 14                        # rotated files kept
+LOG_COMPRESS = True                     # gzip rotated files
+LOG_FLUSH_DELAY = 1.0                   # seconds of quiet before buffered lines are flushed
+LOG_BUFFER_BYTES = 64 * 1024
+LOG_VIEWER_PAGE_SIZE = 20               # turns per page in web/flask_app.py
+LOG_TAIL_POLL = 1.0                     # seconds between checks for new turns in the live tail
+
+# Latency metrics (turn_metrics.py)
+METRICS_WINDOW = 500            # recent turns the percentiles in 'stats' are taken over
+METRICS_PORT = None             # e.g. 9108 to serve Prometheus metrics at /metrics while chatting
+
+# Response cache (response_cache.py): reuse replies to prompts Luna has answered before
+RESPONSE_CACHE_ENABLED = False          # opt in: True lets repeated prompts skip the model
+RESPONSE_CACHE_SIZE = 512               # prompts remembered, least recently used dropped first
+RESPONSE_CACHE_TTL = 6 * 60 * 60        # seconds a cached prompt is kept
+RESPONSE_CACHE_VARIANTS = 3             # different replies collected per prompt before any is reused
+RESPONSE_CACHE_REFRESH = 0.2            # chance a hit asks the model for a fresh variant anyway
+RESPONSE_CACHE_CONTEXT_MESSAGES = 2     # recent history messages that are part of the key
+RESPONSE_CACHE_FUZZY_THRESHOLD = 0.8    # how close a greeting must be to a cached one, None = exact only
+RESPONSE_CACHE_GREETING_WORDS = 4       # longer messages are never treated as greetings
 
 # Load knowledge file (from PDF or TXT)
 KNOWLEDGE_FILE = "user_knowledge.txt"
+KNOWLEDGE_CHUNK_WORDS = 120     # words per indexed chunk
+KNOWLEDGE_TOP_K = 4             # most relevant chunks put into a prompt
+KNOWLEDGE_TOKEN_BUDGET = 800    # max prompt tokens for knowledge; smaller files are sent whole
+
+# Max prompt tokens per section (system prompt and history get whatever is left).
+# When the prompt still doesn't fit, sections are cut in PROMPT_TRIM_ORDER.
+PROMPT_SECTION_BUDGETS = {
+    "knowledge": KNOWLEDGE_TOKEN_BUDGET,
+    "user_info": 150,
+    "notes": 300,
+    "long_term": SUMMARY_MAX_TOKENS,
+    "relevant_knowledge": KNOWLEDGE_TOKEN_BUDGET,
+}
+PROMPT_TRIM_ORDER = ("notes", "relevant_knowledge", "knowledge", "long_term", "history", "user_info", "system")
 
 
 # TTS_Settings
@@ -40,7 +130,14 @@ CONFIG_PATHS = {
 
 PIPER_MODEL_PATH = MODELS_PATHS[TTS_VOICE]
 PIPER_CONFIG_PATH = CONFIG_PATHS[TTS_VOICE]
-AUDIO_OUTPUT_FILE = "audio/output.wav"
+AUDIO_OUTPUT_FILE = "audio/output.wav"  # only written when TTS_DEBUG_WAV is on
+TTS_DEBUG_WAV = False  # also save every spoken clip to AUDIO_OUTPUT_FILE
+TTS_CACHE_DIR = "audio/cache"  # synthesized clips of repeated sentences, None to keep them in memory only
+TTS_CACHE_MEMORY_MB = 16
+TTS_CACHE_DISK_MB = 128
+TTS_AUDIO_SINK = "auto"  # auto (system player), null (no sound) or recording (keep clips in memory)
+PIPER_COMMAND = "piper"
+TTS_MIN_SENTENCE_CHARS = 20  # shorter sentences are spoken together with the next one
 
 
 def validate_tts_paths():
@@ -0,0 +1,73 @@
+import re
+from functools import lru_cache
+
+from settings import *
+
+try:
+    import tiktoken
+except ImportError:  # no tiktoken, the estimate below is used
+    tiktoken = None
+
+# Splits text about the way BPE tokenizers (llama3, GPT) pre-split it before merging
+PIECES = re.compile(r"'(?:s|t|re|ve|m|ll|d)\b| ?[^\W\d_]+| ?\d{1,3}| ?[^\w\s]+|\s+", re.IGNORECASE)
+
+_encoding = None
+
+
+def get_encoding():
+    """tiktoken's cl100k_base (llama3's vocabulary is built on it), or None"""
+    global _encoding
+    if _encoding is None and tiktoken is not None and PROMPT_TOKENIZER in ("auto", "tiktoken"):
+        try:
+            _encoding = tiktoken.get_encoding("cl100k_base")
+        except Exception as e:  # first use downloads the vocabulary, can't do that offline
+            print(f"{COLOR_YELLOW}tiktoken unavailable, estimating tokens instead: {str(e)}{COLOR_RESET}")
+            _encoding = False
+    return _encoding or None
+
+
+def estimate_piece(piece):
+    """Tokens in one pre-split piece: common words are one token, long ones get cut up"""
+    size = len(piece.lstrip(" "))
+    if not size:
+        return 1
+    if piece[-1].isalpha():
+        return 1 + (size - 1) // 6
+    if piece[-1].isspace():
+        return 1 if "\n" not in piece else piece.count("\n")
+    return (size + 2) // 3
+
+
+@lru_cache(maxsize=1024)
+def count_tokens(text):
+    """Tokens the model will see for text, from tiktoken when available, else a fast local estimate"""
+    if not text:
+        return 0
+    encoding = get_encoding()
+    if encoding:
+        return len(encoding.encode(text, disallowed_special=()))
+    return sum(estimate_piece(piece) for piece in PIECES.findall(text))
+
+
+def truncate_tokens(text, budget, keep="start"):
+    """
+    Cut text to about budget tokens at a word boundary, keeping its start
+    (or its end with keep="end"), marking the cut with an ellipsis
+    """
+    if count_tokens(text) <= budget:
+        return text
+    if budget <= 0:
+        return ""
+    pieces = PIECES.findall(text)
+    if keep == "end":
+        pieces.reverse()
+    used = 0
+    kept = []
+    for piece in pieces:
+        used += estimate_piece(piece)
+        if used > budget - 1:
+            break
+        kept.append(piece)
+    if keep == "end":
+        return "…" + "".join(reversed(kept)).lstrip()
+    return "".join(kept).rstrip() + "…"
@@ -0,0 +1,317 @@
+import io
+import os
+import glob
+import gzip
+import json
+import time
+import queue
+import atexit
+import shutil
+import bisect
+import hashlib
+import threading
+from datetime import datetime
+
+from settings import *
+
+
+def prefix_hash(prefix):
+    return hashlib.sha256(prefix.encode("utf-8")).hexdigest()[:16]
+
+
+class TurnLogger:
+    """
+    Every turn as one JSON line, written in the background.
+
+    log() only puts a record on a queue, so the reply never waits for the
+    disk. The writer keeps the file open with a big buffer and flushes once
+    it's been quiet for flush_delay seconds. The static prompt prefix
+    (system prompt, knowledge, ...) is stored once per file as a "prefix"
+    record, turns only carry its hash and the part of the prompt after it.
+    The file is rotated when it gets bigger than max_bytes or older than
+    rotate_every seconds, rotated files are gzipped (compress) and only the
+    newest backups are kept.
+    """
+
+    def __init__(self, path=LOG_FILE, max_bytes=LOG_MAX_BYTES, rotate_every=LOG_ROTATE_EVERY, backups=LOG_BACKUPS,
+                 compress=LOG_COMPRESS, flush_delay=LOG_FLUSH_DELAY):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.rotate_every = rotate_every
+        self.backups = backups
+        self.compress = compress
+        self.flush_delay = flush_delay
+
+        self.queue = queue.Queue()
+        self.file = None
+        self.started = None         # time of the first record in the current file
+        self.size = 0               # bytes in the current file, counted so the hot path never asks it (tell() flushes)
+        self.prefixes = set()       # prefix hashes already in the current file
+        self.dirty = False
+        self.closed = False
+        self.thread = None
+        self.lock = threading.Lock()
+
+    def log(self, kind, response, prompt=None, prefix=None, session=None, model=None, stats=None):
+        """
+        Queue one turn and return immediately.
+        kind says who answered (model, cache, custom), prefix is the static
+        start of prompt if there is one.
+        """
+        if self.closed:
+            return
+        self.start()
+        self.queue.put({
+            "time": time.time(), "kind": kind, "session": session, "model": model,
+            "prompt": prompt, "prefix": prefix, "response": response, "stats": dict(stats) if stats else None
+        })
+
+    def start(self):
+        with self.lock:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._writer, daemon=True)
+                self.thread.start()
+                atexit.register(self.close)
+
+    def flush(self):
+        """Wait until everything logged so far is on disk"""
+        if self.thread is not None:
+            done = threading.Event()
+            self.queue.put(done)
+            done.wait()
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        if self.thread is not None:
+            self.queue.put(None)
+            self.thread.join()
+
+    def _writer(self):
+        while True:
+            try:
+                item = self.queue.get(timeout=self.flush_delay if self.dirty else None)
+            except queue.Empty:
+                self._flush()
+                continue
+            if item is None:
+                break
+            if isinstance(item, threading.Event):
+                self._flush()
+                item.set()
+                continue
+            try:
+                self._write(item)
+            except OSError as e:
+                print(f"{COLOR_RED}Could not write the log:\n{COLOR_RESET}{str(e)}")
+        self._flush()
+        if self.file:
+            self.file.close()
+
+    def _write(self, record):
+        if self.file is None:
+            self._open()
+        elif self.size >= self.max_bytes or record["time"] - self.started >= self.rotate_every:
+            self._rotate()
+
+        prompt, prefix = record["prompt"], record.pop("prefix")
+        if prefix:
+            key = prefix_hash(prefix)
+            if key not in self.prefixes:
+                self._write_line({"time": record["time"], "kind": "prefix", "hash": key, "text": prefix})
+                self.prefixes.add(key)
+            record["prefix"] = key
+            if prompt and prompt.startswith(prefix):
+                # When Ollama's context was reused the prompt doesn't repeat the prefix
+                record["prompt"] = prompt[len(prefix):]
+                record["prefixed"] = True
+        self._write_line(record)
+
+    def _write_line(self, record):
+        record = {**record, "time": datetime.fromtimestamp(record["time"]).isoformat(timespec="milliseconds")}
+        line = json.dumps(record, ensure_ascii=False, default=str) + "\n"
+        self.file.write(line)
+        self.size += len(line.encode("utf-8"))
+        self.dirty = True
+
+    def _flush(self):
+        if self.file and self.dirty:
+            try:
+                self.file.flush()
+            except OSError as e:
+                print(f"{COLOR_RED}Could not write the log:\n{COLOR_RESET}{str(e)}")
+        self.dirty = False
+
+    def _open(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self.started = time.time()
+        self.size = os.path.getsize(self.path) if os.path.exists(self.path) else 0
+        if self.size:
+            # Carry on with the file the last run left, its age counts from its first record
+            with open(self.path, "r", encoding="utf-8") as f:
+                try:
+                    self.started = datetime.fromisoformat(json.loads(f.readline())["time"]).timestamp()
+                except (ValueError, KeyError):
+                    pass
+        self.file = open(self.path, "a", encoding="utf-8", buffering=LOG_BUFFER_BYTES)
+        self.prefixes = set()
+
+    def _rotate(self):
+        self.file.close()
+        base, extension = os.path.splitext(self.path)
+        rotated = f"{base}-{datetime.fromtimestamp(self.started).strftime('%Y%m%d-%H%M%S-%f')[:-3]}{extension}"
+        os.replace(self.path, rotated)
+        if self.compress:
+            with open(rotated, "rb") as source, gzip.open(rotated + ".gz", "wb") as target:
+                shutil.copyfileobj(source, target)
+            os.remove(rotated)
+        old = rotated_logs(self.path)
+        for path in old[:max(0, len(old) - self.backups)]:
+            os.remove(path)
+        self._open()
+
+
+def rotated_logs(path):
+    """The backups TurnLogger rotated path into (plain or gzipped), oldest first: timestamped names sort that way"""
+    base, extension = os.path.splitext(path)
+    return sorted(glob.glob(f"{glob.escape(base)}-*{extension}*"))
+
+
+def read_log(path):
+    """Turns in a log file (plain or gzipped), with the prefix put back in front of each prompt"""
+    prefixes = {}
+    with (gzip.open if path.endswith(".gz") else open)(path, "rt", encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue    # a line cut short by a crash
+            if record.get("kind") == "prefix":
+                prefixes[record["hash"]] = record["text"]
+                continue
+            if record.pop("prefixed", False):
+                record["prompt"] = prefixes.get(record["prefix"], "") + record["prompt"]
+            yield record
+
+
+class LogIndex:
+    """
+    Byte offsets of the turns in a JSONL log, so a page of them can be read
+    without loading the whole file. refresh() only reads what was appended
+    since last time and starts over when the file was rotated (new inode or
+    smaller than before); generation counts those restarts.
+    A gzipped backup never changes: it's unpacked into memory the first
+    time it's refreshed and indexed once.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.packed = path.endswith(".gz")
+        self.unpacked = None            # the decompressed bytes of a .gz backup, once read
+        self.lock = threading.Lock()
+        self.reset(None)
+
+    def reset(self, identity):
+        self.identity = identity        # (device, inode) of the indexed file
+        self.offsets = []               # where every turn line starts, oldest first
+        self.times = []                 # its ISO time, which sorts like the time
+        self.prefixes = {}              # prefix hash -> offset of its record
+        self.prefix_texts = {}
+        self.size = 0                   # bytes indexed, always ends on a whole line
+        self.generation = getattr(self, "generation", -1) + 1
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def refresh(self):
+        with self.lock:
+            try:
+                stat = os.stat(self.path)
+            except FileNotFoundError:
+                if self.identity is not None:
+                    self.reset(None)
+                return
+            identity = (stat.st_dev, stat.st_ino)
+            if self.packed:
+                if identity != self.identity:
+                    self.reset(identity)
+                    self.unpacked = None
+                    self._index()
+                return
+            if identity != self.identity or stat.st_size < self.size:
+                self.reset(identity)
+            if stat.st_size == self.size:
+                return
+            self._index()
+
+    def _open(self):
+        """The log as a binary file, a gzipped backup unpacked the first time"""
+        if not self.packed:
+            return open(self.path, "rb")
+        if self.unpacked is None:
+            with gzip.open(self.path, "rb") as f:
+                self.unpacked = f.read()
+        return io.BytesIO(self.unpacked)
+
+    def _index(self):
+        """Index the lines after self.size (call with the lock held)"""
+        with self._open() as f:
+            f.seek(self.size)
+            offset = self.size
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break       # still being written
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    record = {}
+                if record.get("kind") == "prefix":
+                    self.prefixes[record["hash"]] = offset
+                elif record:
+                    self.offsets.append(offset)
+                    self.times.append(record.get("time", ""))
+                offset += len(line)
+            self.size = offset
+
+    def read(self, number):
+        """Turn number (0 = oldest) as a dict"""
+        with self._open() as f:
+            f.seek(self.offsets[number])
+            record = json.loads(f.readline())
+        record["id"] = number
+        return record
+
+    def prefix(self, key):
+        """Text of the prefix stored under key, or None"""
+        if key not in self.prefix_texts and key in self.prefixes:
+            with self._open() as f:
+                f.seek(self.prefixes[key])
+                self.prefix_texts[key] = json.loads(f.readline())["text"]
+        return self.prefix_texts.get(key)
+
+    def query(self, page=1, per_page=20, text=None, since=None, until=None):
+        """
+        (turns, has_more), newest first. since/until are ISO times or
+        their start ("2026-10-18", "2026-10-18T19:30"), both inclusive;
+        text is matched case-insensitively against the raw line.
+        """
+        with self.lock:
+            low = bisect.bisect_left(self.times, since) if since else 0
+            high = bisect.bisect_right(self.times, until + "\uffff") if until else len(self.times)
+            offsets = self.offsets[low:high]
+        skip = (page - 1) * per_page
+        if not text:
+            numbers = range(low + len(offsets) - 1 - skip, low - 1, -1)
+            return [self.read(number) for number in numbers[:per_page]], len(numbers) > per_page
+
+        text = text.lower()
+        matches = []
+        with self._open() as f:
+            for number in range(low + len(offsets) - 1, low - 1, -1):
+                f.seek(self.offsets[number])
+                if text in f.readline().decode("utf-8", errors="replace").lower():
+                    matches.append(number)
+                    if len(matches) > skip + per_page:
+                        break
+        return [self.read(number) for number in matches[skip:skip + per_page]], len(matches) > skip + per_page
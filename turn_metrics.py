@@ -0,0 +1,226 @@
+import time
+import bisect
+import threading
+from collections import deque
+from contextlib import contextmanager
+
+from settings import *
+
+# Stages of a turn, in the order they happen. Spans are how long a stage
+# took, marks (*) are the time since the turn started.
+STAGES = {
+    "route": "intent routing",
+    "cache": "response cache lookup",
+    "prompt": "prompt assembly",
+    "http": "request sent until Ollama's first chunk",
+    "race": "light and main model racing, until the first acceptable reply",
+    "first_token": "* first token shown",
+    "last_token": "* last token shown",
+    "clean": "cleaning and repeat filtering of the reply",
+    "ollama_load": "Ollama loading the model",
+    "ollama_prompt_eval": "Ollama evaluating the prompt",
+    "ollama_eval": "Ollama generating the reply",
+    "tts_synth": "TTS synthesis, all sentences",
+    "playback_start": "* first sentence starts playing",
+    "playback": "audio playing, all sentences",
+    "turn": "* whole turn, playback included",
+    "tts_rtf": "synthesis time / audio length, per sentence (above 1 speech can't keep up)",
+}
+
+# Prometheus histogram buckets, seconds
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+# Values that are ratios, not seconds, and their buckets
+RATIOS = {"tts_rtf"}
+RATIO_BUCKETS = (0.05, 0.1, 0.2, 0.3, 0.5, 0.75, 1, 1.5, 2, 5)
+
+
+class Histogram:
+    """
+    Percentiles over the last window values, plus cumulative bucket
+    counts since start for Prometheus.
+    """
+
+    def __init__(self, window=METRICS_WINDOW, buckets=BUCKETS):
+        self.recent = deque(maxlen=window)
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)     # last one is +Inf
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.recent.append(value)
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def summary(self):
+        values = sorted(self.recent)
+        pick = lambda fraction: values[min(len(values) - 1, int(fraction * len(values)))]
+        return {"count": self.count, "p50": pick(0.5), "p90": pick(0.9), "p99": pick(0.99), "max": values[-1]}
+
+
+class Metrics:
+    """
+    Timing histograms per stage, plus gauges: functions returning a dict
+    of numbers (cache hit counters, ...) read whenever metrics are shown.
+    """
+
+    def __init__(self, window=METRICS_WINDOW):
+        self.window = window
+        self.histograms = {}
+        self.gauges = {}
+        self.lock = threading.Lock()
+
+    def observe(self, stage, seconds):
+        with self.lock:
+            if stage not in self.histograms:
+                self.histograms[stage] = Histogram(self.window, RATIO_BUCKETS if stage in RATIOS else BUCKETS)
+            self.histograms[stage].observe(seconds)
+
+    def add_gauge(self, name, read):
+        self.gauges[name] = read
+
+    def summary(self):
+        """stage -> {count, p50, p90, p99, max}, in turn order"""
+        with self.lock:
+            order = list(STAGES) + sorted(set(self.histograms) - set(STAGES))
+            return {stage: self.histograms[stage].summary() for stage in order if stage in self.histograms}
+
+    def read_gauges(self):
+        values = {}
+        for name, read in self.gauges.items():
+            try:
+                values[name] = {key: value for key, value in read().items() if isinstance(value, (int, float))}
+            except Exception as e:
+                print(f"{COLOR_RED}Could not read {name} metrics:\n{COLOR_RESET}{str(e)}")
+        return values
+
+    def prometheus(self):
+        """Everything in Prometheus' text format"""
+        lines = ["# HELP luna_stage_seconds Time spent in each stage of a turn",
+                 "# TYPE luna_stage_seconds histogram"]
+        with self.lock:
+            # Ratios come last, each a metric of its own (luna_tts_rtf, ...)
+            for stage, histogram in sorted(self.histograms.items(), key=lambda item: item[0] in RATIOS):
+                name, labels = (f"luna_{stage}", "") if stage in RATIOS else ("luna_stage_seconds", f'stage="{stage}"')
+                if stage in RATIOS:
+                    lines.append(f"# TYPE {name} histogram")
+                total = 0
+                for bound, count in zip([*histogram.buckets, "+Inf"], histogram.counts):
+                    total += count
+                    lines.append(f'{name}_bucket{{{labels + "," if labels else ""}le="{bound}"}} {total}')
+                braced = f"{{{labels}}}" if labels else ""
+                lines.append(f"{name}_sum{braced} {histogram.sum:.6f}")
+                lines.append(f"{name}_count{braced} {histogram.count}")
+        for name, values in self.read_gauges().items():
+            for key, value in values.items():
+                lines.append(f"# TYPE luna_{name}_{key} gauge")
+                lines.append(f"luna_{name}_{key} {value}")
+        return "\n".join(lines) + "\n"
+
+
+METRICS = Metrics()
+
+
+class TurnTimer:
+    """
+    Stage timings of one turn. span(name) times a block, mark(name) notes
+    the time since the turn started (first time only), add(name, seconds)
+    takes a time measured elsewhere (Ollama's own durations). Spans of the
+    same name add up (one tts_synth per sentence). finish() puts them all
+    into the histograms. Safe to use from the TTS threads.
+    """
+
+    def __init__(self, metrics=METRICS):
+        self.metrics = metrics
+        self.start = time.perf_counter()
+        self.spans = {}
+        self.finished = False
+        self.lock = threading.Lock()
+
+    @contextmanager
+    def span(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start)
+
+    def mark(self, name):
+        with self.lock:
+            self.spans.setdefault(name, time.perf_counter() - self.start)
+
+    def add(self, name, seconds):
+        with self.lock:
+            self.spans[name] = self.spans.get(name, 0.0) + seconds
+
+    def iterate(self, iterable, name):
+        """Pass iterable through, adding the time spent waiting on each item to name"""
+        iterator = iter(iterable)
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                self.add(name, time.perf_counter() - start)
+                return
+            self.add(name, time.perf_counter() - start)
+            yield item
+
+    def finish(self):
+        """Close the turn and record it; the spans, or None if it was already finished"""
+        with self.lock:
+            if self.finished:
+                return None
+            self.finished = True
+            self.spans["turn"] = time.perf_counter() - self.start
+            spans = dict(self.spans)
+        for name, seconds in spans.items():
+            if not name.startswith("_"):    # _helpers only used to work out other spans
+                self.metrics.observe(name, seconds)
+        return spans
+
+
+def format_metrics(metrics=METRICS):
+    """The 'stats' table: percentiles of every stage over the recent turns, then the gauges"""
+    summary = metrics.summary()
+    if not summary:
+        return "No turns timed yet."
+    lines = [f"{'stage':<20}{'count':>7}{'p50':>10}{'p90':>10}{'p99':>10}{'max':>10}"]
+    for stage, values in summary.items():
+        if stage in RATIOS:
+            cells = "".join(f"{values[key]:>9.2f}x" for key in ("p50", "p90", "p99", "max"))
+        else:
+            cells = "".join(f"{values[key] * 1000:>8.1f}ms" for key in ("p50", "p90", "p99", "max"))
+        lines.append(f"{stage:<20}{values['count']:>7}{cells}")
+    for name, values in metrics.read_gauges().items():
+        lines.append(f"{name}: " + ", ".join(f"{key} {value:.2f}" if isinstance(value, float) else f"{key} {value}"
+                                             for key, value in values.items()))
+    return "\n".join(lines)
+
+
+def start_metrics_server(port=METRICS_PORT, host="127.0.0.1", metrics=METRICS):
+    """Serve /metrics for Prometheus from a background thread. Returns the server."""
+    # Imported here, http.server is slow to import and most runs never serve metrics
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def log_message(self, format, *args):
+            pass
+
+        def do_GET(self):
+            if self.path != "/metrics":
+                self.send_error(404)
+                return
+            payload = metrics.prometheus().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
@@ -0,0 +1,146 @@
+import re
+import queue
+import threading
+from collections import Counter
+
+from settings import *
+from ollama_client import OllamaError
+from turn_metrics import Histogram
+
+LIGHT = "light"
+HEAVY = "heavy"
+
+# Messages that want facts, not banter ("how are you" is banter, "how does" isn't)
+QUESTION = r"\b(?:what|who|which|when|where|why|explain|describe|define|tell me about|difference between" \
+           r"|how (?:do|does|did|can|could|to|much|many|long|far|old|is|was))\b"
+
+# The user saying the last reply missed; blamed on the tier that gave it
+COMPLAINT = r"^\s*(?:what\?|huh\??|\?+|that'?s (?:not|wrong)|wrong\b|no,? i (?:meant|asked)|answer the question|you didn'?t answer)"
+
+
+class TierClassifier:
+    """
+    Decides if a turn is light (greetings, short reactions, the snark
+    needs no big model) or heavy (questions, anything the knowledge file
+    knows about, long messages, the user complaining). Cheap on purpose:
+    a couple of regexes and a lookup in the knowledge index.
+    """
+
+    def __init__(self, max_words=LIGHT_MAX_WORDS, knowledge_terms=LIGHT_KNOWLEDGE_TERMS, question=QUESTION, complaint=COMPLAINT):
+        self.max_words = max_words
+        self.knowledge_terms = knowledge_terms
+        self.question = re.compile(question, re.IGNORECASE)
+        self.complaint = re.compile(complaint, re.IGNORECASE)
+
+    def is_complaint(self, text):
+        return bool(self.complaint.search(text))
+
+    def classify(self, text, knowledge_index=None):
+        """(LIGHT or HEAVY, why)"""
+        if self.is_complaint(text):
+            return HEAVY, "complaint"
+        if len(text.split()) > self.max_words:
+            return HEAVY, "long"
+        if self.question.search(text):
+            return HEAVY, "question"
+        if knowledge_index is not None and len(knowledge_index.known_terms(text)) >= self.knowledge_terms:
+            return HEAVY, "knowledge"
+        return LIGHT, "banter"
+
+
+def race(contenders, accept):
+    """
+    Run contenders ({name: function(cancelled) -> (reply, final chunk)}) at
+    once. The first reply accept(name, reply) likes wins and the others are
+    told to stop through their cancelled Event. Returns (winner, reply,
+    final, names of the rejected ones). When nothing wins the last error is
+    raised, or without errors the winner is None.
+    """
+    cancelled = threading.Event()
+    results = queue.Queue()
+
+    def run(name, contender):
+        try:
+            results.put((name, *contender(cancelled), None))
+        except OllamaError as e:
+            results.put((name, None, None, e))
+
+    for name, contender in contenders.items():
+        threading.Thread(target=run, args=(name, contender), name=f"race-{name}", daemon=True).start()
+
+    rejected = []
+    error = None
+    for _ in contenders:
+        name, reply, final, failure = results.get()
+        if failure is not None:
+            error = failure
+        elif reply is not None and accept(name, reply):
+            cancelled.set()
+            return name, reply, final, rejected
+        else:
+            rejected.append(name)
+    cancelled.set()
+    if error is not None:
+        raise error
+    return None, None, None, rejected
+
+
+class TierStats:
+    """
+    What the light/heavy routing did, to tune LIGHT_MAX_WORDS and friends
+    from data: turns per tier and reason, time to first token and whole
+    reply per tier, race wins, rejected replies (too long, empty) and
+    complaints right after a tier's reply.
+    """
+
+    def __init__(self, window=METRICS_WINDOW):
+        self.turns = Counter()          # tier -> turns
+        self.reasons = Counter()        # why -> turns
+        self.race_wins = Counter()      # tier whose model won -> races
+        self.rejected = Counter()       # tier -> replies rejected
+        self.complaints = Counter()     # tier -> complaints about its last reply
+        self.first_token = {LIGHT: Histogram(window), HEAVY: Histogram(window)}
+        self.total = {LIGHT: Histogram(window), HEAVY: Histogram(window)}
+        self.lock = threading.Lock()
+
+    def record(self, tier, why, first_token=None, total=None):
+        with self.lock:
+            self.turns[tier] += 1
+            self.reasons[why] += 1
+            if first_token is not None:
+                self.first_token[tier].observe(first_token)
+            if total is not None:
+                self.total[tier].observe(total)
+
+    def record_race(self, winner, rejected):
+        with self.lock:
+            if winner:
+                self.race_wins[winner] += 1
+            for tier in rejected:
+                self.rejected[tier] += 1
+
+    def record_reject(self, tier):
+        with self.lock:
+            self.rejected[tier] += 1
+
+    def record_complaint(self, tier):
+        with self.lock:
+            self.complaints[tier] += 1
+
+    def stats(self):
+        """Flat numbers for gauges: light_turns, light_first_token_p50, heavy_complaints, ..."""
+        stats = {}
+        with self.lock:
+            for tier in (LIGHT, HEAVY):
+                stats[f"{tier}_turns"] = self.turns[tier]
+                stats[f"{tier}_race_wins"] = self.race_wins[tier]
+                stats[f"{tier}_rejected"] = self.rejected[tier]
+                stats[f"{tier}_complaints"] = self.complaints[tier]
+                for name, histograms in (("first_token", self.first_token), ("total", self.total)):
+                    if histograms[tier].count:
+                        summary = histograms[tier].summary()
+                        stats[f"{tier}_{name}_p50"] = round(summary["p50"], 4)
+                        stats[f"{tier}_{name}_p90"] = round(summary["p90"], 4)
+            for why, count in self.reasons.items():
+                stats[f"reason_{why}"] = count
+        return stats
@@ -1,43 +1,326 @@
-from flask import Flask, render_template_string
+from flask import Flask, Response, abort, jsonify, render_template_string, request, url_for
 import os
+import re
+import sys
+import json
+import time
+import hashlib
+import threading
+import functools
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from settings import LOG_FILE, WEB_LOG_FILE, SERVER_LOG_FILE, LOG_VIEWER_PAGE_SIZE, LOG_TAIL_POLL
+from turn_logger import LogIndex, rotated_logs
 
 app = Flask(__name__)
-LOG_FILE = "web_logs.txt"
+
+# Which log to show: ?log=luna (luna_with_tts.py), ?log=server (luna_server.py) or ?log=web (misc/luna_chat.py)
+LOGS = {
+    "luna": LogIndex(os.path.join(ROOT, LOG_FILE)),
+    "server": LogIndex(os.path.join(ROOT, SERVER_LOG_FILE)),
+    "web": LogIndex(os.path.join(ROOT, WEB_LOG_FILE)),
+}
+
+# The plain-text log the viewer used to show, before turns went to JSONL
+LEGACY_LOG = os.path.join(os.path.dirname(os.path.abspath(__file__)), "web_logs.txt")
+
+# Entries start with a "---" line followed by their "[2025-06-27 19:24:57]" line
+LEGACY_SEPARATOR = re.compile(rb"---\s*")
+LEGACY_HEADER = re.compile(rb"\[\d{4}-")
+
+
+class LegacyLog:
+    """
+    Byte offsets of the entries in the old web_logs.txt, so a page is a few
+    seeks instead of reading and splitting the whole file. Nothing writes
+    it anymore: refresh() only scans it again if its mtime or size changed.
+    identity, generation and size mean the same as LogIndex's for the ETag.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.identity = None        # (mtime, size) of the scanned file
+        self.generation = 0
+        self.size = 0
+        self.offsets = []           # where every entry starts, oldest first
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def refresh(self):
+        with self.lock:
+            stat = os.stat(self.path)
+            identity = (stat.st_mtime_ns, stat.st_size)
+            if identity == self.identity:
+                return
+            offsets = [0]
+            offset = 0
+            separator = None        # offset of the "---" line just before, if the last line was one
+            with open(self.path, "rb") as f:
+                for line in f:
+                    # A separator on the very first line starts the first entry, already at 0
+                    if separator and LEGACY_HEADER.match(line):
+                        offsets.append(separator)
+                    separator = offset if LEGACY_SEPARATOR.fullmatch(line) else None
+                    offset += len(line)
+            self.offsets, self.size, self.identity = offsets, offset, identity
+            self.generation += 1
+
+    def read(self, number):
+        """Entry number (0 = oldest) as text, without its "---" line"""
+        end = self.offsets[number + 1] if number + 1 < len(self.offsets) else self.size
+        with open(self.path, "rb") as f:
+            f.seek(self.offsets[number])
+            text = f.read(end - self.offsets[number]).decode("utf-8", errors="replace")
+        first, _, rest = text.partition("\n")
+        return (rest if LEGACY_SEPARATOR.fullmatch(first.encode()) else text).strip()
+
+    def page(self, page, per_page):
+        """(entries, has_more), newest first; blank ones (an empty file start) left out"""
+        numbers = range(len(self.offsets) - 1 - (page - 1) * per_page, -1, -1)
+        entries = [self.read(number) for number in numbers[:per_page]]
+        return [entry for entry in entries if entry], len(numbers) > per_page
+
+
+LEGACY = LegacyLog(LEGACY_LOG)
+
+HTML = """
+<html>
+<head>
+    <title>Luna Logs</title>
+    <style>
+        body { font-family: monospace; background: #1e1e1e; color: #f5f5f5; padding: 20px; }
+        h2 { color: #ff6ec7; }
+        a { color: #7ec7ff; }
+        pre { white-space: pre-wrap; word-wrap: break-word; background: #2d2d2d; padding: 10px; border-radius: 5px; }
+        .meta { color: #aaa; }
+        .new { border-left: 3px solid #ff6ec7; }
+        hr { border: 1px solid #444; }
+        input { background: #2d2d2d; color: #f5f5f5; border: 1px solid #444; padding: 4px; }
+    </style>
+</head>
+<body>
+    <h2>Luna Logs</h2>
+    <form>
+        <input type="hidden" name="log" value="{{ log }}">
+        {% if file %}<input type="hidden" name="file" value="{{ file }}">{% endif %}
+        <input name="q" value="{{ q }}" placeholder="search">
+        from <input name="since" value="{{ since }}" placeholder="2026-10-18T19:30">
+        to <input name="until" value="{{ until }}" placeholder="2026-10-18">
+        <button>Search</button>
+        {% for name in logs %}<a href="{{ url_for('show_logs', log=name) }}">{{ name }}</a> {% endfor %}
+        {% if legacy %}<a href="{{ url_for('show_legacy') }}">web_logs.txt</a>{% endif %}
+    </form>
+    {% if backups %}<p class="meta">older: {% for name in backups %}<a href="{{ url_for('show_logs', log=log, file=name) }}">{{ name }}</a> {% endfor %}</p>{% endif %}
+    <p class="meta">{{ total }} turns logged{% if file %} in {{ file }}{% endif %}{% if live %}, new ones show up live{% endif %}</p>
+    <div id="entries">
+    {% for entry in entries %}
+        <pre><span class="meta">#{{ entry.id }} [{{ entry.time }}] {{ entry.kind }}{% if entry.session %} · {{ entry.session }}{% endif %}{% if entry.model %} · {{ entry.model }}{% endif %}</span>
+{{ entry.response }}
+{% if entry.stats %}<span class="meta">{{ entry.stats | tojson }}</span>
+{% endif %}{% if entry.prompt %}<details><summary>prompt{% if entry.prefix %} (after <a href="{{ url_for('show_prefix', key=entry.prefix, log=log, file=file) }}">prefix {{ entry.prefix }}</a>){% endif %}</summary>{{ entry.prompt }}</details>{% endif %}</pre>
+    {% endfor %}
+    </div>
+    <p>
+        {% if page > 1 %}<a href="{{ url_for('show_logs', page=page - 1, **query) }}">newer</a>{% endif %}
+        page {{ page }}
+        {% if has_more %}<a href="{{ url_for('show_logs', page=page + 1, **query) }}">older</a>{% endif %}
+    </p>
+    {% if live %}
+    <script>
+        const source = new EventSource("{{ url_for('tail', log=log) }}");
+        source.addEventListener("turn", (event) => {
+            const entry = JSON.parse(event.data);
+            const pre = document.createElement("pre");
+            pre.className = "new";
+            pre.textContent = `#${entry.id} [${entry.time}] ${entry.kind}\\n${entry.response}`;
+            document.getElementById("entries").prepend(pre);
+        });
+        source.addEventListener("rotated", () => location.reload());
+    </script>
+    {% endif %}
+</body>
+</html>
+"""
+
+
+LEGACY_HTML = """
+<html>
+<head>
+    <title>Luna Web Logs</title>
+    <style>
+        body { font-family: monospace; background: #1e1e1e; color: #f5f5f5; padding: 20px; }
+        h2 { color: #ff6ec7; }
+        a { color: #7ec7ff; }
+        pre { white-space: pre-wrap; word-wrap: break-word; background: #2d2d2d; padding: 10px; border-radius: 5px; }
+        hr { border: 1px solid #444; }
+    </style>
+</head>
+<body>
+    <h2>Luna Web Logs <a href="{{ url_for('show_logs') }}">(turn logs)</a></h2>
+    {% for entry in entries %}
+        <pre>{{ entry }}</pre><hr>
+    {% endfor %}
+    <p>
+        {% if page > 1 %}<a href="{{ url_for('show_legacy', page=page - 1) }}">newer</a>{% endif %}
+        page {{ page }}
+        {% if has_more %}<a href="{{ url_for('show_legacy', page=page + 1) }}">older</a>{% endif %}
+    </p>
+</body>
+</html>
+"""
+
+
+def backups(name):
+    """File names of the rotated backups of log name, newest first"""
+    return [os.path.basename(path) for path in reversed(rotated_logs(LOGS[name].path))]
+
+
+@functools.lru_cache(maxsize=4)
+def backup_index(path):
+    """Backups never change, so their indexes are kept (a gzipped one holds the whole log in memory)"""
+    return LogIndex(path)
+
+
+def get_log():
+    """The live log ?log= names, or its rotated backup ?file= when given"""
+    name = request.args.get("log", "luna")
+    if name not in LOGS:
+        abort(404)
+    index = LOGS[name]
+    file = request.args.get("file")
+    if file:
+        # Only names from the listing, nothing else in the folder
+        if file not in backups(name):
+            abort(404)
+        index = backup_index(os.path.join(os.path.dirname(index.path), file))
+    index.refresh()
+    return index
+
+
+def read_query():
+    page = request.args.get("page", "1")
+    return {
+        "page": int(page) if page.isdigit() and int(page) > 0 else 1,
+        "text": request.args.get("q", "").strip(),
+        "since": request.args.get("since", "").strip(),
+        "until": request.args.get("until", "").strip(),
+    }
+
+
+def not_modified(index, query):
+    """
+    ETag of what a query returns: the log only ever grows until it's rotated,
+    so (file, generation, bytes indexed, query) pins the answer down.
+    Returns (etag, True if the client already has it).
+    """
+    etag = f"{index.path}-{index.identity}-{index.generation}-{index.size}-{json.dumps(query, sort_keys=True)}"
+    etag = hashlib.sha1(etag.encode("utf-8")).hexdigest()[:16]
+    return etag, request.if_none_match.contains(etag)
+
+
+def cached(response, etag):
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = "no-cache"      # always ask, usually get a 304
+    return response
 
 
 @app.route("/")
 def show_logs():
-    if not os.path.exists(LOG_FILE):
-        return "<h3>No logs found yet.</h3>"
-
-    with open(LOG_FILE, "r", encoding="utf-8") as f:
-        raw_logs = f.read()
-
-    entries = raw_logs.strip().split("---")
-
-    html = """
-    <html>
-    <head>
-        <title>Luna Web Logs</title>
-        <style>
-            body { font-family: monospace; background: #1e1e1e; color: #f5f5f5; padding: 20px; }
-            h2 { color: #ff6ec7; }
-            pre { white-space: pre-wrap; word-wrap: break-word; background: #2d2d2d; padding: 10px; border-radius: 5px; }
-            hr { border: 1px solid #444; }
-        </style>
-    </head>
-    <body>
-        <h2>Luna Web Logs</h2>
-        {% for entry in entries %}
-            <pre>{{ entry }}</pre><hr>
-        {% endfor %}
-    </body>
-    </html>
+    index = get_log()
+    query = read_query()
+    etag, unchanged = not_modified(index, query)
+    if unchanged:
+        return cached(Response(status=304), etag)
+
+    entries, has_more = index.query(query["page"], LOG_VIEWER_PAGE_SIZE, query["text"], query["since"], query["until"])
+    log = request.args.get("log", "luna")
+    file = request.args.get("file") or None
+    html = render_template_string(
+        HTML, entries=entries, has_more=has_more, page=query["page"], total=len(index), log=log, logs=LOGS,
+        file=file, backups=backups(log), legacy=os.path.exists(LEGACY_LOG),
+        q=query["text"], since=query["since"], until=query["until"],
+        query={"log": log, "file": file, "q": query["text"], "since": query["since"], "until": query["until"]},
+        live=file is None and query["page"] == 1 and not (query["text"] or query["since"] or query["until"]),
+    )
+    return cached(Response(html), etag)
+
+
+@app.route("/api/entries")
+def api_entries():
+    """Same as the page, as JSON: ?page=&q=&since=&until=&log=&file="""
+    index = get_log()
+    query = read_query()
+    etag, unchanged = not_modified(index, query)
+    if unchanged:
+        return cached(Response(status=304), etag)
+    entries, has_more = index.query(query["page"], LOG_VIEWER_PAGE_SIZE, query["text"], query["since"], query["until"])
+    return cached(jsonify(entries=entries, has_more=has_more, total=len(index), page=query["page"]), etag)
+
+
+@app.route("/prefix/<key>")
+def show_prefix(key):
+    """The static prompt start (system prompt, knowledge, ...) that turns only refer to by hash"""
+    text = get_log().prefix(key)
+    if text is None:
+        abort(404)
+    # Never changes once written
+    response = Response(text, mimetype="text/plain")
+    response.headers["Cache-Control"] = "max-age=86400, immutable"
+    return response
+
+
+@app.route("/legacy")
+def show_legacy():
+    """The old plain-text web_logs.txt, newest first, a page at a time"""
+    if not os.path.exists(LEGACY_LOG):
+        abort(404)
+    LEGACY.refresh()
+    page = read_query()["page"]
+    etag, unchanged = not_modified(LEGACY, {"page": page})
+    if unchanged:
+        return cached(Response(status=304), etag)
+    entries, has_more = LEGACY.page(page, LOG_VIEWER_PAGE_SIZE)
+    return cached(Response(render_template_string(LEGACY_HTML, entries=entries, page=page, has_more=has_more)), etag)
+
+
+@app.route("/tail")
+def tail():
     """
+    Server-sent events: every new turn as an event "turn" (id = its number),
+    "rotated" when the log started over. Reconnecting browsers send
+    Last-Event-ID and get what they missed.
+    """
+    index = get_log()
+    last = request.headers.get("Last-Event-ID", request.args.get("after", ""))
+
+    def stream():
+        generation = index.generation
+        position = int(last) + 1 if last.isdigit() else len(index)
+        quiet = 0.0
+        while True:
+            index.refresh()
+            if index.generation != generation:
+                generation = index.generation
+                position = 0
+                yield "event: rotated\ndata: {}\n\n"
+            while position < len(index):
+                entry = index.read(position)
+                yield f"id: {position}\nevent: turn\ndata: {json.dumps(entry, ensure_ascii=False, default=str)}\n\n"
+                position += 1
+                quiet = 0.0
+            time.sleep(LOG_TAIL_POLL)
+            quiet += LOG_TAIL_POLL
+            if quiet >= 15:
+                yield ": still here\n\n"      # keeps proxies from closing an idle stream
+                quiet = 0.0
 
-    return render_template_string(html, entries=entries)
+    return Response(stream(), mimetype="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
 
 
 if __name__ == "__main__":
     print("Starting Flask server at http://localhost:5000")
-    app.run(debug=True)
+    app.run(debug=True, threaded=True)